@@ -0,0 +1,43 @@
+import json
+import asyncio
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from services.batch_answering import BatchAnswering
+from models.schemas import BatchQuestionsRequest
+from utils.logger import logger
+from config.settings import settings
+
+router = APIRouter(prefix="/api/qa")
+
+
+@router.post("/batch", tags=["Chat"])
+async def batch_questions(request: BatchQuestionsRequest):
+    """
+    Answer a list of independent questions, for bulk evaluation. Questions are embedded in one
+    batched call, retrieved concurrently and answered with bounded LLM parallelism, with the same
+    retrieval and prompt as the chat (each question as a first turn, without history or answer cache).
+
+    The response is NDJSON streamed as answers complete: one {"type": "answer", "index", ...} line
+    per question, in completion order, then one {"type": "stats", ...} line with the aggregate
+    throughput and latency percentiles.
+    """
+    if len(request.questions) > settings.BATCH_QA_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_QA_MAX_QUESTIONS} questions per batch.")
+    llm_concurrency = min(request.llm_concurrency or settings.BATCH_QA_LLM_CONCURRENCY, settings.BATCH_QA_LLM_CONCURRENCY)
+    try:
+        batch = await asyncio.to_thread(
+            BatchAnswering, namespace=request.namespace, metadata_filter=request.filter, llm_concurrency=llm_concurrency
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error loading vector store: {e}")
+        raise HTTPException(status_code=500, detail="An error occurred while loading the retriever.")
+
+    logger.info(f"Answering a batch of {len(request.questions)} questions (namespace={batch.namespace!r}).")
+
+    async def lines():
+        async for result in batch.astream(request.questions):
+            yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
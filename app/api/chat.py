@@ -1,101 +1,188 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from services.conversation_answering import ConversationAnswering
-from services.preprocessing import Preprocessing
-from models.schemas import ChatRequest, ChatResponse
-from utils.logger import logger
+from services.scheduler import scheduler, SchedulerBusy
+from models.schemas import ChatRequest, ChatResponse, ChatStreamChunk
+from utils.namespaces import resolve_namespace
+from utils.logger import logger, payload
 import uuid
 import json
+import time
 import asyncio
 
 router = APIRouter(prefix="/api/ws")
 
+
+async def _receive_messages(websocket: WebSocket, queue: asyncio.Queue, disconnected: asyncio.Event, session_id: str):
+    """
+    Read client messages into `queue` until the socket closes, so a disconnect
+    is noticed even while an answer is being generated.
+    """
+    try:
+        while True:
+            await queue.put(await websocket.receive_text())
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket disconnected while receiving. session_id={session_id}")
+    except Exception as e:
+        logger.error(f"Error receiving message: {e}", exc_info=True)
+    finally:
+        disconnected.set()
+        await queue.put(None)
+
+
+async def _send_answer(websocket: WebSocket, conversation: ConversationAnswering, request: ChatRequest, session_id: str):
+    """
+    Generate the answer for one request once the scheduler admits it, and send it,
+    streamed or in a single frame. A request rejected by admission control gets an error frame.
+    """
+    try:
+        async with scheduler.admit(session_id):
+            await _generate_answer(websocket, conversation, request, session_id)
+    except SchedulerBusy as e:
+        logger.warning(f"Rejected question: {e} session_id={session_id}")
+        await websocket.send_json({"error": str(e), "retry": True})
+
+
+async def _generate_answer(websocket: WebSocket, conversation: ConversationAnswering, request: ChatRequest, session_id: str):
+    if not request.stream:
+        loop = asyncio.get_running_loop()
+        answer = await loop.run_in_executor(
+            scheduler.executor, conversation.conversation_answer, request.message, not request.bypass_cache
+        )
+        logger.info(f"Generated answer")
+        response = ChatResponse(
+            reply=answer.get("answer", "No answer generated."),
+            session_id=session_id,
+            sources=answer.get("sources", []),
+            cached=answer.get("cached", False)
+        )
+        await websocket.send_json(response.model_dump())
+        logger.info("Sent response to client.")
+        return
+
+    async for event in conversation.astream_answer(request.message, use_cache=not request.bypass_cache):
+        if event["event"] == "token":
+            chunk = ChatStreamChunk(token=event["token"], session_id=session_id)
+            await websocket.send_json(chunk.model_dump())
+        else:
+            response = ChatResponse(
+                reply=event["answer"] or "No answer generated.",
+                session_id=session_id,
+                sources=event["sources"],
+                cached=event["cached"]
+            )
+            await websocket.send_json(response.model_dump())
+            logger.info("Sent streamed response to client.")
+
+
+def _resolve_session_id(requested: str) -> str:
+    """Resume the requested session if it is a valid id, else start a new one."""
+    if requested:
+        try:
+            return str(uuid.UUID(requested))
+        except ValueError:
+            logger.warning(f"Ignoring invalid session_id={requested!r}, starting a new session.")
+    return str(uuid.uuid4())
+
+
+def _resolve_scope(namespace: str, metadata_filter: str):
+    """
+    Namespace and metadata filter requested in the handshake.
+    Raises:
+        ValueError: If the namespace name is invalid or the filter is not a JSON object.
+    """
+    namespace = resolve_namespace(namespace)
+    if not metadata_filter:
+        return namespace, None
+    try:
+        parsed = json.loads(metadata_filter)
+    except json.JSONDecodeError:
+        parsed = None
+    if not isinstance(parsed, dict):
+        raise ValueError("filter must be a JSON object of metadata conditions.")
+    return namespace, parsed
+
+
 @router.websocket("/chat")
 async def chat(websocket: WebSocket):
     """
     WebSocket endpoint for real-time chat interactions.
+    Connect with ?session_id=<id> to resume an existing conversation, ?namespace=<name> to
+    chat with the documents of a namespace, and ?filter=<JSON object> to only retrieve
+    chunks with matching metadata (e.g. {"source": "..."}).
     """
+    connect_start = time.perf_counter()
     await websocket.accept()
-    
-    session_id = str(uuid.uuid4())
-    logger.info(f"WebSocket connection accepted. session_id={session_id}")
 
-    # Load vector store
+    session_id = _resolve_session_id(websocket.query_params.get("session_id"))
     try:
-        preprocessor = Preprocessing(file_path=None)
-        vector_store = preprocessor.load_embeddings_pinecone()
-        index = preprocessor.pc.Index(preprocessor.index_name)
-        stats = index.describe_index_stats()
-        vector_count = stats["total_vector_count"]
-        logger.info(f"{vector_count} vectors in the store.") 
-        logger.info("Vector store loaded for chat.")
+        namespace, metadata_filter = _resolve_scope(
+            websocket.query_params.get("namespace"), websocket.query_params.get("filter")
+        )
+    except ValueError as e:
+        logger.warning(f"Rejected WebSocket connection: {e} session_id={session_id}")
+        await websocket.send_json({"error": str(e)})
+        await websocket.close(code=1008)
+        return
+    logger.info(f"WebSocket connection accepted. session_id={session_id} namespace={namespace!r}")
+
+    # Answer using RAG, with the shared retriever and LLM
+    try:
+        conversation = await asyncio.to_thread(
+            ConversationAnswering, session_id=session_id, namespace=namespace, metadata_filter=metadata_filter
+        )
     except Exception as e:
         logger.error(f"Error loading vector store: {e}")
         await websocket.close()
         return
-     
-    # Answer using RAG
-    conversation = ConversationAnswering(
-        vector_store=vector_store,
-        session_id=session_id
-    )
-    logger.info("ConversationAnswering instance created.")
+    logger.info(f"ConversationAnswering instance created. connect latency={(time.perf_counter() - connect_start) * 1000:.0f} ms")
+
+    messages = asyncio.Queue()
+    disconnected = asyncio.Event()
+    receiver = asyncio.create_task(_receive_messages(websocket, messages, disconnected, session_id))
     try:
         while True:
+            data = await messages.get()
+            if data is None:
+                break
+
             try:
-                try:
-                    try:
-                    # Receive message (assuming client sends JSON)
-                        data = await websocket.receive_text()
-                    except WebSocketDisconnect:
-                        logger.info(f"WebSocket disconnected while receiving. session_id={session_id}")
-                        break
-                    
-                    data_json = json.loads(data)
-
-                    request = ChatRequest(**data_json)
-                    logger.info(f"Received question: {request.message}")
-                except Exception as e:
-                    logger.error(f"Error parsing message: {e}", exc_info=True)
-                    await websocket.send_json({"error": "Invalid message format."})
-                    continue
+                # Parse message (assuming client sends JSON)
+                request = ChatRequest(**json.loads(data))
+                logger.info(f"Received question: {payload(request.message)}")
+            except Exception as e:
+                logger.error(f"Error parsing message: {e}", exc_info=True)
+                await websocket.send_json({"error": "Invalid message format."})
+                continue
 
-                try:
-                    answer = await asyncio.to_thread(conversation.conversation_answer, request.message)
-                    logger.info(f"Generated answer")
-                except Exception as e:
-                    logger.error(f"Error while generating answer in worker thread: {e}", exc_info=True)
-                    try:
-                        await websocket.send_json({"error": "Error generating answer."})
-                    except Exception:
-                        pass
-                    continue
-                try:
-                    response = ChatResponse(
-                        reply=answer.get("answer", "No answer generated."),
-                        session_id=session_id
-                    )
-                    try:
-                        await websocket.send_json(response.model_dump())
-                        logger.info("Sent response to client.")
-                    except Exception:
-                        pass
-                except Exception as e:
-                    logger.error(f"Error sending response: {e}", exc_info=True)
-                    await websocket.send_json({"error": "Error sending response."})
+            # Run the answer next to a disconnect watcher, so a client that goes away
+            # cancels generation instead of paying for tokens nobody reads
+            answer_task = asyncio.create_task(_send_answer(websocket, conversation, request, session_id))
+            disconnect_task = asyncio.create_task(disconnected.wait())
+            await asyncio.wait({answer_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+            disconnect_task.cancel()
 
-            except Exception as e:
-                logger.error(f"Error during chat: {e}")
-                await websocket.send_json({"error": "An error occurred during chat."})
+            if not answer_task.done():
+                answer_task.cancel()
+                logger.info(f"Client disconnected, cancelled answer generation. session_id={session_id}")
                 break
-    except WebSocketDisconnect:
-        logger.info(f"WebSocket disconnected. session_id={session_id}")
+
+            if answer_task.exception() is not None:
+                e = answer_task.exception()
+                logger.error(f"Error while generating answer: {e}", exc_info=e)
+                if disconnected.is_set():
+                    break
+                try:
+                    await websocket.send_json({"error": "Error generating answer."})
+                except Exception:
+                    break
     except Exception as e:
         logger.error(f"Unexpected error: {e}", exc_info=True)
-        
+
     finally:
-        ConversationAnswering.sessions.pop(session_id, None)
+        receiver.cancel()
+        # the session memory stays cached (LRU/TTL bounded) so the client can resume it
         logger.info(f"Disconnected session. session_id={session_id}")
         try:
             await websocket.close()
         except Exception as e:
-            pass
\ No newline at end of file
+            pass
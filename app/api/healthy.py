@@ -1,15 +1,33 @@
 from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
 from config.settings import settings
+from services.resources import registry
+from services.answer_cache import answer_cache
+from services.scheduler import scheduler
 
 router = APIRouter()
 
 @router.get("/health", status_code = status.HTTP_200_OK, tags=["Health Check"])
 async def health_check():
     """
-    Health check endpoint to verify if the application is running.
+    Liveness: the process is up and serving. Models may still be loading, see /ready.
     """
     return{
         "status":"Healthy",
         "app_name":settings.APP_NAME,
-        "version":settings.VERSION
-    }
\ No newline at end of file
+        "version":settings.VERSION,
+        "answer_cache":answer_cache.stats(),
+        "scheduler":scheduler.stats()
+    }
+
+@router.get("/ready", tags=["Health Check"])
+async def readiness_check():
+    """
+    Readiness: 200 once the embedding model, vector store and LLM client are loaded, 503 before
+    (or while one of them failed to load), with the state of each and the warm-up time per component.
+    """
+    readiness = registry.readiness()
+    return JSONResponse(
+        readiness,
+        status_code=status.HTTP_200_OK if readiness["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, status
+from fastapi.responses import PlainTextResponse
+from services.answer_cache import answer_cache
+from services.ingestion_jobs import job_manager
+from services.scheduler import scheduler
+from utils import history_manager
+from utils.metrics import metrics
+
+router = APIRouter()
+
+_JOB_STATES = ("queued", "running", "succeeded", "failed", "cancelled")
+
+_chat_active = metrics.gauge("chat_active_turns", "Chat turns being answered.")
+_chat_queued = metrics.gauge("chat_queued_turns", "Chat turns waiting for admission, globally or behind their session.", ("queue",))
+_cache_entries = metrics.gauge("answer_cache_entries", "Entries in the semantic answer cache.")
+_jobs = metrics.gauge("ingest_jobs", "Tracked ingestion jobs by state.", ("state",))
+_history_pending = metrics.gauge("history_pending_writes", "History turns queued and not yet written to disk.")
+
+
+def _update_gauges():
+    """Set the gauges from the current state of the scheduler, caches and queues."""
+    stats = scheduler.stats()
+    _chat_active.set(stats["active"])
+    _chat_queued.set(stats["queued"], queue="global")
+    _chat_queued.set(stats["session_queued"], queue="session")
+    _cache_entries.set(answer_cache.stats()["entries"])
+    states = dict.fromkeys(_JOB_STATES, 0)
+    for job in job_manager.list():
+        states[job.state] += 1
+    for state, count in states.items():
+        _jobs.set(count, state=state)
+    _history_pending.set(history_manager.pending_writes())
+
+
+@router.get("/metrics", status_code=status.HTTP_200_OK, response_class=PlainTextResponse, tags=["Health Check"])
+async def get_metrics():
+    """
+    Stage latency histograms and counters in the Prometheus text format.
+    """
+    _update_gauges()
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,39 @@
+import asyncio
+from fastapi import APIRouter, HTTPException
+from services import namespaces
+from models.schemas import NamespaceInfo
+from utils.namespaces import resolve_namespace
+from utils.logger import logger
+
+router = APIRouter()
+
+
+@router.get("/namespaces", response_model=list[NamespaceInfo], tags=["Namespaces"])
+async def list_namespaces():
+    """
+    List the namespaces holding vectors. A namespace is created by the first file ingested into it.
+    """
+    try:
+        counts = await asyncio.to_thread(namespaces.list_namespaces)
+    except Exception as e:
+        logger.error(f"Error listing namespaces: {e}")
+        raise HTTPException(status_code=500, detail="An error occurred while listing namespaces.")
+    return [{"namespace": name, "vector_count": count} for name, count in sorted(counts.items())]
+
+
+@router.delete("/namespaces/{namespace}", response_model=NamespaceInfo, tags=["Namespaces"])
+async def delete_namespace(namespace: str):
+    """
+    Delete a namespace with its vectors, lexical index and cached answers, without touching the others.
+    Returns the number of vectors deleted.
+    """
+    try:
+        namespace = resolve_namespace(namespace)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        deleted = await asyncio.to_thread(namespaces.delete_namespace, namespace)
+    except Exception as e:
+        logger.error(f"Error deleting namespace {namespace!r}: {e}")
+        raise HTTPException(status_code=500, detail="An error occurred while deleting the namespace.")
+    return {"namespace": namespace, "vector_count": deleted}
@@ -1,28 +1,128 @@
-from fastapi import APIRouter, status , HTTPException
-from services.preprocessing import Preprocessing
+import os
+from fastapi import APIRouter, status , HTTPException, Request
+from services.ingestion_jobs import job_manager, JobQueueFull
+from services.uploads import MultipartSpooler, InvalidUpload, UploadTooLarge
+from models.schemas import IngestionJobStatus, IngestionBatchStatus
+from utils.namespaces import resolve_namespace
 from utils.logger import logger
+from config.settings import settings
 
 router = APIRouter()
 
-@router.post("/preprocess", status_code = status.HTTP_200_OK, tags=["Preprocess"])
-async def preprocess(file_url: str):
+@router.post("/preprocess", status_code = status.HTTP_202_ACCEPTED, response_model=IngestionJobStatus, tags=["Preprocess"])
+async def preprocess(file_url: str, namespace: str = None):
     """
-    preprocess endpoint to preprocess the file from the given URL, embed + Pinecone
+    preprocess endpoint to queue the file from the given URL for ingestion (embed + vector store).
+    The file is indexed into `namespace` (settings.DEFAULT_NAMESPACE if omitted).
+    Returns immediately with a job id; poll /preprocess/jobs/{job_id} for progress.
     """
     
     try:
-        logger.info(f"Starting preprocessing for file: {file_url}")
-        preprocessor = Preprocessing(file_path=file_url)
-        vector_store = preprocessor.preprocess()
-        logger.info(f"Preprocessing completed for file: {file_url}")
-        index = preprocessor.pc.Index(preprocessor.index_name)
-        stats = index.describe_index_stats()
-        vector_count = stats["total_vector_count"]
-        return {
-            "status":"Success",
-            "index_name": preprocessor.index_name,
-            "message":f"File preprocessed and embeddings stored in Pinecone,{vector_count} vectors created."
-        }
+        namespace = resolve_namespace(namespace)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        logger.info(f"Starting preprocessing for file: {file_url} (namespace={namespace!r})")
+        job = job_manager.submit(file_url, namespace=namespace)
+        return job.as_dict()
+    except JobQueueFull as e:
+        logger.warning(f"Rejected preprocessing for file {file_url}: {e}")
+        raise HTTPException(status_code=429, detail="Too many ingestion jobs queued, try again later.")
     except Exception as e:
         logger.error(f"Error during preprocessing: {e}")
-        raise HTTPException(status_code=500, detail="An error occurred during preprocessing.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="An error occurred during preprocessing.")
+
+
+@router.post("/preprocess/upload", status_code = status.HTTP_202_ACCEPTED, response_model=IngestionBatchStatus, tags=["Preprocess"])
+async def upload(request: Request, namespace: str = None):
+    """
+    Upload one or more files as multipart/form-data (any field name) and queue each for ingestion
+    into `namespace` (settings.DEFAULT_NAMESPACE if omitted).
+    Files are streamed to disk as they arrive and each is queued as soon as it is complete, so
+    ingestion of the first files overlaps the upload of the rest.
+    Returns the batch once the whole body is received; poll /preprocess/batches/{batch_id} for progress.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.UPLOAD_MAX_REQUEST_BYTES:
+        raise HTTPException(status_code=413, detail=f"Request body exceeds the {settings.UPLOAD_MAX_REQUEST_BYTES} byte limit.")
+
+    try:
+        namespace = resolve_namespace(namespace)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    batch = job_manager.create_batch()
+    try:
+        # each namespace keeps its own copy of a file name
+        upload_dir = os.path.join(settings.UPLOAD_DIR, namespace) if namespace else settings.UPLOAD_DIR
+        spooler = MultipartSpooler(request.headers.get("content-type"), upload_dir=upload_dir)
+        async for spooled in spooler.receive(request.stream()):
+            logger.info(f"Received {spooled.filename} ({spooled.bytes} bytes) in upload batch {batch.batch_id}.")
+            job_manager.submit(spooled.path, batch=batch, upload=spooled.as_dict(), namespace=namespace,
+                               source=spooled.source)
+            batch.bytes_received = spooler.bytes_received
+        batch.bytes_received = spooler.bytes_received
+        job_manager.close_batch(batch)
+        return batch.as_dict()
+    except (InvalidUpload, UploadTooLarge, JobQueueFull) as e:
+        _abort_batch(batch)
+        logger.warning(f"Rejected upload batch {batch.batch_id}: {e}")
+        if isinstance(e, JobQueueFull):
+            raise HTTPException(status_code=429, detail="Too many ingestion jobs queued, try again later.")
+        raise HTTPException(status_code=413 if isinstance(e, UploadTooLarge) else 400, detail=str(e))
+    except Exception as e:
+        _abort_batch(batch)
+        logger.error(f"Error receiving upload batch {batch.batch_id}: {e}")
+        raise HTTPException(status_code=500, detail="An error occurred while receiving the upload.")
+
+
+def _abort_batch(batch):
+    """Cancel the jobs already queued for a rejected upload."""
+    job_manager.close_batch(batch)
+    for job in batch.jobs:
+        job_manager.cancel(job.job_id)
+
+
+@router.get("/preprocess/batches/{batch_id}", response_model=IngestionBatchStatus, tags=["Preprocess"])
+async def batch_status(batch_id: str):
+    """
+    Report per-file and aggregate upload and ingestion throughput of an upload batch,
+    whichever worker received it.
+    """
+    batch = job_manager.batch_status(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found.")
+    return batch
+
+
+@router.get("/preprocess/jobs", response_model=list[IngestionJobStatus], tags=["Preprocess"])
+async def list_jobs():
+    """
+    List the ingestion jobs known to this worker, oldest first.
+    """
+    return [job.as_dict() for job in job_manager.list()]
+
+
+@router.get("/preprocess/jobs/{job_id}", response_model=IngestionJobStatus, tags=["Preprocess"])
+async def job_status(job_id: str):
+    """
+    Report the state, progress and throughput of an ingestion job, whichever worker runs it.
+    """
+    job = job_manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
+@router.delete("/preprocess/jobs/{job_id}", response_model=IngestionJobStatus, tags=["Preprocess"])
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued or running ingestion job. A job of another worker stops once that worker
+    sees the request.
+    """
+    job = job_manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job already {job['state']}.")
+    return job_manager.status(job_id)
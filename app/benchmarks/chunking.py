@@ -0,0 +1,48 @@
+"""
+Throughput benchmark of the token-aware chunker against the previous character splitter.
+
+The corpus is the parsed pages of the given files, repeated --repeat times. For each chunker
+the benchmark prints chunks, MB of text per second and the largest chunk in embedding tokens
+(chunks above the model window are silently truncated when embedded).
+
+Usage (from the app directory):
+    python -m benchmarks.chunking assets/attention_is_all_you_need.pdf --repeat 20
+"""
+import time
+import argparse
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from services import document_loaders
+from services.chunking import TokenChunker
+from services.resources import registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", default=["assets/attention_is_all_you_need.pdf"], help="Corpus documents.")
+    parser.add_argument("--repeat", type=int, default=20, help="Times the corpus is repeated.")
+    args = parser.parse_args()
+
+    pages = [page for file_path in args.files for page in document_loaders.iter_pages(file_path)] * args.repeat
+    megabytes = sum(len(page.page_content.encode("utf-8")) for page in pages) / 1e6
+    tokenizer = registry.tokenizer
+    counter = TokenChunker(tokenizer)
+    chunkers = [
+        ("RecursiveCharacterTextSplitter(512, 50)", RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=50)),
+        (f"TokenChunker({TokenChunker(tokenizer).max_tokens} tokens)", TokenChunker(tokenizer)),
+    ]
+
+    print(f"corpus: {len(pages)} pages, {megabytes:.1f} MB")
+    print(f"{'chunker':<42} {'chunks':>8} {'seconds':>8} {'MB/sec':>8} {'chunks/sec':>11} {'max tokens':>11}")
+    for name, chunker in chunkers:
+        start = time.perf_counter()
+        chunks = chunker.split_documents(pages)
+        seconds = time.perf_counter() - start
+        sample = [chunk.page_content for chunk in chunks[:2000]]
+        max_tokens = max((len(starts) for starts, _ in counter.token_spans(sample)), default=0)
+        print(f"{name:<42} {len(chunks):>8} {seconds:>8.3f} {megabytes / seconds:>8.2f} "
+              f"{len(chunks) / seconds:>11.0f} {max_tokens:>11}")
+    document_loaders.shutdown()
+
+
+if __name__ == "__main__":
+    main()
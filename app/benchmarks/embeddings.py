@@ -0,0 +1,106 @@
+"""
+Throughput and retrieval drift of the CPU embedding backends (EMBEDDING_BACKEND).
+
+The corpus is the chunks of the given files; the queries are the opening words of
+--queries chunks picked at random. For each backend the benchmark prints:
+  - load seconds (including the one-time ONNX export and quantization)
+  - documents/sec for embed_documents over the whole corpus
+  - queries/sec and p50/p95 latency for --clients threads embedding queries concurrently,
+    one model call per query, then through MicroBatchedEmbeddings
+  - drift against the first backend: mean cosine similarity of the vectors of the same
+    chunks, and recall@k of its top-k chunks for every query
+
+Usage (from the app directory):
+    python -m benchmarks.embeddings assets/attention_is_all_you_need.pdf --backends torch onnx onnx-int8
+"""
+import time
+import random
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from langchain_huggingface import HuggingFaceEmbeddings
+from services import document_loaders
+from services.chunking import TokenChunker
+from services.embeddings import MicroBatchedEmbeddings
+from services.resources import registry
+from config.settings import settings
+
+
+def _load(backend: str):
+    settings.EMBEDDING_BACKEND = backend
+    start = time.perf_counter()
+    model = registry._embedding_model()
+    seconds = time.perf_counter() - start
+    if backend != "torch" and isinstance(model, HuggingFaceEmbeddings):
+        return None, seconds  # the backend's dependencies are missing, it fell back to torch
+    return model, seconds
+
+
+def _query_load(model, queries: list, clients: int):
+    """Embed every query from `clients` threads; return (queries/sec, p50 ms, p95 ms)."""
+    def run(query):
+        start = time.perf_counter()
+        model.embed_query(query)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = sorted(pool.map(run, queries))
+    seconds = time.perf_counter() - start
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    return len(queries) / seconds, p50, p95
+
+
+def _top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", default=["assets/attention_is_all_you_need.pdf"], help="Corpus documents.")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"],
+                        help="Backends to compare; drift is measured against the first.")
+    parser.add_argument("--queries", type=int, default=256, help="Queries embedded per backend.")
+    parser.add_argument("--clients", type=int, default=16, help="Threads embedding queries concurrently.")
+    parser.add_argument("--k", type=int, default=10, help="Depth of the recall@k comparison.")
+    args = parser.parse_args()
+
+    pages = [page for file_path in args.files for page in document_loaders.iter_pages(file_path)]
+    chunks = [chunk.page_content for chunk in TokenChunker(registry.tokenizer).split_documents(pages)]
+    rng = random.Random(0)
+    queries = [" ".join(rng.choice(chunks).split()[:12]) for _ in range(args.queries)]
+    print(f"corpus: {len(chunks)} chunks, {len(queries)} queries, {args.clients} clients")
+    print(f"{'backend':<10} {'load s':>7} {'docs/sec':>9} {'q/sec':>7} {'p50 ms':>7} {'p95 ms':>7} "
+          f"{'batched q/sec':>14} {'p50 ms':>7} {'p95 ms':>7} {'cosine':>7} {f'recall@{args.k}':>10}")
+
+    reference = None
+    for backend in args.backends:
+        model, load_seconds = _load(backend)
+        if model is None:
+            print(f"{backend:<10} unavailable (needs onnxruntime and transformers)")
+            continue
+        start = time.perf_counter()
+        vectors = np.asarray(model.embed_documents(chunks), dtype=np.float32)
+        docs_per_second = len(chunks) / (time.perf_counter() - start)
+        single = _query_load(model, queries, args.clients)
+        batched = _query_load(
+            MicroBatchedEmbeddings(model, max_batch=settings.QUERY_BATCH_MAX, max_wait=settings.QUERY_BATCH_WAIT_MS / 1000),
+            queries, args.clients
+        )
+        query_vectors = np.asarray(model.embed_documents(queries), dtype=np.float32)
+
+        if reference is None:
+            reference = vectors, _top_k(vectors, query_vectors, args.k)
+            cosine, recall = 1.0, 1.0
+        else:
+            reference_vectors, reference_top = reference
+            cosine = float(np.mean(np.sum(vectors * reference_vectors, axis=1)))
+            top = _top_k(vectors, query_vectors, args.k)
+            recall = float(np.mean([len(set(a) & set(b)) / args.k for a, b in zip(top, reference_top)]))
+        print(f"{backend:<10} {load_seconds:>7.1f} {docs_per_second:>9.1f} {single[0]:>7.1f} {single[1]:>7.1f} "
+              f"{single[2]:>7.1f} {batched[0]:>14.1f} {batched[1]:>7.1f} {batched[2]:>7.1f} {cosine:>7.4f} {recall:>10.3f}")
+    document_loaders.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Offline end-to-end benchmark of ingestion and chat under concurrent clients.
+
+Gemini, the embedding model and Pinecone are replaced by the deterministic stand-ins of
+benchmarks.fakes (with simulated latency), and everything else is the real code:
+Preprocessing.preprocess ingests a synthetic corpus, then --clients sessions ask --turns
+questions each, first by calling ConversationAnswering.conversation_answer from threads,
+then over the /api/ws/chat WebSocket (through the app's lifespan, scheduler and streaming).
+Follow-up questions refer back to the conversation, so condensation and memory are exercised,
+and history_manager persists every turn (--history-backend file, sqlite, or redis against an
+in-process stand-in). All files go to a scratch directory.
+
+Reports ingestion throughput, turns per second, per-turn p50/p95/p99 latency and peak RSS.
+--save-baseline writes the results to a JSON file; --baseline compares against one and exits
+with status 1 when a metric is worse than the baseline by more than --tolerance.
+
+Usage (from the app directory):
+    python -m benchmarks.end_to_end --clients 32 --turns 4 --save-baseline baseline.json
+    python -m benchmarks.end_to_end --clients 32 --turns 4 --baseline baseline.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks import fakes
+from config.settings import settings
+
+# compared metrics, and whether a higher value is better
+_COMPARED = {
+    "ingest.mb_per_sec": True,
+    "ingest.chunks_per_sec": True,
+    "direct.turns_per_sec": True,
+    "direct.p50_ms": False,
+    "direct.p95_ms": False,
+    "direct.p99_ms": False,
+    "websocket.turns_per_sec": True,
+    "websocket.p50_ms": False,
+    "websocket.p95_ms": False,
+    "websocket.p99_ms": False,
+    "websocket.first_token_p50_ms": False,
+    "history.flush_ms": False,
+    "peak_rss_mb": False,
+}
+
+_TOPICS = "encoder decoder attention embedding training optimizer retrieval translation".split()
+_FOLLOW_UPS = ("Why is that?", "How does it compare to the {topic}?", "Can you explain it in more detail?")
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+def _percentiles(seconds: list, prefix: str = "") -> dict:
+    ordered = sorted(seconds)
+    if not ordered:
+        return {}
+
+    def at(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1)
+
+    return {f"{prefix}p50_ms": at(0.5), f"{prefix}p95_ms": at(0.95), f"{prefix}p99_ms": at(0.99), f"{prefix}max_ms": at(1.0)}
+
+
+def _questions(seed: int, turns: int) -> list:
+    """A first question about a topic, then follow-ups that depend on it."""
+    rng = random.Random(seed)
+    questions = [f"What does the {rng.choice(_TOPICS)} {rng.choice(_TOPICS)} layer do in the model?"]
+    while len(questions) < turns:
+        questions.append(rng.choice(_FOLLOW_UPS).format(topic=rng.choice(_TOPICS)))
+    return questions
+
+
+def bench_ingestion(workdir: str, docs: int, doc_kb: int) -> dict:
+    from services.preprocessing import Preprocessing
+
+    corpus_dir = os.path.join(workdir, "corpus")
+    os.makedirs(corpus_dir, exist_ok=True)
+    paths = []
+    for i in range(docs):
+        path = os.path.join(corpus_dir, f"document-{i}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(fakes.fake_text(seed=i, words=doc_kb * 1024 // 7))
+        paths.append(path)
+    megabytes = sum(os.path.getsize(path) for path in paths) / 1e6
+
+    chunks = 0
+    start = time.perf_counter()
+    for path in paths:
+        preprocessing = Preprocessing(file_path=path)
+        preprocessing.preprocess()
+        chunks += preprocessing.stats.get("upsert", {}).get("items", 0)
+    seconds = time.perf_counter() - start
+    return {
+        "docs": docs,
+        "mb": round(megabytes, 2),
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "mb_per_sec": round(megabytes / seconds, 3),
+        "chunks_per_sec": round(chunks / seconds, 1),
+    }
+
+
+def bench_direct(clients: int, turns: int, session_ids: list) -> dict:
+    """Concurrent sessions calling ConversationAnswering.conversation_answer from threads."""
+    from services.conversation_answering import ConversationAnswering
+
+    def run_client(client: int):
+        session_id = str(uuid.uuid4())
+        session_ids.append(session_id)
+        conversation = ConversationAnswering(session_id=session_id)
+        latencies, errors = [], 0
+        for question in _questions(client, turns):
+            start = time.perf_counter()
+            answer = conversation.conversation_answer(question)
+            latencies.append(time.perf_counter() - start)
+            errors += answer["answer"] == "Error while generating response."
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(run_client, range(clients)))
+    seconds = time.perf_counter() - start
+    latencies = [latency for client_latencies, _ in results for latency in client_latencies]
+    return {
+        "turns": len(latencies),
+        "errors": sum(errors for _, errors in results),
+        "seconds": round(seconds, 3),
+        "turns_per_sec": round(len(latencies) / seconds, 2),
+        **_percentiles(latencies),
+    }
+
+
+def bench_websocket(clients: int, turns: int, stream: bool, session_ids: list) -> dict:
+    """Concurrent clients on /api/ws/chat, served by the app in-process (lifespan included)."""
+    from fastapi.testclient import TestClient
+    from main import app
+
+    def run_client(client: int):
+        latencies, first_tokens, errors = [], [], 0
+        with http.websocket_connect("/api/ws/chat") as websocket:
+            # seeds offset from the direct run, so first questions do not hit the answer cache
+            for question in _questions(10_000 + client, turns):
+                start = time.perf_counter()
+                first_token = None
+                websocket.send_json({"message": question, "stream": stream})
+                while True:
+                    frame = websocket.receive_json()
+                    if frame.get("type") == "token":
+                        first_token = first_token or time.perf_counter() - start
+                        continue
+                    break
+                latencies.append(time.perf_counter() - start)
+                if first_token is not None:
+                    first_tokens.append(first_token)
+                if "error" in frame:
+                    errors += 1
+                else:
+                    session_ids.append(frame["session_id"])
+        return latencies, first_tokens, errors
+
+    with TestClient(app) as http:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            results = list(pool.map(run_client, range(clients)))
+        seconds = time.perf_counter() - start
+    latencies = [latency for client_latencies, _, _ in results for latency in client_latencies]
+    first_tokens = [latency for _, client_first_tokens, _ in results for latency in client_first_tokens]
+    return {
+        "turns": len(latencies),
+        "errors": sum(errors for _, _, errors in results),
+        "seconds": round(seconds, 3),
+        "turns_per_sec": round(len(latencies) / seconds, 2),
+        **_percentiles(latencies),
+        **_percentiles(first_tokens, prefix="first_token_"),
+    }
+
+
+def bench_history(session_ids: list) -> dict:
+    """Time until every queued turn is on disk, and reading the sessions back."""
+    from utils import history_manager
+
+    start = time.perf_counter()
+    history_manager.flush()
+    flush_seconds = time.perf_counter() - start
+    sessions = sorted(set(session_ids))
+    start = time.perf_counter()
+    turns = sum(len(history_manager.load_history(session_id)) // 2 for session_id in sessions)
+    load_seconds = time.perf_counter() - start
+    return {
+        "flush_ms": round(flush_seconds * 1000, 1),
+        "sessions": len(sessions),
+        "turns_on_disk": turns,
+        "load_ms_per_session": round(load_seconds * 1000 / max(1, len(sessions)), 2),
+    }
+
+
+def _flatten(results: dict) -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict) and key != "config":
+            flat.update({f"{key}.{name}": metric for name, metric in value.items()})
+        elif key != "config":
+            flat[key] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Print current against baseline values; return the metrics that regressed by more than `tolerance`."""
+    if baseline.get("config") != results["config"]:
+        print("warning: the baseline was recorded with a different configuration")
+    current, previous = _flatten(results), _flatten(baseline)
+    regressions = []
+    print(f"\n{'metric':<32} {'baseline':>10} {'current':>10} {'change':>8}")
+    for metric, higher_is_better in _COMPARED.items():
+        if metric not in current or not previous.get(metric):
+            continue
+        change = (current[metric] - previous[metric]) / previous[metric]
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(metric)
+        print(f"{metric:<32} {previous[metric]:>10} {current[metric]:>10} {change * 100:>+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=8, help="Synthetic documents to ingest.")
+    parser.add_argument("--doc-kb", type=int, default=64, help="Size of each document in KB.")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent chat clients.")
+    parser.add_argument("--turns", type=int, default=4, help="Questions per client.")
+    parser.add_argument("--no-stream", action="store_true", help="Ask for single-frame WebSocket answers.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Simulated seconds to the first LLM token.")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Simulated seconds per LLM token.")
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="Simulated seconds per embedding call.")
+    parser.add_argument("--embed-text-latency", type=float, default=0.0005, help="Simulated seconds per embedded text.")
+    parser.add_argument("--store-latency", type=float, default=0.01, help="Simulated seconds per vector store call.")
+    parser.add_argument("--history-backend", choices=("file", "sqlite", "redis"), default=settings.HISTORY_BACKEND,
+                        help="History backend; redis runs against the in-process stand-in of benchmarks.fakes.")
+    parser.add_argument("--baseline", help="Results JSON to compare against.")
+    parser.add_argument("--save-baseline", help="Write the results JSON here.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression against the baseline.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="chat-with-files-bench-")
+    fakes.isolate(workdir)
+    settings.HISTORY_BACKEND = args.history_backend
+    if args.history_backend == "redis":
+        settings.REDIS_URL = fakes.RespServer().start().url
+    settings.LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING")  # per-turn INFO logging would dominate the profile
+    fakes.install(
+        llm_latency=args.llm_latency, token_latency=args.token_latency, embed_latency=args.embed_latency,
+        embed_text_latency=args.embed_text_latency, store_latency=args.store_latency
+    )
+    from services import document_loaders
+
+    config = {name: value for name, value in vars(args).items() if name not in ("baseline", "save_baseline", "tolerance", "keep")}
+    results = {"config": config}
+    session_ids = []
+    try:
+        results["ingest"] = bench_ingestion(workdir, args.docs, args.doc_kb)
+        print(f"ingest:    {results['ingest']}")
+        results["direct"] = bench_direct(args.clients, args.turns, session_ids)
+        print(f"direct:    {results['direct']}")
+        results["websocket"] = bench_websocket(args.clients, args.turns, not args.no_stream, session_ids)
+        print(f"websocket: {results['websocket']}")
+        results["history"] = bench_history(session_ids)
+        print(f"history:   {results['history']}")
+        results["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+        print(f"peak RSS:  {results['peak_rss_mb']} MB")
+    finally:
+        document_loaders.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved results to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
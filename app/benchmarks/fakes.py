@@ -0,0 +1,368 @@
+"""
+Deterministic offline stand-ins for Gemini, the HuggingFace embedding model and Pinecone,
+with configurable simulated latency, for benchmarks that must run without network access.
+
+RespServer is an in-process stand-in for Redis, for the redis history backend.
+
+Call isolate() before importing any service module or utils.logger: it points every on-disk
+location (index, manifests, history, caches, uploads, logs) at a scratch directory and selects
+the local vector store backend. install() then overrides the shared resources in the registry.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import socket
+import socketserver
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from config.settings import settings
+
+_VOCABULARY = (
+    "attention encoder decoder layer head model token sequence embedding vector query key value "
+    "training batch gradient loss optimizer dropout residual normalization position translation "
+    "corpus document retrieval index search context answer question memory latency throughput"
+).split()
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def fake_text(seed: int, words: int) -> str:
+    """Deterministic pseudo-English: sentences of vocabulary words, with a paragraph break every few sentences."""
+    rng = random.Random(seed)
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 24))
+        sentence = " ".join(rng.choice(_VOCABULARY) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        words -= length
+        if rng.random() < 0.2:
+            sentences.append("\n\n")
+    return " ".join(sentences)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words embeddings: texts sharing words get similar unit vectors, so retrieval
+    still returns related chunks. Each call sleeps `latency` plus `text_latency` per text.
+    """
+    def __init__(self, dimension: int = 384, latency: float = 0.0, text_latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+        self.text_latency = text_latency
+
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in text.lower().split():
+            vector[_seed(word.strip(".,?!")) % self.dimension] += 1.0
+        vector[0] += 1e-3  # no zero vectors for empty texts
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        time.sleep(self.latency + self.text_latency * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency + self.text_latency)
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering with `answer_tokens` words chosen deterministically from the prompt.
+    A call waits `latency` before the first token and `token_latency` per token, with
+    time.sleep on the sync paths and asyncio.sleep on the async ones, like a network client.
+    """
+    latency: float = 0.0
+    token_latency: float = 0.0
+    answer_tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _tokens(self, messages) -> list:
+        rng = random.Random(_seed("".join(str(message.content) for message in messages)))
+        return [rng.choice(_VOCABULARY) + " " for _ in range(self.answer_tokens)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for token in self._tokens(messages):
+            time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for token in self._tokens(messages):
+            await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def latency_vector_store(latency: float = 0.0):
+    """LocalVectorStore class whose calls first sleep `latency`, like a round trip to Pinecone."""
+    from services.local_vector_store import LocalVectorStore
+
+    class LatencyVectorStore(LocalVectorStore):
+        def add_vectors(self, *args, **kwargs):
+            time.sleep(latency)
+            return super().add_vectors(*args, **kwargs)
+
+        def delete(self, *args, **kwargs):
+            time.sleep(latency)
+            return super().delete(*args, **kwargs)
+
+        def similarity_search_with_score_by_vector(self, *args, **kwargs):
+            time.sleep(latency)
+            return super().similarity_search_with_score_by_vector(*args, **kwargs)
+
+    return LatencyVectorStore
+
+
+def isolate(workdir: str):
+    """Point every path the app writes to at `workdir` and use the local vector store backend."""
+    if "utils.logger" in sys.modules:
+        raise RuntimeError("isolate() must run before utils.logger is imported, or the logs go to the app's log file.")
+    settings.VECTOR_STORE_BACKEND = "local"
+    settings.LOCAL_INDEX_DIR = os.path.join(workdir, "vector_index")
+    settings.MANIFEST_DIR = os.path.join(workdir, "manifests")
+    settings.LEXICAL_INDEX_DIR = os.path.join(workdir, "lexical_index")
+    settings.EMBEDDING_CACHE_PATH = os.path.join(workdir, "cache", "embeddings.db")
+    settings.HISTORY_DIR = os.path.join(workdir, "history")
+    settings.HISTORY_DB_PATH = os.path.join(settings.HISTORY_DIR, "history.db")
+    settings.UPLOAD_DIR = os.path.join(workdir, "uploads")
+    settings.LOGS_DIR = os.path.join(workdir, "logs")  # read once, when utils.logger is imported
+    for path in (settings.MANIFEST_DIR, settings.HISTORY_DIR, os.path.dirname(settings.EMBEDDING_CACHE_PATH), settings.LOGS_DIR):
+        os.makedirs(path, exist_ok=True)
+
+
+def install(llm_latency: float = 0.0, token_latency: float = 0.0, embed_latency: float = 0.0,
+            embed_text_latency: float = 0.0, store_latency: float = 0.0):
+    """Override the registry's models, tokenizer and vector store with the offline stand-ins."""
+    from services.chunking import ApproximateTokenizer
+    from services.embeddings import CachedEmbeddings, TimedEmbeddings
+    from services.resources import registry
+    from utils.embedding_cache import EmbeddingCache
+
+    def embeddings():
+        # wrapped like the real model, so the embedding caches are part of what is measured
+        model = FakeEmbeddings(latency=embed_latency, text_latency=embed_text_latency)
+        if settings.EMBEDDING_CACHE_ENABLED:
+            model = CachedEmbeddings(
+                model,
+                model_name="fake",
+                cache=EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_BYTES),
+                query_cache_size=settings.QUERY_EMBEDDING_CACHE_SIZE
+            )
+        return TimedEmbeddings(model)
+
+    store_class = latency_vector_store(store_latency)
+    registry.override("embeddings", embeddings)
+    registry.override("tokenizer", ApproximateTokenizer)
+    registry.override("llm", lambda: FakeChatModel(latency=llm_latency, token_latency=token_latency))
+    registry.override("vector_store", lambda: store_class(path=settings.LOCAL_INDEX_DIR, embedding=registry.embeddings))
+
+
+def _reply(value) -> bytes:
+    """Encode a reply in RESP2: bytes as bulk strings, str as status, Exception as error."""
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, Exception):
+        return f"-ERR {value}\r\n".encode("utf-8")
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode("utf-8")
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(_reply(item) for item in value)
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """
+    In-process stand-in for a Redis server, for the commands RedisHistoryBackend uses (lists,
+    sorted sets, strings and counters, WATCH/MULTI/EXEC). Commands run one at a time under a
+    lock, like Redis.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int = 0):
+        super().__init__(("127.0.0.1", port), _RespHandler)
+        self.data = {}
+        self.revisions = {}  # key -> write counter, checked by WATCH
+        self.lock = threading.Lock()
+        self.connections = set()
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.server_address[1]}/0"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="resp-server", daemon=True).start()
+        return self
+
+    def drop_connections(self):
+        """Close every client connection, as a server restart or idle timeout would."""
+        for connection in list(self.connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _touch(self, key: bytes):
+        self.revisions[key] = self.revisions.get(key, 0) + 1
+
+    @staticmethod
+    def _range(items: list, start: int, stop: int) -> list:
+        stop = len(items) if stop == -1 else stop + 1
+        return items[start:stop]
+
+    def run(self, command: bytes, args: list):
+        """Execute one data command (everything except the transaction commands)."""
+        if command in (b"PING",):
+            return "PONG"
+        if command in (b"AUTH", b"SELECT"):
+            return "OK"
+        if command == b"FLUSHALL":
+            for key in self.data:
+                self._touch(key)
+            self.data.clear()
+            return "OK"
+        if command == b"DEL":
+            deleted = 0
+            for key in args:
+                if self.data.pop(key, None) is not None:
+                    self._touch(key)
+                    deleted += 1
+            return deleted
+        if not args:
+            return ValueError(f"wrong number of arguments for '{command.decode().lower()}' command")
+        key = args[0]
+        if command == b"RPUSH":
+            self.data.setdefault(key, []).extend(args[1:])
+            self._touch(key)
+            return len(self.data[key])
+        if command == b"LLEN":
+            return len(self.data.get(key, []))
+        if command == b"LRANGE":
+            return self._range(self.data.get(key, []), int(args[1]), int(args[2]))
+        if command == b"ZADD":
+            zset = self.data.setdefault(key, {})
+            added = 0
+            for score, member in zip(args[1::2], args[2::2]):
+                added += member not in zset
+                zset[member] = float(score)
+            self._touch(key)
+            return added
+        if command == b"ZCARD":
+            return len(self.data.get(key, {}))
+        if command == b"ZRANGE":
+            zset = self.data.get(key, {})
+            members = sorted(zset, key=lambda member: (zset[member], member))
+            return self._range(members, int(args[1]), int(args[2]))
+        if command == b"ZREM":
+            zset = self.data.get(key, {})
+            removed = sum(zset.pop(member, None) is not None for member in args[1:])
+            self._touch(key)
+            return removed
+        if command == b"INCR":
+            self.data[key] = str(int(self.data.get(key, b"0")) + 1).encode()
+            self._touch(key)
+            return int(self.data[key])
+        if command == b"MGET":
+            return [self.data.get(item) for item in args]
+        if command == b"SET":
+            # expiry options (EX seconds) are accepted and ignored
+            self.data[key] = args[1]
+            self._touch(key)
+            return "OK"
+        if command == b"GET":
+            return self.data.get(key)
+        return ValueError(f"unknown command '{command.decode()}'")
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.server.connections.add(self.request)
+
+    def finish(self):
+        self.server.connections.discard(self.request)
+        try:
+            super().finish()
+        except OSError:
+            pass
+
+    def _read_command(self):
+        try:
+            line = self.rfile.readline()
+        except OSError:
+            return None
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        server = self.server
+        watched = {}
+        queued = None  # commands queued after MULTI
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            command = args[0].upper()
+            with server.lock:
+                if command == b"WATCH":
+                    for key in args[1:]:
+                        watched[key] = server.revisions.get(key, 0)
+                    reply = "OK"
+                elif command == b"UNWATCH":
+                    watched.clear()
+                    reply = "OK"
+                elif command == b"MULTI":
+                    queued = []
+                    reply = "OK"
+                elif command == b"DISCARD":
+                    queued = None
+                    watched.clear()
+                    reply = "OK"
+                elif command == b"EXEC":
+                    if any(server.revisions.get(key, 0) != revision for key, revision in watched.items()):
+                        reply = None
+                    else:
+                        reply = [server.run(queued_args[0].upper(), queued_args[1:]) for queued_args in queued or []]
+                    queued = None
+                    watched.clear()
+                elif queued is not None:
+                    queued.append(args)
+                    reply = "QUEUED"
+                else:
+                    reply = server.run(command, args[1:])
+            try:
+                self.wfile.write(_reply(reply))
+            except OSError:
+                return  # the client went away, or drop_connections() closed it
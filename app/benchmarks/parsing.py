@@ -0,0 +1,66 @@
+"""
+Pages/sec benchmark of the document parsing engine, per format.
+
+Compares the LangChain loaders the app used before (PyPDFLoader, TextLoader, Docx2txtLoader)
+with services.document_loaders, sequential and on the process pool.
+
+Usage (from the app directory):
+    python -m benchmarks.parsing assets/attention_is_all_you_need.pdf big.docx big.txt --workers 4
+"""
+import os
+import time
+import argparse
+from config.settings import settings
+from services import document_loaders
+
+
+def _baseline_pages(file_path: str):
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".pdf":
+        return PyPDFLoader(file_path).lazy_load()
+    if extension == ".txt":
+        return TextLoader(file_path, encoding="utf-8").lazy_load()
+    return Docx2txtLoader(file_path).lazy_load()
+
+
+def _measure(pages, repeat: int):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count, chars = 0, 0
+        for page in pages():
+            count += 1
+            chars += len(page.page_content)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return count, chars, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="Documents to parse (.pdf, .txt, .docx).")
+    parser.add_argument("--workers", type=int, default=settings.PARSE_WORKERS, help="Parsing processes.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is reported.")
+    args = parser.parse_args()
+
+    print(f"{'file':<40} {'engine':<22} {'pages':>6} {'chars':>10} {'seconds':>8} {'pages/sec':>10}")
+    for file_path in args.files:
+        engines = [
+            ("langchain (before)", lambda: _baseline_pages(file_path)),
+            ("registry, 1 process", lambda: document_loaders.iter_pages(file_path)),
+        ]
+        if file_path.lower().endswith(".pdf") and args.workers > 1:
+            engines.append((f"registry, {args.workers} processes", lambda: document_loaders.iter_pages(file_path)))
+
+        for name, pages in engines:
+            settings.PARSE_WORKERS = args.workers if "processes" in name else 1
+            settings.PDF_PARALLEL_MIN_PAGES = 0 if "processes" in name else 1 << 30
+            count, chars, seconds = _measure(pages, args.repeat)
+            print(f"{os.path.basename(file_path)[:40]:<40} {name:<22} {count:>6} {chars:>10} "
+                  f"{seconds:>8.3f} {count / seconds if seconds else 0:>10.1f}")
+    document_loaders.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,8 @@ class Settings:
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
     PINECONE_KEY = os.getenv("PINECONE_API_KEY")
     INDEX_NAME = os.getenv("INDEX_NAME","chat-with-files")
+    # Namespace used when a request names none ("" is the index's default namespace)
+    DEFAULT_NAMESPACE = os.getenv("DEFAULT_NAMESPACE", "")
 
     BASE_DIR = Path(__file__).resolve().parent.parent
     LOGS_DIR = os.path.join(BASE_DIR, "logs")
@@ -21,10 +23,82 @@ class Settings:
 
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
     MODEL_NAME = "gemini-2.0-flash"
+    # Optional smaller model used only to rewrite follow-up questions (e.g. "gemini-2.0-flash-lite")
+    CONDENSE_MODEL_NAME = os.getenv("CONDENSE_MODEL_NAME", "")
     EMBEDDING_MODEL_NAME = "BAAI/bge-base-en-v1.5"
+    # Embedding runtime on the CPU: "torch" (sentence-transformers), "onnx" (onnxruntime) or
+    # "onnx-int8" (onnxruntime, int8-quantized weights); the ONNX export is made on first use
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+    EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join(BASE_DIR, "onnx_models"))
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "16384"))  # padded tokens per ONNX batch
+    EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # onnxruntime intra-op threads, 0 = all cores
+    # Concurrent query embeddings share one forward pass (up to QUERY_BATCH_MAX queries,
+    # waiting at most QUERY_BATCH_WAIT_MS for more once one is queued)
+    QUERY_BATCHING_ENABLED = os.getenv("QUERY_BATCHING_ENABLED", "true").lower() == "true"
+    QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "32"))
+    QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "0"))
     TEMPERATURE = 0.5
     MAX_TOKENS = 1024
+    RETRIEVER_K = int(os.getenv("RETRIEVER_K", "5"))
+    # Post-retrieval context packing (merge overlapping chunks, dedupe, fit a token budget)
+    CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+    CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.9"))
     
+    # Vector store backend: "pinecone" (remote) or "local" (memory-mapped index on disk)
+    VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone")
+    LOCAL_INDEX_DIR = os.path.join(BASE_DIR, "vector_index")
+    LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")
+    LOCAL_INDEX_IVF_LISTS = int(os.getenv("LOCAL_INDEX_IVF_LISTS", "0"))  # 0 = exact search
+    LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+    # per-document lists of indexed chunk ids, kept per backend
+    MANIFEST_DIR = os.path.join(BASE_DIR, "manifests", VECTOR_STORE_BACKEND)
+    # Hybrid retrieval: BM25 over the same chunks, fused with the vector results (RRF)
+    HYBRID_RETRIEVAL_ENABLED = os.getenv("HYBRID_RETRIEVAL_ENABLED", "true").lower() == "true"
+    LEXICAL_INDEX_DIR = os.path.join(BASE_DIR, "lexical_index", VECTOR_STORE_BACKEND)
+    HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "10"))  # candidates taken from each leg
+    BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+    BM25_B = float(os.getenv("BM25_B", "0.75"))
+    RRF_K = int(os.getenv("RRF_K", "60"))
+    
+    # On-disk embedding cache keyed by (model, text hash)
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_PATH = os.path.join(BASE_DIR, "cache", "embeddings.db")
+    EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+    # Semantic answer cache for first-turn questions (cosine similarity threshold)
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048"))
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+    # Document parsing: PDFs are split into page ranges extracted on a process pool
+    PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+    PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+    PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+    TEXT_SEGMENT_CHARS = int(os.getenv("TEXT_SEGMENT_CHARS", "65536"))  # page size for streamed TXT/DOCX
+
+    # Chunking, sized in embedding-model tokens (bge-base reads at most 512)
+    CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+    # Streaming ingestion pipeline
+    INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+    INGEST_UPSERT_BATCH_SIZE = int(os.getenv("INGEST_UPSERT_BATCH_SIZE", "100"))
+    INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "2"))
+    INGEST_UPSERT_WORKERS = int(os.getenv("INGEST_UPSERT_WORKERS", "4"))
+    INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+    INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "3"))
+    INGEST_MAX_CONCURRENT_JOBS = int(os.getenv("INGEST_MAX_CONCURRENT_JOBS", "2"))
+    INGEST_MAX_PENDING_JOBS = int(os.getenv("INGEST_MAX_PENDING_JOBS", "16"))
+
+    # Multipart uploads: streamed to UPLOAD_DIR/.spool, then moved into UPLOAD_DIR
+    UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+    UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+    UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(100 * 1024 * 1024)))
+    UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(512 * 1024 * 1024)))
+    UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "16"))
+
     #DATABASE_DIR  = os.path.join("app","database")
     #os.makedirs(DATABASE_DIR, exist_ok=True)
 
@@ -32,13 +106,53 @@ class Settings:
     HISTORY_DIR = os.path.join(BASE_DIR, "history")
     os.makedirs(HISTORY_DIR, exist_ok=True)
     MAX_SESSIONS = 10
+    # Conversation memory: "summary" (token budget + rolling summary) or "buffer" (unbounded)
+    MEMORY_MODE = os.getenv("MEMORY_MODE", "summary")
+    MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "1500"))
+    MEMORY_KEEP_TURNS = int(os.getenv("MEMORY_KEEP_TURNS", "4"))
+    MEMORY_SUMMARY_WORKERS = int(os.getenv("MEMORY_SUMMARY_WORKERS", "2"))
+    # In-memory session registry (LRU + TTL)
+    SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "1000"))
+    SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    HISTORY_WRITE_BATCH = int(os.getenv("HISTORY_WRITE_BATCH", "256"))  # max turns per fsync batch
+    # Where histories live: "file" (JSON Lines per session, one worker only), or "sqlite" / "redis",
+    # shared by every worker so a session can be served by any of them
+    HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "file")
+    HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", os.path.join(HISTORY_DIR, "history.db"))
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    HISTORY_REDIS_PREFIX = os.getenv("HISTORY_REDIS_PREFIX", "chat-with-files:history:")
+    # Sessions kept by the shared backends, least recently written deleted first. Much larger than
+    # MAX_SESSIONS: the shared store serves every live session of every worker
+    HISTORY_SHARED_MAX_SESSIONS = int(os.getenv("HISTORY_SHARED_MAX_SESSIONS", "100000"))
 
     LOG_LEVEL = os.getenv("LOG_LEVEL","INFO")
     LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     LOG_FILE = "app.log"
-    
+    # Records waiting for the background log writer; records beyond this are dropped, not waited on
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # User content in logs (questions, answers, snippets): "full", "truncated" or "off" (lengths only)
+    LOG_PAYLOADS = os.getenv("LOG_PAYLOADS", "truncated").lower()
+    LOG_PAYLOAD_CHARS = int(os.getenv("LOG_PAYLOAD_CHARS", "200"))
+
+    # Chat admission control: global and per-session concurrent turns, and their wait queues
+    CHAT_MAX_CONCURRENT = int(os.getenv("CHAT_MAX_CONCURRENT", "8"))
+    CHAT_MAX_QUEUED = int(os.getenv("CHAT_MAX_QUEUED", "64"))
+    CHAT_SESSION_MAX_CONCURRENT = int(os.getenv("CHAT_SESSION_MAX_CONCURRENT", "1"))
+    CHAT_SESSION_MAX_QUEUED = int(os.getenv("CHAT_SESSION_MAX_QUEUED", "4"))
+    # Identical first-turn questions in flight at the same time share one upstream call
+    COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+
+    # Batch question answering (POST /api/qa/batch): questions per request, concurrent vector
+    # queries (shared by all batch requests) and concurrent LLM calls per request
+    BATCH_QA_MAX_QUESTIONS = int(os.getenv("BATCH_QA_MAX_QUESTIONS", "5000"))
+    BATCH_QA_RETRIEVAL_CONCURRENCY = int(os.getenv("BATCH_QA_RETRIEVAL_CONCURRENCY", "16"))
+    BATCH_QA_LLM_CONCURRENCY = int(os.getenv("BATCH_QA_LLM_CONCURRENCY", "4"))
+
     WS_HOST = os.getenv("WS_HOST")
     WS_PORT = int(os.getenv("WS_PORT", "8000"))
+    # uvicorn worker processes; more than one needs a shared HISTORY_BACKEND
+    WORKERS = int(os.getenv("WORKERS", "1"))
     
     
 settings = Settings()
\ No newline at end of file
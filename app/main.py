@@ -1,16 +1,41 @@
+import time
+_import_start = time.perf_counter()
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
 from config.settings import settings
-from api import preprocess, chat, healthy
+from api import preprocess, chat, healthy, namespaces, metrics, batch_qa
+from services.resources import registry
+from services.ingestion_jobs import job_manager
+from services.scheduler import scheduler
+from services import document_loaders
 from utils.logger import logger
+import threading
 import uvicorn
 
+# heavy client libraries are imported by the registry during the warm-up, not here
+IMPORT_MS = round((time.perf_counter() - _import_start) * 1000)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Load and warm up the shared models and clients in the background, so the port is bound
+    right away; /ready reports when they are loaded.
+    """
+    logger.info(f"Imported the app in {IMPORT_MS} ms, warming up shared resources in the background.")
+    threading.Thread(target=registry.warm_up, name="warm-up", daemon=True).start()
+    yield
+    job_manager.shutdown()
+    scheduler.executor.shutdown(wait=False, cancel_futures=True)
+    document_loaders.shutdown()
 
 
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.VERSION,
     description="An application to chat with your files using LLMs and Vector Databases.",   
+    lifespan=lifespan,
 )
 # CORS Middleware
 app.add_middleware(
@@ -35,13 +60,30 @@ async def root():
     
 # Include API routers
 app.include_router(healthy.router)
+app.include_router(metrics.router)
 app.include_router(preprocess.router)
+app.include_router(namespaces.router)
 app.include_router(chat.router)
+app.include_router(batch_qa.router)
 
 if __name__ == "__main__":
-    logger.info(f"Starting {settings.APP_NAME} version {settings.VERSION} on port {settings.WS_PORT} ...")
+    workers = settings.WORKERS
+    # state that lives in each process and must not be shared by several writers
+    single_process = []
+    if settings.HISTORY_BACKEND == "file":
+        single_process.append("HISTORY_BACKEND=file keeps sessions in one process (use sqlite or redis)")
+    if settings.VECTOR_STORE_BACKEND == "local":
+        single_process.append("VECTOR_STORE_BACKEND=local writes its index files without a cross-process lock (use pinecone)")
+    if settings.HYBRID_RETRIEVAL_ENABLED:
+        single_process.append("the BM25 index of HYBRID_RETRIEVAL_ENABLED is per process (set it to false)")
+    if workers > 1 and single_process:
+        logger.warning(f"Starting a single worker instead of {workers}: {'; '.join(single_process)}.")
+        workers = 1
+    logger.info(f"Starting {settings.APP_NAME} version {settings.VERSION} on port {settings.WS_PORT} with {workers} worker(s) ...")
     uvicorn.run(
-        app,
+        # worker processes import the app themselves
+        "main:app" if workers > 1 else app,
         host=settings.WS_HOST,
         port=int(settings.WS_PORT),
+        workers=workers,
         )
\ No newline at end of file
@@ -1,33 +1,193 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Optional, List, Dict, Any, Literal
 
 
 class ChatRequest(BaseModel):
     """Schema for user asking a question about the file."""
     message: str = Field(..., description="User query to ask about the file.")
+    stream: bool = Field(
+        default=False,
+        description="Stream the answer as incremental token frames followed by a final response."
+    )
+    bypass_cache: bool = Field(
+        default=False,
+        description="Always generate a fresh answer instead of serving one from the answer cache."
+    )
 
     model_config = {
         "json_schema_extra": {
             "example": {
-                "message": "how many layers are there in the decoder?"
+                "message": "how many layers are there in the decoder?",
+                "stream": False,
+                "bypass_cache": False
             }
         }
     }
 
 
 class ChatResponse(BaseModel):
-    """Schema for chatbot response to user query."""
+    """Schema for chatbot response to user query (the last frame of a streamed answer)."""
+    type: Literal["final"] = Field(default="final", description="Frame type.")
     reply: str = Field(..., description="LLM-generated response to the query.")
     session_id: Optional[str] = Field(
         default=None,
         description="Unique identifier for the conversation session."
     )
+    sources: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Metadata of the document chunks used to answer."
+    )
+    cached: bool = Field(
+        default=False,
+        description="Whether the reply was served from the answer cache."
+    )
 
     model_config = {
         "json_schema_extra": {
             "example": {
+                "type": "final",
                 "reply": "The decoder has 6 layers.",
+                "session_id": "123e4567-e89b-12d3-a456-426614174000",
+                "sources": [{"source": "attention_is_all_you_need.pdf", "page": 2}],
+                "cached": False
+            }
+        }
+    }
+
+
+class ChatStreamChunk(BaseModel):
+    """Schema for one incremental piece of a streamed answer."""
+    type: Literal["token"] = Field(default="token", description="Frame type.")
+    token: str = Field(..., description="Next piece of the generated answer.")
+    session_id: Optional[str] = Field(
+        default=None,
+        description="Unique identifier for the conversation session."
+    )
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "type": "token",
+                "token": "The decoder",
                 "session_id": "123e4567-e89b-12d3-a456-426614174000"
             }
         }
     }
+
+
+class BatchQuestionsRequest(BaseModel):
+    """Schema for a batch of independent questions answered over the same documents."""
+    questions: List[str] = Field(..., min_length=1, description="Questions, each answered on its own (no shared history).")
+    namespace: Optional[str] = Field(
+        default=None,
+        description="Namespace to answer from (settings.DEFAULT_NAMESPACE if omitted)."
+    )
+    filter: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Only retrieve chunks whose metadata matches these conditions (e.g. {\"source\": \"...\"})."
+    )
+    llm_concurrency: Optional[int] = Field(
+        default=None, ge=1,
+        description="Answers generated at the same time (at most settings.BATCH_QA_LLM_CONCURRENCY)."
+    )
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "questions": ["how many layers are there in the decoder?", "what is multi-head attention?"],
+                "namespace": "team-a",
+                "filter": {"source": "attention_is_all_you_need.pdf"},
+                "llm_concurrency": 4
+            }
+        }
+    }
+
+
+class IngestionJobStatus(BaseModel):
+    """Schema for the status of a background ingestion job."""
+    job_id: str = Field(..., description="Unique identifier of the ingestion job.")
+    file_path: str = Field(..., description="File being ingested.")
+    namespace: str = Field(default="", description="Namespace the file is indexed into (\"\" is the default namespace).")
+    state: Literal["queued", "running", "succeeded", "failed", "cancelled"] = Field(..., description="Current job state.")
+    chunks_processed: int = Field(default=0, description="Chunks embedded and stored (or found unchanged) so far.")
+    chunks_per_sec: float = Field(default=0.0, description="Average ingestion throughput since the job started.")
+    elapsed_seconds: Optional[float] = Field(default=None, description="Seconds since the job started running.")
+    vector_count: Optional[int] = Field(default=None, description="Vectors in the store once the job succeeded.")
+    stages: Dict[str, Any] = Field(default_factory=dict, description="Per-stage item counts and throughput.")
+    bytes: Optional[int] = Field(default=None, description="Size of the file being ingested.")
+    mb_per_sec: float = Field(default=0.0, description="Average ingestion throughput in MB of file per second.")
+    error: Optional[str] = Field(default=None, description="Error message if the job failed.")
+    upload: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Size, duration and throughput of the upload, for files received through /preprocess/upload."
+    )
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "job_id": "0b7e6a9c-5d1f-4a43-9a53-2f1f8f0f4c11",
+                "file_path": "assets/attention_is_all_you_need.pdf",
+                "namespace": "team-a",
+                "state": "running",
+                "chunks_processed": 64,
+                "chunks_per_sec": 21.3,
+                "bytes": 2215244,
+                "mb_per_sec": 0.74,
+                "elapsed_seconds": 3.0,
+                "vector_count": None,
+                "stages": {},
+                "error": None,
+                "upload": None
+            }
+        }
+    }
+
+
+class NamespaceInfo(BaseModel):
+    """Schema for one namespace of the index."""
+    namespace: str = Field(..., description="Namespace name (\"\" is the default namespace).")
+    vector_count: int = Field(default=0, description="Vectors stored in the namespace.")
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "namespace": "team-a",
+                "vector_count": 1210
+            }
+        }
+    }
+
+
+class IngestionBatchStatus(BaseModel):
+    """Schema for the status of the ingestion jobs created by one upload request."""
+    batch_id: str = Field(..., description="Unique identifier of the upload batch.")
+    state: Literal["receiving", "running", "finished"] = Field(..., description="Current batch state.")
+    files: int = Field(default=0, description="Files received so far.")
+    states: Dict[str, int] = Field(default_factory=dict, description="Number of jobs in each job state.")
+    bytes_received: int = Field(default=0, description="Bytes of request body received.")
+    upload_seconds: float = Field(default=0.0, description="Seconds spent receiving the request body.")
+    upload_mb_per_sec: float = Field(default=0.0, description="Upload throughput of the whole request.")
+    chunks_processed: int = Field(default=0, description="Chunks processed across all jobs.")
+    chunks_per_sec: float = Field(default=0.0, description="Aggregate ingestion throughput since the first job started.")
+    mb_per_sec: float = Field(default=0.0, description="Aggregate throughput in MB of successfully ingested files per second.")
+    elapsed_seconds: Optional[float] = Field(default=None, description="Seconds from the first job start to the last job end (or now).")
+    jobs: List[IngestionJobStatus] = Field(default_factory=list, description="Per-file job status.")
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "batch_id": "5f0c1d9e-2a8b-4f6e-9c3d-7b1a2e4f6d80",
+                "state": "running",
+                "files": 2,
+                "states": {"running": 1, "queued": 1},
+                "bytes_received": 4430826,
+                "upload_seconds": 0.21,
+                "upload_mb_per_sec": 21.1,
+                "chunks_processed": 64,
+                "chunks_per_sec": 21.3,
+                "mb_per_sec": 0.0,
+                "elapsed_seconds": 3.0,
+                "jobs": []
+            }
+        }
+    }
@@ -0,0 +1,191 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from utils import history_manager
+from utils.logger import logger, payload
+from config.settings import settings
+
+
+class AnswerCache:
+    """
+    Semantic cache of answers keyed on the question embedding.
+    A lookup returns the stored answer of the most similar cached question if its cosine
+    similarity is at least `threshold`; all entries are compared in a single matrix product.
+    Entries belong to an index version: invalidate() bumps it after every ingestion that
+    changes the index, so answers built on old chunks are never served.
+    Entries are scoped to a namespace: a lookup only matches questions asked in the same
+    namespace, and each namespace has its own version, so ingesting into one namespace
+    leaves the cached answers of the others alone.
+    The least recently used entry is evicted once `max_entries` is reached.
+    Slots are indexed by namespace, so a lookup only touches the namespace's own entries.
+    With a shared history backend, invalidations are also counted there, per namespace: every
+    worker reads the counters before a lookup and drops its entries of a namespace another
+    worker re-indexed.
+    """
+    def __init__(self, max_entries: int = None, threshold: float = None):
+        self.max_entries = max_entries or settings.ANSWER_CACHE_MAX_ENTRIES
+        self.threshold = threshold or settings.ANSWER_CACHE_THRESHOLD
+        self.version = 0  # bumped by every invalidation, whatever the namespace
+        self._epoch = 0  # bumped when every namespace is invalidated at once
+        self._versions = {}  # namespace -> index version
+        self._shared_seen = {}  # namespace -> shared invalidation counters when last read
+        self._vectors = None  # (max_entries, dim) unit vectors, allocated on first put
+        self._entries = [None] * self.max_entries  # slot -> {"question", "answer", "sources", "namespace"}
+        self._order = OrderedDict()  # slot -> None, least recently used first
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        self._slots = {}  # namespace -> {slot: None}
+        self._slot_arrays = {}  # namespace -> array of its slots, rebuilt after the namespace changed
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _shared_counters(namespace: str) -> tuple:
+        """Invalidation counters of every namespace and of `namespace` in the shared backend, () without one."""
+        backend = history_manager.shared_backend()
+        if backend is None:
+            return ()
+        names = ["answer-cache:*", f"answer-cache:{namespace}"]
+        counters = backend.counters(names)
+        return tuple(counters[name] for name in names)
+
+    def namespace_version(self, namespace: str = "") -> tuple:
+        """
+        Index version of a namespace, to pass to put(). Drops the namespace's entries if
+        another worker invalidated it since the last call.
+        """
+        shared = self._shared_counters(namespace)
+        with self._lock:
+            seen = self._shared_seen.get(namespace)
+            if seen is not None and seen != shared:
+                dropped = self._drop_namespace(namespace)
+                logger.info(f"Answer cache entries of namespace {namespace!r} invalidated by another worker ({dropped} dropped).")
+            self._shared_seen[namespace] = shared
+            return self._epoch, self._versions.get(namespace, 0), shared
+
+    def get(self, embedding, namespace: str = ""):
+        """Return the cached entry for the closest question in `namespace`, or None if nothing is similar enough."""
+        query = self._normalize(embedding)
+        with self._lock:
+            if not self._order or self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            slots = self._namespace_slots(namespace)
+            if not len(slots):
+                self.misses += 1
+                return None
+            scores = self._vectors[slots] @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = int(slots[best])
+            self._order.move_to_end(slot)
+            self.hits += 1
+            entry = self._entries[slot]
+        logger.info(f"Answer cache hit (similarity={scores[best]:.3f}) for cached question: {payload(entry['question'])}")
+        return entry
+
+    def put(self, embedding, question: str, answer: str, sources: list, version: tuple, namespace: str = ""):
+        """
+        Store an answer. `version` is the namespace version read before the answer was generated;
+        if an ingestion into the namespace finished in the meantime the answer is dropped.
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            if version != (self._epoch, self._versions.get(namespace, 0), self._shared_seen.get(namespace, ())):
+                return
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._reset(vector.shape[0])
+
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot, _ = self._order.popitem(last=False)
+                self._unindex(slot)
+                self.evictions += 1
+            self._vectors[slot] = vector
+            self._entries[slot] = {"question": question, "answer": answer, "sources": sources, "namespace": namespace}
+            self._order[slot] = None
+            self._slots.setdefault(namespace, {})[slot] = None
+            self._slot_arrays.pop(namespace, None)
+
+    def _namespace_slots(self, namespace: str) -> np.ndarray:
+        slots = self._slot_arrays.get(namespace)
+        if slots is None:
+            slots = np.fromiter(self._slots.get(namespace, ()), dtype=np.int64)
+            self._slot_arrays[namespace] = slots
+        return slots
+
+    def _unindex(self, slot: int):
+        namespace = self._entries[slot]["namespace"]
+        namespace_slots = self._slots[namespace]
+        del namespace_slots[slot]
+        if not namespace_slots:
+            del self._slots[namespace]
+        self._slot_arrays.pop(namespace, None)
+
+    def invalidate(self, namespace: str = None):
+        """
+        Drop the entries of `namespace` (every entry if None) and move it to a new index
+        version (call after the index changed), in this worker and, through the shared
+        backend, in the others.
+        """
+        with self._lock:
+            self.version += 1
+            if namespace is None:
+                dropped = len(self._order)
+                self._epoch += 1
+                self._reset(None if self._vectors is None else self._vectors.shape[1])
+            else:
+                self._versions[namespace] = self._versions.get(namespace, 0) + 1
+                dropped = self._drop_namespace(namespace)
+        logger.info(f"Answer cache invalidated ({dropped} entries dropped, namespace={namespace!r}), version {self.version}.")
+
+        backend = history_manager.shared_backend()
+        if backend is not None:
+            try:
+                backend.increment("answer-cache:*" if namespace is None else f"answer-cache:{namespace}")
+            except Exception as e:
+                logger.error(f"Could not publish the answer cache invalidation to the other workers: {e}")
+
+    def _drop_namespace(self, namespace: str) -> int:
+        """Free the slots of a namespace's entries; call with the lock held. Returns how many were dropped."""
+        slots = self._slots.pop(namespace, {})
+        self._slot_arrays.pop(namespace, None)
+        for slot in slots:
+            del self._order[slot]
+            self._entries[slot] = None
+            self._free.append(slot)
+        return len(slots)
+
+    def _reset(self, dim):
+        self._vectors = None if dim is None else np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._entries = [None] * self.max_entries
+        self._order.clear()
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        self._slots = {}
+        self._slot_arrays = {}
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._order),
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+answer_cache = AnswerCache()
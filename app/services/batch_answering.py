@@ -0,0 +1,153 @@
+import time
+import uuid
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from utils.logger import logger
+from utils.metrics import metrics
+from config.settings import settings
+from services.resources import registry
+from services.embeddings import embed_queries
+from services.hybrid_retriever import retrieve_by_vector
+from services.conversation_answering import ConversationAnswering, build_qa_inputs, pack_docs
+from services.scheduler import scheduler
+from utils.namespaces import resolve_namespace
+
+# Vector queries of every batch request run here, BATCH_QA_RETRIEVAL_CONCURRENCY at a time
+_retrieval_executor = ThreadPoolExecutor(
+    max_workers=settings.BATCH_QA_RETRIEVAL_CONCURRENCY, thread_name_prefix="batch-retrieval"
+)
+
+_questions = metrics.counter(
+    "batch_questions_total", "Questions answered by the batch endpoint, by outcome (answered or error).", ("outcome",)
+)
+
+
+def _percentiles(values: list) -> dict:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0}
+    p50, p95 = np.percentile(values, [50, 95])
+    return {"p50": round(float(p50), 1), "p95": round(float(p95), 1)}
+
+
+class BatchAnswering:
+    """
+    Answers a list of independent questions over one namespace, for evaluation workloads.
+    Every question is answered like the first turn of a ConversationAnswering session (same
+    retriever, context packing and QA prompt, no history), but the questions are embedded in
+    one batched call, their vector queries run concurrently and at most `llm_concurrency`
+    answers are generated at a time. Only `llm_concurrency` + BATCH_QA_RETRIEVAL_CONCURRENCY
+    questions are in flight at once, and every answer is admitted by the chat scheduler, so
+    a batch shares the global LLM limit with chat turns instead of queueing past it.
+    Sessions, history and the answer cache are not touched.
+    """
+    def __init__(self, namespace: str = None, metadata_filter: dict = None, llm_concurrency: int = None):
+        self.namespace = resolve_namespace(namespace)
+        self.metadata_filter = metadata_filter or None
+        self.retriever = registry.namespace_retriever(self.namespace, self.metadata_filter)
+        if self.retriever is None:
+            raise ValueError(f"No vector store available for index {settings.INDEX_NAME}, preprocess a file first.")
+        self.answer_chain = ConversationAnswering._get_chains()[1]
+        self.llm_concurrency = llm_concurrency or settings.BATCH_QA_LLM_CONCURRENCY
+
+    async def _answer(self, index: int, question: str, embedding, llm_slots: asyncio.Semaphore, session_id: str) -> dict:
+        result = {"type": "answer", "index": index, "question": question}
+        try:
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            docs = await loop.run_in_executor(_retrieval_executor, retrieve_by_vector, self.retriever, question, embedding)
+            docs = pack_docs(docs)
+            result["retrieve_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+            async with llm_slots, scheduler.admit(session_id):
+                start = time.perf_counter()
+                answer = await self.answer_chain.ainvoke(build_qa_inputs(question, "", docs))
+                result["answer_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            result["answer"] = answer.content or str(answer)
+            result["sources"] = [doc.metadata for doc in docs]
+            _questions.inc(outcome="answered")
+        except Exception as e:
+            logger.error(f"Error answering batch question {index}: {e}", exc_info=True)
+            result["error"] = str(e) or type(e).__name__
+            _questions.inc(outcome="error")
+        return result
+
+    async def astream(self, questions: list):
+        """
+        Answer `questions` and yield one result per question as soon as it is answered (in
+        completion order, with its index in the list), then the aggregate stats.
+        A question that fails, including when embedding the batch fails, gets an error result;
+        the stats are always yielded last.
+
+        Yields:
+            dict: {"type": "answer", "index", "question", "answer", "sources", "retrieve_ms", "answer_ms"}
+            for each question ({"type": "answer", "index", "question", "error"} if it failed), then
+            {"type": "stats", ...} with counts, throughput and latency percentiles.
+            Cancelling the consumer cancels the questions not answered yet.
+        """
+        start = time.perf_counter()
+        results = []
+        embedding_start = time.perf_counter()
+        try:
+            embeddings = await asyncio.to_thread(embed_queries, registry.embeddings, questions)
+            embed_error = None
+        except Exception as e:
+            logger.error(f"Error embedding {len(questions)} batch questions: {e}", exc_info=True)
+            embeddings, embed_error = None, f"Embedding failed: {str(e) or type(e).__name__}"
+        embed_ms = (time.perf_counter() - embedding_start) * 1000
+
+        if embed_error is not None:
+            for index, question in enumerate(questions):
+                result = {"type": "answer", "index": index, "question": question, "error": embed_error}
+                _questions.inc(outcome="error")
+                results.append(result)
+                yield result
+        else:
+            logger.info(f"Embedded {len(questions)} batch questions in {embed_ms:.0f} ms.")
+            async for result in self._answer_all(questions, embeddings):
+                results.append(result)
+                yield result
+
+        seconds = time.perf_counter() - start
+        answered = [result for result in results if "error" not in result]
+        stats = {
+            "type": "stats",
+            "questions": len(questions),
+            "answered": len(answered),
+            "errors": len(results) - len(answered),
+            "seconds": round(seconds, 3),
+            "questions_per_sec": round(len(answered) / seconds, 2) if seconds else 0.0,
+            "embed_ms": round(embed_ms, 1),
+            "retrieve_ms": _percentiles([result["retrieve_ms"] for result in answered]),
+            "answer_ms": _percentiles([result["answer_ms"] for result in answered]),
+            "llm_concurrency": self.llm_concurrency,
+        }
+        logger.info(
+            f"Batch of {len(questions)} questions: {stats['answered']} answered, {stats['errors']} failed "
+            f"in {seconds:.1f}s ({stats['questions_per_sec']} questions/sec)."
+        )
+        yield stats
+
+    async def _answer_all(self, questions: list, embeddings):
+        """
+        Answer the questions with a fixed pool of worker tasks pulling from the list, and
+        yield their results in completion order.
+        """
+        batch_id = uuid.uuid4().hex[:8]
+        llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        pending = iter(enumerate(zip(questions, embeddings)))
+        worker_count = min(len(questions), self.llm_concurrency + settings.BATCH_QA_RETRIEVAL_CONCURRENCY)
+        done = asyncio.Queue(maxsize=worker_count or 1)
+
+        async def worker(slot: int):
+            # each worker answers one question at a time, so it is one admission session
+            for index, (question, embedding) in pending:
+                await done.put(await self._answer(index, question, embedding, llm_slots, f"batch-{batch_id}-{slot}"))
+
+        workers = [asyncio.create_task(worker(slot)) for slot in range(worker_count)]
+        try:
+            for _ in questions:
+                yield await done.get()
+        finally:
+            for task in workers:
+                task.cancel()
@@ -0,0 +1,213 @@
+import bisect
+import numpy as np
+from langchain_core.documents import Document
+from config.settings import settings
+
+# ASCII character classes; other characters count as word characters
+_ASCII_WORD = np.zeros(128, dtype=bool)
+_ASCII_WORD[[ord(c) for c in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_"]] = True
+_ASCII_SPACE = np.zeros(128, dtype=bool)
+_ASCII_SPACE[[ord(c) for c in " \t\n\r\f\v"]] = True
+_SENTENCE_END = np.zeros(128, dtype=bool)
+_SENTENCE_END[[ord(c) for c in ".!?"]] = True
+_CLOSING = np.zeros(128, dtype=bool)
+_CLOSING[[ord(c) for c in "\"')]"]] = True
+
+
+def _codes(text: str) -> np.ndarray:
+    """Code points of `text`, clipped to 127 for non-ASCII characters."""
+    if text.isascii():
+        return np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    return np.minimum(np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32), 127).astype(np.uint8)
+
+
+def _split_batch(texts, positions_fn):
+    """
+    Run `positions_fn` over the texts joined by newlines (one numpy pass for the batch)
+    and return its sorted positions split per text, relative to each text.
+    """
+    texts = list(texts)
+    results = positions_fn("\n".join(texts))
+    bases = np.cumsum([0] + [len(text) + 1 for text in texts])
+    bounds = [np.searchsorted(result, bases) for result in results]
+    return [
+        tuple(result[bound[i]:bound[i + 1]] - bases[i] for result, bound in zip(results, bounds))
+        for i in range(len(texts))
+    ]
+
+
+def _boundaries(text: str):
+    """
+    Character positions where sentences start after a sentence end (".", "!" or "?",
+    optionally followed by a closing quote or bracket, then whitespace), and where
+    paragraphs start after a blank line.
+    """
+    codes = _codes(text)
+    n = len(codes)
+    padded = np.concatenate((codes, [32, 32])).astype(np.uint8)  # the text ends in whitespace
+    end = _SENTENCE_END[codes]
+    following_space = _ASCII_SPACE[padded[1:n + 1]]
+    second_space = _ASCII_SPACE[padded[2:n + 2]]
+    next_closing = _CLOSING[padded[1:n + 1]]
+    sentences = np.concatenate((
+        np.flatnonzero(end & following_space) + 1,
+        np.flatnonzero(end & next_closing & second_space) + 2,
+    ))
+    sentences.sort()
+
+    # a newline whose next non-blank character is another newline ends a paragraph
+    newlines = np.flatnonzero(codes == 10)
+    non_blank = np.flatnonzero((codes != 32) & (codes != 9) & (codes != 13))
+    following = np.searchsorted(non_blank, newlines + 1)
+    following = following[following < len(non_blank)]
+    blank_lines = newlines[:len(following)][codes[non_blank[following]] == 10]
+    return sentences, blank_lines + 1
+
+
+class ApproximateTokenizer:
+    """
+    Stand-in for the embedding tokenizer when `transformers` is not installed.
+    Every punctuation character is a token and words are split into pieces of at most
+    four characters, which overestimates WordPiece token counts, so chunks still fit the
+    embedding window. Computed with numpy over the whole batch.
+    """
+    model_max_length = 512
+
+    def token_spans(self, texts) -> list:
+        """Return [(token start offsets, token end offsets)] for each text."""
+        return _split_batch(texts, self._spans)
+
+    @staticmethod
+    def _spans(text: str):
+        codes = _codes(text)
+        word = _ASCII_WORD[codes] | (codes == 127)
+        punct = np.flatnonzero(~word & ~_ASCII_SPACE[codes])
+
+        # word runs, each cut into ceil(length / 4) pieces
+        edges = np.diff(np.concatenate(([0], word.view(np.int8), [0])))
+        run_starts = np.flatnonzero(edges == 1)
+        run_ends = np.flatnonzero(edges == -1)
+        pieces = (run_ends - run_starts + 3) // 4
+        first_piece = np.repeat(np.cumsum(pieces) - pieces, pieces)
+        piece_starts = np.repeat(run_starts, pieces) + 4 * (np.arange(len(first_piece)) - first_piece)
+        piece_ends = np.minimum(piece_starts + 4, np.repeat(run_ends, pieces))
+
+        starts = np.concatenate((piece_starts, punct))
+        order = np.argsort(starts, kind="stable")
+        return starts[order], np.concatenate((piece_ends, punct + 1))[order]
+
+
+class TokenChunker:
+    """
+    Chunker sized in tokens of the embedding model, so no chunk is truncated at embed time.
+
+    Pages are tokenized in batches (one call for many pages), sentence ends and paragraph
+    breaks are mapped onto token positions, and whole sentences are packed into chunks of at
+    most `max_tokens`. A chunk is closed early at a paragraph break once it holds `min_tokens`;
+    a chunk closed because it is full passes up to `overlap_tokens` of its trailing sentences
+    on to the next one. Sentences longer than a chunk are split on token boundaries.
+    Chunks are slices of the page text, with their offsets recorded as start_index/end_index.
+    """
+    def __init__(self, tokenizer, max_tokens: int = None, overlap_tokens: int = None, min_tokens: int = None,
+                 batch_size: int = 32):
+        self.tokenizer = tokenizer
+        model_limit = getattr(tokenizer, "model_max_length", 512)
+        self.max_tokens = min(max_tokens or settings.CHUNK_MAX_TOKENS, model_limit - 2)  # room for [CLS]/[SEP]
+        self.overlap_tokens = settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        self.min_tokens = min_tokens or self.max_tokens // 2
+        self.batch_size = batch_size
+
+    def token_spans(self, texts) -> list:
+        """Return [(token start offsets, token end offsets)] numpy arrays for each text, in one batch."""
+        if hasattr(self.tokenizer, "token_spans"):
+            return self.tokenizer.token_spans(texts)
+        encoded = self.tokenizer(
+            list(texts),
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            padding=True,
+            return_tensors="np"
+        )
+        lengths = encoded["attention_mask"].sum(axis=1)
+        offsets = encoded["offset_mapping"]
+        return [(offsets[i, :n, 0], offsets[i, :n, 1]) for i, n in enumerate(lengths)]
+
+    def split_text(self, text: str, spans=None, boundaries=None) -> list:
+        """Return [(start, end, token_count)] character spans of the chunks of `text`."""
+        starts, ends = spans if spans is not None else self.token_spans([text])[0]
+        sentence_cuts, paragraph_cuts = boundaries if boundaries is not None else _boundaries(text)
+        total = len(starts)
+        if total == 0:
+            return []
+
+        # sentence and paragraph boundaries as token positions (no token starts in whitespace)
+        sentences = np.searchsorted(starts, sentence_cuts).tolist()
+        sentences.append(total)
+        paragraphs = np.searchsorted(starts, paragraph_cuts).tolist()
+        starts, ends = starts.tolist(), ends.tolist()
+
+        chunks = []
+        first = 0
+        while first < total:
+            limit = first + self.max_tokens
+            carry = True
+            mid_sentence = False
+            if limit >= total:
+                end = total
+            else:
+                # close early at the first paragraph break once the chunk is big enough
+                i = bisect.bisect_left(paragraphs, first + self.min_tokens)
+                if i < len(paragraphs) and paragraphs[i] <= limit:
+                    end, carry = paragraphs[i], False
+                else:
+                    # else at the last sentence end that fits, or mid-sentence if none does
+                    end = sentences[bisect.bisect_right(sentences, limit) - 1] if sentences[0] <= limit else 0
+                    if end <= first:
+                        end, mid_sentence = limit, True
+            chunks.append((starts[first], ends[end - 1], end - first))
+            if end >= total:
+                break
+
+            next_first = end
+            if carry and self.overlap_tokens:
+                if mid_sentence:
+                    next_first = max(first + 1, end - self.overlap_tokens)
+                else:
+                    # restart at the earliest sentence start within the overlap
+                    j = bisect.bisect_left(sentences, end - self.overlap_tokens)
+                    if first < sentences[j] < end:
+                        next_first = sentences[j]
+            first = next_first
+        return chunks
+
+    def _chunk_page(self, page: Document, spans, boundaries) -> list:
+        return [
+            Document(
+                page_content=page.page_content[start:end],
+                metadata={**page.metadata, "start_index": start, "end_index": end, "token_count": count}
+            )
+            for start, end, count in self.split_text(page.page_content, spans, boundaries)
+        ]
+
+    def split_page(self, page: Document) -> list:
+        """Chunk one page; chunks keep the page metadata plus their character offsets and token count."""
+        return self._chunk_page(page, self.token_spans([page.page_content])[0], _boundaries(page.page_content))
+
+    def iter_chunks(self, pages):
+        """Lazily chunk a stream of pages, tokenizing `batch_size` pages at a time."""
+        batch = []
+        for page in pages:
+            batch.append(page)
+            if len(batch) == self.batch_size:
+                yield from self._chunk_batch(batch)
+                batch = []
+        if batch:
+            yield from self._chunk_batch(batch)
+
+    def _chunk_batch(self, pages):
+        texts = [page.page_content for page in pages]
+        for page, spans, boundaries in zip(pages, self.token_spans(texts), _split_batch(texts, _boundaries)):
+            yield from self._chunk_page(page, spans, boundaries)
+
+    def split_documents(self, docs) -> list:
+        return list(self.iter_chunks(docs))
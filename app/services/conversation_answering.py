@@ -1,128 +1,474 @@
+import time
 import uuid
-from langchain.chains import ConversationalRetrievalChain
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
 from langchain.memory import ConversationBufferMemory
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.schema import HumanMessage, AIMessage
-from utils.logger import logger
+from langchain_core.output_parsers import StrOutputParser
+from utils.logger import logger, payload
+from utils.metrics import metrics, span, stage_seconds
 from config.settings import settings
 from utils import history_manager
 from langchain.schema import SystemMessage
 from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
-from huggingface_hub import login
+from services.resources import registry
+from services.memory import TokenBudgetMemory
+from services.session_manager import SessionManager, SessionState
+from services.answer_cache import answer_cache
+from services.scheduler import coalescer
+from services.hybrid_retriever import reciprocal_rank_fusion
+from utils.tokens import estimate_tokens
+from utils.context_packing import pack_context
+from utils.followup import is_self_contained
+from utils.namespaces import resolve_namespace
+
+# Retrieval on the raw question runs here while the question is being condensed
+_retrieval_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="raw-retrieval")
+
+_answers = metrics.counter(
+    "answers_total", "Answered chat turns by where the answer came from (llm, cache, coalesced or error).", ("source",)
+)
+
+
+QA_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(
+        """You are an intelligent AI assistant.
+        You can use three sources when answering:
+        1. The current user's question.
+        2. Relevant context retrieved from documents.
+        3. The ongoing conversation history.
+
+        - If the user refers to something mentioned earlier,
+        resolve it using the conversation history.
+        - Prefer using document context when available.
+        - If the answer cannot be found in either the documents or the conversation history, say "I don't know".
+        - Be clear, concise, and correct. Adjust technical depth based on the question.
+        """
+    ),
+    HumanMessagePromptTemplate.from_template(
+        """Conversation history:
+        {chat_history}
+
+        Retrieved context:
+        {context}
+
+        Question:
+        {question}
+
+        Provide the best possible answer. If uncertain, say "I don't know".
+        """
+    )
+])
+
+
+def _format_chat_history(messages) -> str:
+    """Render memory messages as 'Human: ...' / 'Assistant: ...' lines."""
+    lines = []
+    for message in messages:
+        role = "Human" if isinstance(message, HumanMessage) else "Assistant"
+        lines.append(f"{role}: {message.content}")
+    return "\n".join(lines)
+
+
+def _format_docs(docs) -> str:
+    """Join retrieved documents into the prompt context (same as the 'stuff' chain)."""
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def build_qa_inputs(question: str, chat_history: str, docs) -> dict:
+    """Build the QA prompt inputs and log their (estimated) token counts."""
+    inputs = {"question": question, "chat_history": chat_history, "context": _format_docs(docs)}
+    prompt_text = "".join(m.content for m in QA_PROMPT.format_messages(**inputs))
+    logger.info(
+        f"Prompt tokens (estimated): total={estimate_tokens(prompt_text)} "
+        f"history={estimate_tokens(chat_history)} context={estimate_tokens(inputs['context'])} "
+        f"question={estimate_tokens(question)}"
+    )
+    return inputs
+
+
+def log_docs(docs):
+    logger.info(f"Retrieved {len(docs)} documents for question")
+    if settings.LOG_PAYLOADS == "off":
+        return
+    for i, d in enumerate(docs):
+        try:
+            snippet = d.page_content[:100].replace("\n", " ")
+            logger.info(f"Doc {i+1} snippet: {payload(snippet)}...")
+        except UnicodeEncodeError:
+            logger.info(f"Doc {i+1} snippet: [Error displaying content]")
+
+
+def pack_docs(docs):
+    """Merge, dedupe and trim the retrieved chunks to the context token budget."""
+    if not settings.CONTEXT_PACKING_ENABLED:
+        return docs
+    packed, stats = pack_context(docs, settings.CONTEXT_MAX_TOKENS, settings.CONTEXT_DEDUP_THRESHOLD)
+    logger.info(
+        f"Context packing: {stats['chunks_in']} -> {stats['chunks_out']} chunks, "
+        f"{stats['tokens_before']} -> {stats['tokens_after']} tokens ({stats['tokens_saved']} prompt tokens saved)"
+    )
+    return packed
+
 
 class ConversationAnswering:
     """
     Service for handling conversational QA with per-session memory,
-    persisting each session to a history file.
+    persisting each session to a history file. Retrieval is scoped to one namespace of
+    the index, optionally narrowed by a metadata filter (e.g. {"source": ...}).
     """
-    sessions = {}  # in-memory: session_id -> ConversationBufferMemory
-    
-    def __init__(self, vector_store, session_id: str = None):
+    sessions = SessionManager()  # in-memory, bounded: session_id -> SessionState (memory + history version)
+    _chains = None  # (question_generator, answer_chain), shared by every session
+
+    def __init__(self, vector_store=None, session_id: str = None, namespace: str = None, metadata_filter: dict = None):
         self.vector_store = vector_store
         self.session_id = session_id or str(uuid.uuid4())
-        QA_PROMPT = ChatPromptTemplate.from_messages([
-            SystemMessage(
-                """You are an intelligent AI assistant.
-                You can use three sources when answering:
-                1. The current user's question.
-                2. Relevant context retrieved from documents.
-                3. The ongoing conversation history.
-
-                - If the user refers to something mentioned earlier,
-                resolve it using the conversation history.  
-                - Prefer using document context when available.  
-                - If the answer cannot be found in either the documents or the conversation history, say "I don't know".  
-                - Be clear, concise, and correct. Adjust technical depth based on the question.  
-                """
-            ),
-            HumanMessagePromptTemplate.from_template(
-                """Conversation history:
-                {chat_history}
-
-                Retrieved context:
-                {context}
-
-                Question:
-                {question}
-
-                Provide the best possible answer. If uncertain, say "I don't know".
-                """
+        self.namespace = resolve_namespace(namespace)
+        self.metadata_filter = metadata_filter or None
+
+        # Reuse the session memory if it is cached, else rebuild it from the history
+        self.state = ConversationAnswering.sessions.get_or_create(self.session_id, self._create_state)
+
+        # Use the shared retriever unless a specific vector store was given
+        if self.vector_store is None:
+            self.retriever = registry.namespace_retriever(self.namespace, self.metadata_filter)
+        else:
+            search_kwargs = {"k": settings.RETRIEVER_K, "namespace": self.namespace}
+            if self.metadata_filter:
+                search_kwargs["filter"] = self.metadata_filter
+            self.retriever = self.vector_store.as_retriever(search_type="similarity", search_kwargs=search_kwargs)
+        if self.retriever is None:
+            raise ValueError(f"No vector store available for index {settings.INDEX_NAME}, preprocess a file first.")
+
+        # Retrieval QA steps: condense follow-up question -> retrieve -> answer
+        self.llm = registry.llm
+        self.question_generator, self.answer_chain = ConversationAnswering._get_chains()
+
+    @classmethod
+    def _get_chains(cls):
+        """Build the prompt | LLM chains once; they hold no per-session state."""
+        if cls._chains is None:
+            cls._chains = (
+                CONDENSE_QUESTION_PROMPT | registry.condense_llm | StrOutputParser(),
+                QA_PROMPT | registry.llm
             )
-        ])
-        
+        return cls._chains
+
+    @property
+    def memory(self):
+        return self.state.memory
+
+    def _create_state(self) -> SessionState:
+        """Create the session memory, seeded from the stored history."""
+        history, version = history_manager.load_session(self.session_id)
+        return SessionState(self._create_memory(history), version)
+
+    def _create_memory(self, history: list):
+        past = []
+        for item in history:
+            if item["role"] == "human":
+                past.append(HumanMessage(content=item["content"]))
+            elif item["role"] == "ai":
+                past.append(AIMessage(content=item["content"]))
 
-        # If no memory exists for this session, create one
-        if self.session_id not in ConversationAnswering.sessions:
+        if settings.MEMORY_MODE == "summary":
+            memory = TokenBudgetMemory(llm=registry.llm)
+            memory.add_messages(past)
+        else:
             memory = ConversationBufferMemory(
                 memory_key="chat_history",
                 return_messages=True,
                 output_key="answer"
             )
+            memory.chat_memory.add_messages(past)
+        return memory
+
+    def _refresh_memory(self):
+        """
+        With a shared history backend, rebuild the session memory if another worker has
+        added turns to the session since it was built.
+        """
+        if self.state.version is None:
+            return
+        with self.state.lock:
+            if history_manager.session_version(self.session_id) == self.state.version:
+                return
+            history, version = history_manager.load_session(self.session_id)
+            self._sync_state(history, version)
+
+    def _sync_state(self, history: list, version: int):
+        """
+        Adopt the stored history of the session. Only a newer version means other workers
+        appended turns; an older one (the store pruned or deleted the session) keeps the
+        in-process memory, and later turns are appended after what the store still has.
+        Called with the state lock held.
+        """
+        if version < self.state.version:
+            logger.warning(
+                f"Stored history of session {self.session_id} went back from version {self.state.version} "
+                f"to {version}, keeping the in-process memory."
+            )
+        else:
+            self.state.memory = self._create_memory(history)
+            logger.info(f"Session {self.session_id} was updated by another worker, reloaded {len(history)} messages.")
+        self.state.version = version
+
+    def _get_chat_history(self) -> str:
+        self._refresh_memory()
+        history = self.memory.load_memory_variables({})["chat_history"]
+        return history if isinstance(history, str) else _format_chat_history(history)
+
+    def _needs_condensation(self, question: str, chat_history: str) -> bool:
+        """Only follow-up questions that depend on the history are rewritten by the LLM."""
+        return bool(chat_history) and not is_self_contained(question)
 
-            # Load history from file
-            past = history_manager.load_history(self.session_id)
-            for item in past:
-                if item["role"] == "human":
-                    memory.chat_memory.add_message(HumanMessage(content=item["content"]))
-                elif item["role"] == "ai":
-                    memory.chat_memory.add_message(AIMessage(content=item["content"]))
-
-            ConversationAnswering.sessions[self.session_id] = memory
-
-        self.memory = ConversationAnswering.sessions[self.session_id]
-
-        # Build retrieval QA chain
-        self.chain = ConversationalRetrievalChain.from_llm(
-            llm=ChatGoogleGenerativeAI(
-                model=settings.MODEL_NAME,
-                google_api_key=settings.GOOGLE_API_KEY,
-                temperature=settings.TEMPERATURE,
-                max_output_tokens=settings.MAX_TOKENS
-            ),
-            retriever=self.vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 5}),
-            chain_type="stuff",
-            memory=self.memory,
-            return_source_documents=True,
-            combine_docs_chain_kwargs={"prompt":QA_PROMPT}
+    def _merge_retrievals(self, question: str, standalone_question: str, docs, raw_docs):
+        if standalone_question.strip() == question.strip():
+            return raw_docs
+        # the rewritten question ranks first, the raw one fills in what it missed
+        return reciprocal_rank_fusion([docs, raw_docs], settings.RETRIEVER_K)
+
+    def _retrieve(self, question: str, chat_history: str, timings: dict):
+        """
+        Condense the question if it needs the history, and retrieve documents for it.
+        Condensation runs while the raw question is already being retrieved, and both
+        result lists are merged. Returns (standalone question, documents).
+        """
+        if not self._needs_condensation(question, chat_history):
+            start = time.perf_counter()
+            docs = self.retriever.invoke(question)
+            timings["retrieve"] = time.perf_counter() - start
+            return question, docs
+
+        start = time.perf_counter()
+        raw = _retrieval_executor.submit(self.retriever.invoke, question)
+        standalone_question = self.question_generator.invoke({"question": question, "chat_history": chat_history})
+        timings["condense"] = time.perf_counter() - start
+
+        docs = None
+        if standalone_question.strip() != question.strip():
+            docs = self.retriever.invoke(standalone_question)
+        raw_docs = raw.result()
+        timings["retrieve"] = time.perf_counter() - start - timings["condense"]
+        return standalone_question, self._merge_retrievals(question, standalone_question, docs, raw_docs)
+
+    async def _aretrieve(self, question: str, chat_history: str, timings: dict):
+        """Async version of _retrieve."""
+        if not self._needs_condensation(question, chat_history):
+            start = time.perf_counter()
+            docs = await self.retriever.ainvoke(question)
+            timings["retrieve"] = time.perf_counter() - start
+            return question, docs
+
+        start = time.perf_counter()
+        raw = asyncio.create_task(self.retriever.ainvoke(question))
+        try:
+            standalone_question = await self.question_generator.ainvoke({"question": question, "chat_history": chat_history})
+            timings["condense"] = time.perf_counter() - start
+
+            docs = None
+            if standalone_question.strip() != question.strip():
+                docs = await self.retriever.ainvoke(standalone_question)
+            raw_docs = await raw
+        finally:
+            raw.cancel()
+        timings["retrieve"] = time.perf_counter() - start - timings["condense"]
+        return standalone_question, self._merge_retrievals(question, standalone_question, docs, raw_docs)
+
+    def _log_timings(self, timings: dict, start: float):
+        """Log the turn's stage latencies and record them in answer_stage_seconds."""
+        timings["total"] = time.perf_counter() - start
+        for stage, seconds in timings.items():
+            stage_seconds.observe(seconds, stage=stage)
+        condense = f"{timings['condense'] * 1000:.0f} ms" if "condense" in timings else "skipped"
+        first_token = f" first_token={timings['first_token'] * 1000:.0f} ms" if "first_token" in timings else ""
+        logger.info(
+            f"Turn latency: condense={condense} retrieve={timings.get('retrieve', 0) * 1000:.0f} ms "
+            f"pack={timings.get('pack', 0) * 1000:.1f} ms answer={timings.get('answer', 0) * 1000:.0f} ms"
+            f"{first_token} total={timings['total'] * 1000:.0f} ms"
         )
-        
 
-    def conversation_answer(self, question: str):
+    def _cache_lookup(self, question: str, chat_history: str, use_cache: bool):
+        """
+        Look a history-independent question up in the semantic answer cache.
+        Returns (entry, embedding, version); embedding is None when the question must not be
+        cached (cache disabled or bypassed, follow-up question, a non-shared vector store or
+        a metadata filter). Entries are looked up and stored in the session's namespace.
+        """
+        if (not (use_cache and settings.ANSWER_CACHE_ENABLED) or chat_history
+                or self.vector_store is not None or self.metadata_filter):
+            return None, None, None
+        version = answer_cache.namespace_version(self.namespace)
+        embedding = registry.embeddings.embed_query(question)
+        return answer_cache.get(embedding, self.namespace), embedding, version
+
+    def _coalesce(self, question: str, embedding):
+        """
+        Join the in-flight computation of the same cacheable question in this namespace.
+        Returns (key, future, is_leader); key is None when the question is not coalesced.
+        """
+        if embedding is None or not settings.COALESCE_ENABLED:
+            return None, None, False
+        key = (self.namespace, " ".join(question.lower().split()))
+        future, leader = coalescer.join(key)
+        return key, future, leader
+
+    def _save_turn(self, question: str, answer_text: str):
+        """
+        Update the session memory and persist the turn to the history.
+        With a shared backend the write expects the version the memory was built from; if
+        another worker appended to the session meanwhile, the memory is rebuilt from the
+        stored history and the turn is appended after the other worker's turns (see _sync_state).
+        """
+        with span("history_save"), self.state.lock:
+            if self.state.version is None:
+                self.memory.save_context({"question": question}, {"answer": answer_text})
+                history_manager.save_history(self.session_id, question, answer_text)
+                return
+            while True:
+                try:
+                    self.state.version = history_manager.save_history(
+                        self.session_id, question, answer_text, expected_version=self.state.version
+                    )
+                    break
+                except history_manager.HistoryConflict:
+                    history, version = history_manager.load_session(self.session_id)
+                    self._sync_state(history, version)
+            self.memory.save_context({"question": question}, {"answer": answer_text})
+
+    def conversation_answer(self, question: str, use_cache: bool = True):
         """
         Ask a question and get an answer, persisting conversation history.
+        First-turn questions are served from the semantic answer cache unless `use_cache` is False,
+        and share the answer of an identical question already being answered in the namespace.
         """
         logger.info("Starting conversation_answer()")
-        logger.info(f"Question: {question}")
+        logger.info(f"Question: {payload(question)}")
 
+        key, future, leader = None, None, False
         try:
-            # Call the chain
-            answer = self.chain.invoke({"question": question})
-            docs = answer.get("source_documents", [])
-            logger.info(f"Retrieved {len(docs)} documents for question")
-            
-            for i, d in enumerate(docs):
-                try:
-                    snippet = d.page_content[:100].replace("\n", " ")
-                    logger.info(f"Doc {i+1} snippet: {snippet}...")
-                except UnicodeEncodeError:
-                    logger.info(f"Doc {i+1} snippet: [Error displaying content]")
-                
-            # Extract answer text
-            answer_text = answer.get("result") or answer.get("answer") or str(answer)
-
-            # Update memory
-            """try:
-                self.memory.chat_memory.add_message(HumanMessage(content=question))
-                self.memory.chat_memory.add_message(AIMessage(content=answer_text))
-            except Exception as e:
-                logger.warning(f"Error updating memory: {e}", exc_info=True) """
-
-            # Save to file
-            history_manager.save_history(self.session_id, question, answer_text)
-
-            logger.info(f"Got response: {answer_text}")
-            return {"answer": answer_text, "session_id": self.session_id}
+            turn_start = time.perf_counter()
+            timings = {}
+            chat_history = self._get_chat_history()
+            cached, embedding, version = self._cache_lookup(question, chat_history, use_cache)
+            if cached is not None:
+                self._save_turn(question, cached["answer"])
+                _answers.inc(source="cache")
+                return {"answer": cached["answer"], "session_id": self.session_id, "sources": cached["sources"], "cached": True}
+
+            key, future, leader = self._coalesce(question, embedding)
+            if key is not None and not leader:
+                shared = future.result()
+                if shared is not None:
+                    logger.info("Answered from an identical in-flight question.")
+                    self._save_turn(question, shared["answer"])
+                    _answers.inc(source="coalesced")
+                    return {"answer": shared["answer"], "session_id": self.session_id, "sources": shared["sources"], "cached": False}
+
+            standalone_question, docs = self._retrieve(question, chat_history, timings)
+
+            start = time.perf_counter()
+            docs = pack_docs(docs)
+            timings["pack"] = time.perf_counter() - start
+            log_docs(docs)
+
+            start = time.perf_counter()
+            answer = self.answer_chain.invoke(build_qa_inputs(standalone_question, chat_history, docs))
+            answer_text = answer.content or str(answer)
+            timings["answer"] = time.perf_counter() - start
+            self._log_timings(timings, turn_start)
+
+            # Save to memory and file
+            self._save_turn(question, answer_text)
+            sources = [d.metadata for d in docs]
+            if embedding is not None:
+                answer_cache.put(embedding, question, answer_text, sources, version, self.namespace)
+            if leader:
+                coalescer.finish(key, future, {"answer": answer_text, "sources": sources})
+
+            _answers.inc(source="llm")
+            logger.info(f"Got response: {payload(answer_text)}")
+            return {"answer": answer_text, "session_id": self.session_id, "sources": sources, "cached": False}
 
         except Exception as e:
             logger.error(f"Error in conversation answering: {e}", exc_info=True)
-            return {"answer": "Error while generating response.", "session_id": self.session_id}
+            _answers.inc(source="error")
+            return {"answer": "Error while generating response.", "session_id": self.session_id, "sources": []}
+        finally:
+            if leader:
+                # no-op after success; on failure the waiting sessions answer on their own
+                coalescer.finish(key, future)
+
+    async def astream_answer(self, question: str, use_cache: bool = True):
+        """
+        Ask a question and stream the answer as it is generated.
+        A cached answer, or the answer shared by an identical in-flight question
+        (see conversation_answer), is sent as a single token.
+
+        Yields:
+            dict: {"event": "token", "token": str} for every generated piece, then
+            {"event": "end", "answer": str, "session_id": str, "sources": list, "cached": bool} once done.
+            History is only persisted when the stream completes, so cancelling the
+            consumer stops generation and leaves no partial turn behind.
+        """
+        logger.info("Starting astream_answer()")
+        logger.info(f"Question: {payload(question)}")
+
+        turn_start = time.perf_counter()
+        timings = {}
+        chat_history = await asyncio.to_thread(self._get_chat_history)
+        cached, embedding, version = await asyncio.to_thread(self._cache_lookup, question, chat_history, use_cache)
+        if cached is not None:
+            yield {"event": "token", "token": cached["answer"]}
+            await asyncio.to_thread(self._save_turn, question, cached["answer"])
+            _answers.inc(source="cache")
+            yield {"event": "end", "answer": cached["answer"], "session_id": self.session_id, "sources": cached["sources"], "cached": True}
+            return
+
+        key, future, leader = self._coalesce(question, embedding)
+        if key is not None and not leader:
+            # shielded: a disconnecting follower must not cancel the leader's future
+            shared = await asyncio.shield(asyncio.wrap_future(future))
+            if shared is not None:
+                logger.info("Answered from an identical in-flight question.")
+                yield {"event": "token", "token": shared["answer"]}
+                await asyncio.to_thread(self._save_turn, question, shared["answer"])
+                _answers.inc(source="coalesced")
+                yield {"event": "end", "answer": shared["answer"], "session_id": self.session_id, "sources": shared["sources"], "cached": False}
+                return
+
+        try:
+            standalone_question, docs = await self._aretrieve(question, chat_history, timings)
+
+            start = time.perf_counter()
+            docs = pack_docs(docs)
+            timings["pack"] = time.perf_counter() - start
+            log_docs(docs)
+
+            parts = []
+            start = time.perf_counter()
+            async for chunk in self.answer_chain.astream(build_qa_inputs(standalone_question, chat_history, docs)):
+                if chunk.content:
+                    if not parts:
+                        timings["first_token"] = time.perf_counter() - turn_start
+                    parts.append(chunk.content)
+                    yield {"event": "token", "token": chunk.content}
+            timings["answer"] = time.perf_counter() - start
+            self._log_timings(timings, turn_start)
+
+            answer_text = "".join(parts)
+            await asyncio.to_thread(self._save_turn, question, answer_text)
+            sources = [d.metadata for d in docs]
+            if embedding is not None:
+                answer_cache.put(embedding, question, answer_text, sources, version, self.namespace)
+            if leader:
+                coalescer.finish(key, future, {"answer": answer_text, "sources": sources})
+        finally:
+            if leader:
+                # no-op after success; if the stream failed or was cancelled, followers answer on their own
+                coalescer.finish(key, future)
+
+        _answers.inc(source="llm")
+        logger.info(f"Got streamed response: {payload(answer_text)}")
+        yield {"event": "end", "answer": answer_text, "session_id": self.session_id, "sources": sources, "cached": False}
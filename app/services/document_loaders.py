@@ -0,0 +1,200 @@
+import os
+import re
+import time
+import zipfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+from pypdf import PdfReader
+from langchain_core.documents import Document
+from utils.logger import logger
+from config.settings import settings
+
+# Supported formats: file extension -> page iterator
+_LOADERS = {}
+
+# Shared process pool for PDF page extraction, created on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def register_loader(*extensions: str):
+    """Register the decorated function as the page iterator for the given file extensions."""
+    def decorator(fn):
+        for extension in extensions:
+            _LOADERS[extension.lower()] = fn
+        return fn
+    return decorator
+
+
+def supported_formats() -> list:
+    return sorted(_LOADERS)
+
+
+def iter_pages(file_path: str):
+    """
+    Lazily parse a document into page Documents, using the loader registered for its extension.
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    loader = _LOADERS.get(extension)
+    if loader is None:
+        logger.error(f"Unsupported file format. Supported formats are: {', '.join(supported_formats())}")
+        raise ValueError("Unsupported file format.")
+
+    start = time.perf_counter()
+    pages = 0
+    for page in loader(file_path):
+        pages += 1
+        yield page
+    seconds = time.perf_counter() - start
+    logger.info(
+        f"Parsed {pages} pages from {extension} file in {seconds:.2f}s "
+        f"({pages / seconds if seconds else 0:.1f} pages/sec)."
+    )
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.PARSE_WORKERS)
+        return _pool
+
+
+def shutdown():
+    """Stop the parsing process pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# ---------- PDF ----------
+
+def _extract_pdf_pages(file_path: str, start: int, end: int) -> list:
+    """Extract the text of pages [start, end) (runs in a worker process)."""
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text(extraction_mode="plain").strip() for i in range(start, end)]
+
+
+@register_loader(".pdf")
+def iter_pdf_pages(file_path: str):
+    """
+    Yield PDF pages in order. Large PDFs are split into ranges of PDF_PAGES_PER_TASK pages
+    extracted on the process pool, with at most two ranges per worker in flight.
+    """
+    reader = PdfReader(file_path)
+    total = len(reader.pages)
+    labels = reader.page_labels
+
+    def page_document(number: int, text: str) -> Document:
+        return Document(
+            page_content=text,
+            metadata={"source": file_path, "total_pages": total, "page": number, "page_label": labels[number]}
+        )
+
+    if total < settings.PDF_PARALLEL_MIN_PAGES or settings.PARSE_WORKERS <= 1:
+        for number in range(total):
+            yield page_document(number, reader.pages[number].extract_text(extraction_mode="plain").strip())
+        return
+
+    pool = _get_pool()
+    step = settings.PDF_PAGES_PER_TASK
+    starts = iter(range(0, total, step))
+    pending = deque()
+
+    def submit_next():
+        start = next(starts, None)
+        if start is not None:
+            pending.append((start, pool.submit(_extract_pdf_pages, file_path, start, min(start + step, total))))
+
+    try:
+        for _ in range(2 * settings.PARSE_WORKERS):
+            submit_next()
+        while pending:
+            start, future = pending.popleft()
+            texts = future.result()
+            submit_next()
+            for offset, text in enumerate(texts):
+                yield page_document(start + offset, text)
+    finally:
+        # the consumer stopped early (error or cancellation)
+        for _, future in pending:
+            future.cancel()
+
+
+# ---------- streamed text formats ----------
+
+def _segments(blocks, file_path: str):
+    """
+    Regroup a stream of text blocks into pages of about TEXT_SEGMENT_CHARS characters,
+    cut at a paragraph, line or word boundary, so large files are never held in memory whole.
+    Pages are numbered from 0 like PDF pages, so chunk offsets are relative to a known page.
+    """
+    size = settings.TEXT_SEGMENT_CHARS
+    buffer = ""
+    page = 0
+    for block in blocks:
+        buffer += block
+        while len(buffer) >= size:
+            window = buffer[:size]
+            cut = max(window.rfind("\n\n") + 2, window.rfind("\n") + 1, window.rfind(" ") + 1)
+            if cut <= 0:
+                cut = size
+            yield Document(page_content=buffer[:cut], metadata={"source": file_path, "page": page})
+            buffer = buffer[cut:]
+            page += 1
+    if buffer:
+        yield Document(page_content=buffer, metadata={"source": file_path, "page": page})
+
+
+@register_loader(".txt")
+def iter_text_pages(file_path: str):
+    """Stream a UTF-8 text file in fixed-size reads."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        yield from _segments(iter(lambda: f.read(settings.TEXT_SEGMENT_CHARS), ""), file_path)
+
+
+def _docx_parts(archive: zipfile.ZipFile) -> list:
+    """XML parts holding text, in the order docx2txt reads them: headers, body, footers."""
+    names = archive.namelist()
+    headers = sorted(name for name in names if re.match(r"word/header[0-9]*\.xml$", name))
+    footers = sorted(name for name in names if re.match(r"word/footer[0-9]*\.xml$", name))
+    return headers + ["word/document.xml"] + footers
+
+
+def _docx_paragraphs(archive: zipfile.ZipFile, part: str):
+    """Stream the paragraphs of one XML part without building the whole tree."""
+    with archive.open(part) as xml:
+        for _, element in ElementTree.iterparse(xml, events=("end",)):
+            if element.tag != f"{_W}p":
+                continue
+            text = []
+            for node in element.iter():
+                if node.tag == f"{_W}t" and node.text:
+                    text.append(node.text)
+                elif node.tag == f"{_W}tab":
+                    text.append("\t")
+                elif node.tag in (f"{_W}br", f"{_W}cr"):
+                    text.append("\n")
+            element.clear()
+            yield "".join(text) + "\n\n"
+
+
+@register_loader(".docx")
+def iter_docx_pages(file_path: str):
+    """Stream a DOCX file paragraph by paragraph (same text as docx2txt)."""
+    with zipfile.ZipFile(file_path) as archive:
+        names = set(archive.namelist())
+        paragraphs = (
+            paragraph
+            for part in _docx_parts(archive) if part in names
+            for paragraph in _docx_paragraphs(archive, part)
+        )
+        yield from _segments(paragraphs, file_path)
@@ -0,0 +1,185 @@
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+from utils.embedding_cache import EmbeddingCache, text_key
+from utils.logger import logger
+from utils.metrics import metrics, span
+
+query_batch_size = metrics.histogram(
+    "embed_query_batch_size", "Query embeddings computed per forward pass by the micro-batcher.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+
+def embed_queries(embeddings: Embeddings, texts: list) -> list:
+    """
+    Embed several queries in one batched call. Wrappers implement embed_queries; a bare model
+    embeds them as documents, which gives the same vectors for models without a query
+    instruction (bge here, see MicroBatchedEmbeddings).
+    """
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    return embeddings.embed_documents(texts)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only runs the underlying model for texts it has not seen.
+    Document embeddings go through the on-disk EmbeddingCache; query embeddings go through
+    an in-memory LRU first and then the same on-disk cache.
+    """
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: EmbeddingCache, query_cache_size: int = 1024):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        keys = [text_key(self.model_name, text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            cached.update(computed)
+
+        logger.info(f"Embedded {len(texts)} texts: {len(texts) - len(missing)} from cache, {len(missing)} computed.")
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        # queries may be embedded differently from documents, so they have their own key space
+        key = text_key(f"{self.model_name}#query", text)
+        with self._query_lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+        if vector is not None:
+            self.cache.record_hits(1)
+            return vector
+
+        vector = self.cache.get_many([key]).get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many({key: vector})
+
+        self._remember_queries({key: vector})
+        return vector
+
+    def embed_queries(self, texts):
+        """Batched embed_query: cache misses are embedded in one call of the underlying model."""
+        texts = list(texts)
+        keys = [text_key(f"{self.model_name}#query", text) for text in texts]
+        found = {}
+        with self._query_lock:
+            for key in keys:
+                if key in self._query_cache:
+                    self._query_cache.move_to_end(key)
+                    found[key] = self._query_cache[key]
+        self.cache.record_hits(len(found))
+        found.update(self.cache.get_many([key for key in dict.fromkeys(keys) if key not in found]))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            computed = dict(zip(missing.keys(), embed_queries(self.embeddings, list(missing.values()))))
+            self.cache.put_many(computed)
+            found.update(computed)
+        self._remember_queries({key: found[key] for key in keys})
+        logger.info(f"Embedded {len(texts)} queries: {len(texts) - len(missing)} from cache, {len(missing)} computed.")
+        return [found[key] for key in keys]
+
+    def _remember_queries(self, vectors: dict):
+        with self._query_lock:
+            for key, vector in vectors.items():
+                self._query_cache[key] = vector
+                self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+
+
+class TimedEmbeddings(Embeddings):
+    """Embeddings wrapper that records every query embedding as the embed_query stage."""
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with span("embed_query"):
+            return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts):
+        with span("embed_queries"):
+            return embed_queries(self.embeddings, texts)
+
+
+class MicroBatchedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that coalesces concurrent embed_query calls, from any number of
+    sessions, into one embed_documents call of the wrapped model. A worker thread takes the
+    oldest waiting query plus whatever else is queued (waiting up to `max_wait` seconds for
+    more, 0 for none) and embeds up to `max_batch` of them in one forward pass, so a lone query
+    is not delayed and queries arriving during a forward pass share the next one.
+    Only for models that embed a query like a document (no query instruction), as bge here.
+    """
+    def __init__(self, embeddings: Embeddings, max_batch: int = 32, max_wait: float = 0.0):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_queries(self, texts):
+        # already a batch, no need to queue it
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embed-query-batcher", daemon=True)
+                self._worker.start()
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            query_batch_size.observe(len(batch))
+            try:
+                vectors = self.embeddings.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
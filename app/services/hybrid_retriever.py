@@ -0,0 +1,103 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.logger import logger
+from utils.metrics import stage_seconds
+
+# Lexical searches run here while the calling thread queries the vector store
+_lexical_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="lexical-search")
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """
+    Fuse ranked lists with reciprocal rank fusion: a document scores sum(1 / (rrf_k + rank))
+    over the lists it appears in. Documents are matched by id, or by text when they have none.
+    """
+    scores, documents = {}, {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = document.id or document.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, document)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
+
+
+def retrieve_by_vector(retriever: BaseRetriever, query: str, embedding) -> List[Document]:
+    """
+    What retriever.invoke(query) returns, with the query embedding computed beforehand
+    (e.g. one batched call for many questions). `retriever` is a HybridRetriever or a
+    vector store retriever from as_retriever(search_type="similarity").
+    """
+    if isinstance(retriever, HybridRetriever):
+        return retriever.retrieve_by_vector(query, embedding)
+    return retriever.vectorstore.similarity_search_by_vector(embedding, **retriever.search_kwargs)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever that runs a vector search and a BM25 search concurrently and fuses
+    their rankings with reciprocal rank fusion. The latency of each leg is logged.
+    `filter` restricts the lexical leg to matching metadata; the vector retriever is
+    expected to be built with the same filter.
+    """
+    vector_retriever: BaseRetriever
+    lexical_index: Any
+    k: int = 5
+    fetch_k: int = 10
+    rrf_k: int = 60
+    filter: Optional[dict] = None
+
+    def _lexical_search(self, query: str):
+        start = time.perf_counter()
+        documents = [document for document, _ in self.lexical_index.search(query, k=self.fetch_k, filter=self.filter)]
+        return documents, time.perf_counter() - start
+
+    def _fuse(self, vector_docs, lexical_docs, vector_seconds, lexical_seconds) -> List[Document]:
+        start = time.perf_counter()
+        documents = reciprocal_rank_fusion([vector_docs, lexical_docs], self.k, self.rrf_k)
+        fusion_seconds = time.perf_counter() - start
+        # the vector leg includes embedding the query (unless it was embedded beforehand), also recorded as embed_query
+        stage_seconds.observe(vector_seconds, stage="vector_search")
+        stage_seconds.observe(lexical_seconds, stage="lexical_search")
+        stage_seconds.observe(fusion_seconds, stage="fusion")
+        logger.info(
+            f"Hybrid retrieval: vector={vector_seconds * 1000:.0f} ms ({len(vector_docs)} docs) "
+            f"lexical={lexical_seconds * 1000:.0f} ms ({len(lexical_docs)} docs) "
+            f"fusion={fusion_seconds * 1000:.1f} ms"
+        )
+        return documents
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        lexical = _lexical_executor.submit(self._lexical_search, query)
+        start = time.perf_counter()
+        vector_docs = self.vector_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        vector_seconds = time.perf_counter() - start
+        lexical_docs, lexical_seconds = lexical.result()
+        return self._fuse(vector_docs, lexical_docs, vector_seconds, lexical_seconds)
+
+    def retrieve_by_vector(self, query: str, embedding) -> List[Document]:
+        """_get_relevant_documents with the query embedding given, so the vector leg is only a search."""
+        lexical = _lexical_executor.submit(self._lexical_search, query)
+        start = time.perf_counter()
+        vector_docs = retrieve_by_vector(self.vector_retriever, query, embedding)
+        vector_seconds = time.perf_counter() - start
+        lexical_docs, lexical_seconds = lexical.result()
+        return self._fuse(vector_docs, lexical_docs, vector_seconds, lexical_seconds)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        async def vector_search():
+            start = time.perf_counter()
+            documents = await self.vector_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+            return documents, time.perf_counter() - start
+
+        loop = asyncio.get_running_loop()
+        (vector_docs, vector_seconds), (lexical_docs, lexical_seconds) = await asyncio.gather(
+            vector_search(),
+            loop.run_in_executor(_lexical_executor, self._lexical_search, query)
+        )
+        return self._fuse(vector_docs, lexical_docs, vector_seconds, lexical_seconds)
@@ -0,0 +1,385 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from services.preprocessing import Preprocessing
+from services.ingestion_pipeline import IngestionCancelled
+from utils import history_manager
+from utils.logger import logger
+from config.settings import settings
+
+
+class JobQueueFull(Exception):
+    """Raised when no more ingestion jobs can be queued."""
+
+
+class IngestionJob:
+    """
+    State of one background ingestion of a file.
+    """
+    def __init__(self, file_path: str, upload: dict = None, namespace: str = "", source: str = None):
+        self.job_id = str(uuid.uuid4())
+        self.file_path = file_path
+        self.source = source or file_path  # the path the document is known by
+        self.namespace = namespace
+        # the document's identity in the index: jobs with the same key run one after the other
+        self.key = (namespace, os.path.abspath(self.source))
+        self.bytes = os.path.getsize(file_path) if os.path.isfile(file_path) else None
+        self.upload = upload
+        self.state = "queued"  # queued -> running -> succeeded | failed | cancelled
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.chunks_processed = 0
+        self.vector_count = None
+        self.stats = {}
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.done = threading.Event()  # set once the job can no longer write to the index
+        self.batch = None
+        self.published_at = 0.0  # last snapshot written to the shared backend
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("succeeded", "failed", "cancelled")
+
+    def as_dict(self) -> dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.job_id,
+            "file_path": self.source,
+            "namespace": self.namespace,
+            "state": self.state,
+            "chunks_processed": self.chunks_processed,
+            "chunks_per_sec": round(self.chunks_processed / elapsed, 2) if elapsed else 0.0,
+            "bytes": self.bytes,
+            "mb_per_sec": round(self.bytes / 1e6 / elapsed, 2) if elapsed and self.bytes else 0.0,
+            "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+            "vector_count": self.vector_count,
+            "stages": self.stats,
+            "error": self.error,
+            "upload": self.upload,
+        }
+
+
+class IngestionBatch:
+    """
+    Jobs created from one upload request, with aggregate upload and ingestion throughput.
+    """
+    def __init__(self):
+        self.batch_id = str(uuid.uuid4())
+        self.created_at = time.time()
+        self.received_at = None  # when the whole request body was received
+        self.bytes_received = 0
+        self.jobs = []
+
+    def as_dict(self) -> dict:
+        jobs = list(self.jobs)
+        states = {}
+        for job in jobs:
+            states[job.state] = states.get(job.state, 0) + 1
+        if self.received_at is None:
+            state = "receiving"
+        elif all(job.finished for job in jobs):
+            state = "finished"
+        else:
+            state = "running"
+
+        upload_seconds = (self.received_at or time.time()) - self.created_at
+        started = [job.started_at for job in jobs if job.started_at is not None]
+        elapsed = None
+        if started:
+            end = max(job.finished_at for job in jobs) if state == "finished" else time.time()
+            elapsed = end - min(started)
+        chunks = sum(job.chunks_processed for job in jobs)
+        ingested_bytes = sum(job.bytes or 0 for job in jobs if job.state == "succeeded")
+        return {
+            "batch_id": self.batch_id,
+            "state": state,
+            "files": len(jobs),
+            "states": states,
+            "bytes_received": self.bytes_received,
+            "upload_seconds": round(upload_seconds, 3),
+            "upload_mb_per_sec": round(self.bytes_received / 1e6 / upload_seconds, 2) if upload_seconds else 0.0,
+            "chunks_processed": chunks,
+            "chunks_per_sec": round(chunks / elapsed, 2) if elapsed else 0.0,
+            "mb_per_sec": round(ingested_bytes / 1e6 / elapsed, 2) if elapsed else 0.0,
+            "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+            "jobs": [job.as_dict() for job in jobs],
+        }
+
+
+class IngestionJobManager:
+    """
+    Runs ingestion jobs on a bounded worker pool, off the event loop.
+    At most `max_concurrent` jobs run at once and at most `max_pending` wait;
+    finished jobs are kept for status queries up to `max_history`.
+    Jobs for the same document in the same namespace (e.g. a repeated request or a re-upload)
+    share its manifest and BM25 segment, so each one waits for the previous one to finish
+    before it is handed to the pool.
+    With a shared history backend, job and batch status are also published there (on every
+    state change and at most every `publish_interval` seconds while running), so any worker
+    can report them, and a cancellation received by another worker is picked up by the
+    worker running the job.
+    """
+    publish_interval = 1.0
+
+    def __init__(self, max_concurrent: int = None, max_pending: int = None, max_history: int = 100):
+        self.max_concurrent = max_concurrent or settings.INGEST_MAX_CONCURRENT_JOBS
+        self.max_pending = max_pending or settings.INGEST_MAX_PENDING_JOBS
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="ingest-job")
+        self._jobs = OrderedDict()
+        self._batches = OrderedDict()
+        self._waiting = {}  # job key -> deque of (job, factory) behind the key's unfinished job
+        self._lock = threading.Lock()
+
+    def submit(self, file_path: str, preprocessor_factory=None, batch: IngestionBatch = None,
+               upload: dict = None, namespace: str = "", source: str = None) -> IngestionJob:
+        """
+        Queue a file for ingestion and return its job immediately.
+        Args:
+            file_path (str): Path of the file to ingest.
+            preprocessor_factory (Callable[[], Preprocessing], optional): Builds the preprocessor
+                for the job; defaults to Preprocessing(file_path=file_path, namespace=namespace, source=source).
+            batch (IngestionBatch, optional): Upload batch the job belongs to.
+            upload (dict, optional): Upload statistics of the file, reported with the job.
+            namespace (str, optional): Namespace the file is indexed into.
+            source (str, optional): Path the document is known by, if `file_path` is a temporary
+                copy (a spooled upload). The file is moved there once the job succeeds, and
+                deleted if it does not.
+        """
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.state == "queued")
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} ingestion jobs already queued.")
+            job = IngestionJob(file_path, upload=upload, namespace=namespace, source=source)
+            self._jobs[job.job_id] = job
+            if batch is not None:
+                job.batch = batch
+                batch.jobs.append(job)
+            self._prune()
+            factory = preprocessor_factory or (
+                lambda: Preprocessing(file_path=file_path, namespace=namespace, source=source)
+            )
+            waiting = self._waiting.get(job.key)
+            if waiting is None:
+                self._waiting[job.key] = deque()
+            else:
+                waiting.append((job, factory))
+        self._publish(job)
+        if waiting is None:
+            job.future = self._executor.submit(self._run, job, factory)
+            logger.info(f"Queued ingestion job {job.job_id} for {file_path} (namespace={namespace!r}).")
+        else:
+            logger.info(f"Queued ingestion job {job.job_id} for {file_path} (namespace={namespace!r}) "
+                        f"behind the unfinished job of the same file.")
+        return job
+
+    def _release(self, job: IngestionJob):
+        """Mark `job` done and hand the next job waiting for the same document to the pool."""
+        self._settle_file(job)
+        self._publish(job)
+        job.done.set()
+        with self._lock:
+            waiting = self._waiting.get(job.key)
+            following = waiting.popleft() if waiting else None
+            if following is None:
+                self._waiting.pop(job.key, None)
+        if following is not None:
+            following[0].future = self._executor.submit(self._run, *following)
+
+    @staticmethod
+    def _settle_file(job: IngestionJob):
+        """
+        Move a temporary copy to the path the document is known by once it is indexed, or
+        delete it. Jobs of the same document never overlap, so the move cannot race another.
+        """
+        if job.source == job.file_path or not os.path.exists(job.file_path):
+            return
+        try:
+            if job.state == "succeeded":
+                os.makedirs(os.path.dirname(os.path.abspath(job.source)), exist_ok=True)
+                os.replace(job.file_path, job.source)
+            else:
+                os.remove(job.file_path)
+            os.rmdir(os.path.dirname(job.file_path))
+        except OSError as e:
+            logger.warning(f"Could not move {job.file_path} to {job.source}: {e}")
+
+    def _run(self, job: IngestionJob, factory):
+        try:
+            if job.cancel_event.is_set() or self._cancel_requested(job):
+                job.state = "cancelled"
+                return
+            self._ingest(job, factory)
+        finally:
+            job.finished_at = time.time()
+            self._release(job)
+
+    def _ingest(self, job: IngestionJob, factory):
+        job.state = "running"
+        job.started_at = time.time()
+        self._publish(job)
+
+        def progress(pipeline):
+            job.chunks_processed = pipeline.processed
+            job.stats = {name: stage.as_dict() for name, stage in pipeline.stats.items()}
+            if time.time() - job.published_at >= self.publish_interval:
+                if self._cancel_requested(job):
+                    job.cancel_event.set()
+                self._publish(job)
+
+        try:
+            preprocessor = factory()
+            preprocessor.preprocess(progress=progress, cancel_event=job.cancel_event)
+            job.stats = preprocessor.stats
+            job.chunks_processed = preprocessor.stats.get("chunk", {}).get("items", job.chunks_processed)
+            job.vector_count = preprocessor.vector_count()
+            job.state = "succeeded"
+            logger.info(f"Ingestion job {job.job_id} succeeded for {job.file_path}.")
+        except IngestionCancelled:
+            job.state = "cancelled"
+            logger.info(f"Ingestion job {job.job_id} cancelled.")
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+            logger.error(f"Ingestion job {job.job_id} failed: {e}")
+
+    def _publish(self, job: IngestionJob):
+        """Write the status of `job` and of its batch to the shared backend, if there is one."""
+        backend = history_manager.shared_backend()
+        if backend is None:
+            return
+        job.published_at = time.time()
+        try:
+            backend.put_state(f"ingest-job:{job.job_id}", job.as_dict())
+            if job.batch is not None:
+                backend.put_state(f"ingest-batch:{job.batch.batch_id}", job.batch.as_dict())
+        except Exception as e:
+            logger.warning(f"Could not publish the status of ingestion job {job.job_id}: {e}")
+
+    def _cancel_requested(self, job: IngestionJob) -> bool:
+        """Whether another worker received a cancellation for `job`."""
+        backend = history_manager.shared_backend()
+        if backend is None:
+            return False
+        try:
+            return backend.get_state(f"ingest-cancel:{job.job_id}") is not None
+        except Exception as e:
+            logger.warning(f"Could not check for a cancellation of ingestion job {job.job_id}: {e}")
+            return False
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_history."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+        while len(self._batches) > self.max_history:
+            self._batches.popitem(last=False)
+
+    def create_batch(self) -> IngestionBatch:
+        """Register a new, empty upload batch."""
+        batch = IngestionBatch()
+        with self._lock:
+            self._batches[batch.batch_id] = batch
+            self._prune()
+        return batch
+
+    def close_batch(self, batch: IngestionBatch):
+        """Record that the whole request body of `batch` was received."""
+        batch.received_at = time.time()
+        backend = history_manager.shared_backend()
+        if backend is not None:
+            try:
+                backend.put_state(f"ingest-batch:{batch.batch_id}", batch.as_dict())
+            except Exception as e:
+                logger.warning(f"Could not publish the status of upload batch {batch.batch_id}: {e}")
+
+    def get_batch(self, batch_id: str):
+        return self._batches.get(batch_id)
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def status(self, job_id: str):
+        """Status of a job of this worker, or as last published by another one; None if unknown."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.as_dict()
+        backend = history_manager.shared_backend()
+        return None if backend is None else backend.get_state(f"ingest-job:{job_id}")
+
+    def batch_status(self, batch_id: str):
+        """Status of an upload batch of this worker, or as last published by another one; None if unknown."""
+        batch = self._batches.get(batch_id)
+        if batch is not None:
+            return batch.as_dict()
+        backend = history_manager.shared_backend()
+        return None if backend is None else backend.get_state(f"ingest-batch:{batch_id}")
+
+    def list(self) -> list:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job. A job of another worker is cancelled by that worker
+        once it sees the request. Returns False if the job is unknown or already finished.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return self._request_cancel(job_id)
+        if job.finished:
+            return False
+        job.cancel_event.set()
+        with self._lock:
+            waiting = self._waiting.get(job.key, ())
+            entry = next((entry for entry in waiting if entry[0] is job), None)
+            if entry is not None:
+                # never handed to the pool: it waited behind another job of the same file
+                waiting.remove(entry)
+                job.state = "cancelled"
+                job.finished_at = time.time()
+        if entry is not None:
+            self._settle_file(job)
+            self._publish(job)
+            job.done.set()
+        if entry is None and job.future is not None and job.future.cancel():
+            job.state = "cancelled"
+            job.finished_at = time.time()
+            self._release(job)
+        logger.info(f"Cancellation requested for ingestion job {job_id}.")
+        return True
+
+    def _request_cancel(self, job_id: str) -> bool:
+        status = self.status(job_id)
+        if status is None or status["state"] in ("succeeded", "failed", "cancelled"):
+            return False
+        history_manager.shared_backend().put_state(f"ingest-cancel:{job_id}", {"requested_at": time.time()})
+        logger.info(f"Cancellation requested for ingestion job {job_id} of another worker.")
+        return True
+
+    def wait(self, jobs: list, timeout: float = None) -> bool:
+        """Wait until `jobs` can no longer write to the index. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in jobs:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not job.done.wait(remaining):
+                return False
+        return True
+
+    def shutdown(self):
+        """Cancel every unfinished job and stop the worker pool."""
+        for job in self.list():
+            if not job.finished:
+                self.cancel(job.job_id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = IngestionJobManager()
@@ -0,0 +1,308 @@
+import time
+import queue
+import threading
+from langchain_core.documents import Document
+from services.local_vector_store import LocalVectorStore
+from utils.logger import logger
+from utils.metrics import metrics
+from config.settings import settings
+
+
+_stage_seconds = metrics.histogram(
+    "ingest_stage_seconds", "Latency of one unit of work (a page or a batch) of an ingestion stage.", ("stage",)
+)
+_stage_items = metrics.counter(
+    "ingest_items_total", "Items processed by an ingestion stage (pages loaded, chunks made, embedded or upserted).", ("stage",)
+)
+
+
+class IngestionAborted(Exception):
+    """Raised inside pipeline workers once another stage has failed."""
+
+
+class IngestionCancelled(Exception):
+    """Raised by IngestionPipeline.run when its cancel event is set."""
+
+
+class StageStats:
+    """Item count and busy time of one pipeline stage."""
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items: int, seconds: float):
+        with self._lock:
+            self.items += items
+            self.seconds += seconds
+        _stage_seconds.observe(seconds, stage=self.name)
+        _stage_items.inc(items, stage=self.name)
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "unit": self.unit,
+            "seconds": round(self.seconds, 3),
+            f"{self.unit}_per_sec": round(self.throughput, 2),
+        }
+
+
+def upsert_vectors(vector_store, ids, vectors, chunks, namespace: str = ""):
+    """Write precomputed embeddings for `chunks` to a namespace of either vector store backend."""
+    if isinstance(vector_store, LocalVectorStore):
+        vector_store.add_vectors(
+            vectors,
+            [chunk.page_content for chunk in chunks],
+            metadatas=[chunk.metadata for chunk in chunks],
+            ids=ids,
+            namespace=namespace
+        )
+        return
+
+    # Pinecone stores the chunk text in the metadata under the store's text key
+    text_key = getattr(vector_store, "_text_key", "text")
+    records = [
+        (chunk_id, vector, {**chunk.metadata, text_key: chunk.page_content})
+        for chunk_id, vector, chunk in zip(ids, vectors, chunks)
+    ]
+    vector_store.index.upsert(vectors=records, namespace=namespace)
+
+
+def fetch_documents(vector_store, ids, namespace: str = "") -> dict:
+    """Stored chunks of `ids` in a namespace of either vector store backend, by id; missing ids are left out."""
+    ids = list(ids)
+    if not ids or vector_store is None:
+        return {}
+    if isinstance(vector_store, LocalVectorStore):
+        return {document.id: document for document in vector_store.get_by_ids(ids)}
+
+    text_key = getattr(vector_store, "_text_key", "text")
+    documents = {}
+    for chunk_id, record in vector_store.index.fetch(ids=ids, namespace=namespace).vectors.items():
+        metadata = dict(record.metadata or {})
+        documents[chunk_id] = Document(id=chunk_id, page_content=metadata.pop(text_key, ""), metadata=metadata)
+    return documents
+
+
+class IngestionPipeline:
+    """
+    Streaming ingestion: lazy page loading -> chunking -> batched embedding on a worker
+    pool -> concurrent batched upserts. Stages are connected by bounded queues, so only
+    a few batches are held in memory whatever the size of the document.
+    """
+    _SENTINEL = object()
+
+    def __init__(self, embeddings, vector_store, embed_batch_size: int = None, upsert_batch_size: int = None,
+                 embed_workers: int = None, upsert_workers: int = None, queue_size: int = None, max_retries: int = None,
+                 namespace: str = ""):
+        self.embeddings = embeddings
+        self.vector_store = vector_store
+        self.namespace = namespace
+        self.embed_batch_size = embed_batch_size or settings.INGEST_EMBED_BATCH_SIZE
+        self.upsert_batch_size = upsert_batch_size or settings.INGEST_UPSERT_BATCH_SIZE
+        self.embed_workers = embed_workers or settings.INGEST_EMBED_WORKERS
+        self.upsert_workers = upsert_workers or settings.INGEST_UPSERT_WORKERS
+        self.queue_size = queue_size or settings.INGEST_QUEUE_SIZE
+        self.max_retries = settings.INGEST_MAX_RETRIES if max_retries is None else max_retries
+
+        self.stats = {
+            "load": StageStats("load", "pages"),
+            "chunk": StageStats("chunk", "chunks"),
+            "embed": StageStats("embed", "chunks"),
+            "upsert": StageStats("upsert", "chunks"),
+        }
+        self.skipped = 0
+        self.upserted_ids = []
+        self._error = None
+        self._failed = threading.Event()
+
+    # ---------- queue helpers that give up once another stage failed ----------
+
+    def _put(self, q: queue.Queue, item):
+        while True:
+            if self._failed.is_set():
+                raise IngestionAborted()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while True:
+            if self._failed.is_set():
+                raise IngestionAborted()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _fail(self, error: Exception):
+        if self._error is None:
+            self._error = error
+        self._failed.set()
+
+    def _with_retries(self, stage: str, fn, *args):
+        """Call fn(*args), retrying with exponential backoff on failure."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn(*args)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = 0.5 * 2 ** attempt
+                logger.warning(f"{stage} batch failed ({e}), retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries}).")
+                time.sleep(delay)
+
+    # ---------- stages ----------
+
+    def _produce(self, pages, split, chunk_ids, skip_ids, all_ids, embed_queue, cancel_event, lexical):
+        """Load pages lazily, chunk them and queue batches of chunks that still need embedding."""
+        batch_chunks, batch_ids = [], []
+        pages = iter(pages)
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise IngestionCancelled("Ingestion cancelled.")
+            start = time.perf_counter()
+            page = next(pages, None)
+            if page is None:
+                break
+            self.stats["load"].add(1, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            chunks = split(page)
+            ids = chunk_ids(chunks)
+            self.stats["chunk"].add(len(chunks), time.perf_counter() - start)
+
+            all_ids.extend(ids)
+            if lexical is not None:
+                lexical.add_batch(ids, chunks)
+            for chunk, chunk_id in zip(chunks, ids):
+                if chunk_id in skip_ids:
+                    self.skipped += 1
+                    continue
+                batch_chunks.append(chunk)
+                batch_ids.append(chunk_id)
+                if len(batch_chunks) >= self.embed_batch_size:
+                    self._put(embed_queue, (batch_ids, batch_chunks))
+                    batch_chunks, batch_ids = [], []
+
+        if batch_chunks:
+            self._put(embed_queue, (batch_ids, batch_chunks))
+
+    def _embed_worker(self, embed_queue, upsert_queue):
+        try:
+            while True:
+                item = self._get(embed_queue)
+                if item is self._SENTINEL:
+                    return
+                ids, chunks = item
+                start = time.perf_counter()
+                vectors = self._with_retries("embed", self.embeddings.embed_documents, [c.page_content for c in chunks])
+                self.stats["embed"].add(len(chunks), time.perf_counter() - start)
+                for i in range(0, len(ids), self.upsert_batch_size):
+                    end = i + self.upsert_batch_size
+                    self._put(upsert_queue, (ids[i:end], vectors[i:end], chunks[i:end]))
+        except IngestionAborted:
+            pass
+        except Exception as e:
+            logger.error(f"Embedding worker failed: {e}", exc_info=True)
+            self._fail(e)
+
+    def _upsert_worker(self, upsert_queue, progress):
+        try:
+            while True:
+                item = self._get(upsert_queue)
+                if item is self._SENTINEL:
+                    return
+                ids, vectors, chunks = item
+                start = time.perf_counter()
+                self._with_retries("upsert", upsert_vectors, self.vector_store, ids, vectors, chunks, self.namespace)
+                self.stats["upsert"].add(len(ids), time.perf_counter() - start)
+                self.upserted_ids.extend(ids)
+                if progress is not None:
+                    progress(self)
+        except IngestionAborted:
+            pass
+        except Exception as e:
+            logger.error(f"Upsert worker failed: {e}", exc_info=True)
+            self._fail(e)
+
+    def run(self, pages, split, chunk_ids, skip_ids=frozenset(), progress=None, cancel_event=None, lexical=None) -> list:
+        """
+        Run the pipeline over a stream of pages.
+        Args:
+            pages (Iterable[Document]): Lazily loaded pages.
+            split (Callable[[Document], List[Document]]): Chunker for one page.
+            chunk_ids (Callable[[List[Document]], List[str]]): Ids for the given chunks, in order.
+            skip_ids (Set[str], optional): Ids already indexed; their chunks are not embedded again.
+            progress (Callable[[IngestionPipeline], None], optional): Called after every upserted batch.
+            cancel_event (threading.Event, optional): Stops the pipeline with IngestionCancelled once set.
+            lexical (SegmentBuilder, optional): Receives the chunks of every page as they are made, unchanged
+                ones included; the caller commits it once the run succeeds.
+        Returns:
+            List[str]: ids of every chunk of the document, in order.
+        """
+        embed_queue = queue.Queue(maxsize=self.queue_size)
+        upsert_queue = queue.Queue(maxsize=self.queue_size)
+        all_ids = []
+        wall_start = time.perf_counter()
+
+        embedders = [
+            threading.Thread(target=self._embed_worker, args=(embed_queue, upsert_queue), name=f"ingest-embed-{i}", daemon=True)
+            for i in range(self.embed_workers)
+        ]
+        upserters = [
+            threading.Thread(target=self._upsert_worker, args=(upsert_queue, progress), name=f"ingest-upsert-{i}", daemon=True)
+            for i in range(self.upsert_workers)
+        ]
+        for worker in embedders + upserters:
+            worker.start()
+
+        try:
+            self._produce(pages, split, chunk_ids, skip_ids, all_ids, embed_queue, cancel_event, lexical)
+            for _ in embedders:
+                self._put(embed_queue, self._SENTINEL)
+            for worker in embedders:
+                worker.join()
+            for _ in upserters:
+                self._put(upsert_queue, self._SENTINEL)
+            for worker in upserters:
+                worker.join()
+        except IngestionAborted:
+            pass
+        except Exception as e:
+            self._fail(e)
+        finally:
+            if self._failed.is_set():
+                for worker in embedders + upserters:
+                    worker.join()
+
+        if self._error is not None:
+            raise self._error
+
+        self.log_stats(time.perf_counter() - wall_start)
+        return all_ids
+
+    @property
+    def processed(self) -> int:
+        """Chunks done so far: upserted, or skipped because they were already indexed."""
+        return self.stats["upsert"].items + self.skipped
+
+    def log_stats(self, wall_seconds: float):
+        for stage in self.stats.values():
+            logger.info(
+                f"Ingestion stage {stage.name}: {stage.items} {stage.unit} in {stage.seconds:.2f}s "
+                f"({stage.throughput:.1f} {stage.unit}/sec)."
+            )
+        chunks = self.stats["chunk"].items
+        logger.info(
+            f"Ingestion finished: {chunks} chunks ({self.skipped} unchanged) in {wall_seconds:.2f}s "
+            f"({chunks / wall_seconds if wall_seconds else 0:.1f} chunks/sec end to end)."
+        )
@@ -0,0 +1,253 @@
+import os
+import io
+import re
+import json
+import math
+import hashlib
+import threading
+from array import array
+import numpy as np
+from utils.logger import logger
+from utils.namespaces import matches_filter
+
+# Words, plus identifiers such as "XJ-200", "v1.2" or "snake_case" kept whole
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercased lexical tokens of `text`. Compound identifiers are emitted whole and
+    as their parts, so "XJ-200" matches both "xj-200" and "200".
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-./_]", token) if part and part != token)
+    return tokens
+
+
+class _Segment:
+    """
+    Inverted index of one document's chunks, held in flat arrays:
+    `terms` is sorted and the postings of terms[i] are rows offsets[i]:offsets[i+1]
+    of `postings` (chunk row) and `freqs` (term frequency). Only the chunk ids are kept
+    with the statistics; texts and metadata are read from the vector store.
+    """
+    def __init__(self, source, terms, offsets, postings, freqs, lengths, ids):
+        self.source = source
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.freqs = freqs
+        self.lengths = lengths
+        self.ids = ids
+
+    def lookup(self, term: str):
+        """Return (chunk rows, term frequencies) for `term`, or None if it does not occur."""
+        i = int(np.searchsorted(self.terms, term))
+        if i == len(self.terms) or self.terms[i] != term:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.postings[start:end], self.freqs[start:end]
+
+    def save(self, base: str):
+        buffer = io.BytesIO()
+        np.savez(buffer, terms=self.terms, offsets=self.offsets, postings=self.postings,
+                 freqs=self.freqs, lengths=self.lengths)
+        for path, data in (
+            (base + ".npz", buffer.getvalue()),
+            (base + ".json", json.dumps({"source": self.source, "ids": self.ids}, ensure_ascii=False).encode("utf-8")),
+        ):
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, base: str):
+        arrays = np.load(base + ".npz", allow_pickle=False)
+        with open(base + ".json", "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        return cls(chunks["source"], arrays["terms"], arrays["offsets"], arrays["postings"], arrays["freqs"], arrays["lengths"],
+                   chunks["ids"])
+
+
+class SegmentBuilder:
+    """
+    Builds the segment of one document from batches of its chunks, as they are chunked.
+    Postings are accumulated as flat (term, row, frequency) arrays, so a large document
+    costs a few bytes per posting and no text is held. commit() swaps the segment in.
+    """
+    def __init__(self, index, source: str):
+        self.index = index
+        self.source = source
+        self._vocabulary = {}  # term -> id, in order of first occurrence
+        self._terms = array("i")
+        self._rows = array("i")
+        self._freqs = array("i")
+        self._lengths = array("i")
+        self._ids = []
+
+    def add_batch(self, ids: list, chunks: list):
+        """Add the next chunks of the document with their ids."""
+        for chunk_id, chunk in zip(ids, chunks):
+            row = len(self._ids)
+            self._ids.append(chunk_id)
+            counts = {}
+            tokens = tokenize(chunk.page_content)
+            self._lengths.append(len(tokens))
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                self._terms.append(self._vocabulary.setdefault(token, len(self._vocabulary)))
+                self._rows.append(row)
+                self._freqs.append(count)
+
+    def build(self) -> _Segment:
+        terms = sorted(self._vocabulary)
+        rank = np.empty(len(terms), dtype=np.int64)
+        rank[[self._vocabulary[term] for term in terms]] = np.arange(len(terms))
+        term_ranks = rank[np.frombuffer(self._terms, dtype=np.int32)] if self._terms else np.zeros(0, dtype=np.int64)
+        # postings were added in row order, so a stable sort keeps every term's rows ascending
+        order = np.argsort(term_ranks, kind="stable")
+        return _Segment(
+            self.source,
+            np.array(terms, dtype=str),
+            np.concatenate([[0], np.cumsum(np.bincount(term_ranks, minlength=len(terms)))]).astype(np.int64),
+            np.frombuffer(self._rows, dtype=np.int32)[order],
+            np.frombuffer(self._freqs, dtype=np.int32)[order].astype(np.float32),
+            np.frombuffer(self._lengths, dtype=np.int32).copy(),
+            self._ids
+        )
+
+    def commit(self):
+        """Index the chunks added so far as the document, replacing whatever was indexed for it before."""
+        self.index._install(self.source, self.build())
+
+
+class BM25Index:
+    """
+    Persistent BM25 inverted index over the ingested chunks.
+
+    Each document source has its own segment of array-backed postings, so re-ingesting
+    a document rebuilds and rewrites only that segment. Collection statistics (chunk count,
+    average length, document frequencies) are combined across segments at query time.
+    Writers swap in a new segment map, so searches never see a half-updated index.
+    Segments hold term statistics and chunk ids only: `fetch` returns the Documents of the
+    given chunk ids (a dict by id, missing ids left out), read from the vector store.
+    """
+    def __init__(self, path: str, fetch, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.fetch = fetch
+        self.k1 = k1
+        self.b = b
+        os.makedirs(path, exist_ok=True)
+        self._write_lock = threading.Lock()
+        self._segments = {}  # source -> _Segment
+        for name in os.listdir(path):
+            if name.endswith(".npz"):
+                base = os.path.join(path, name[:-len(".npz")])
+                try:
+                    segment = _Segment.load(base)
+                    self._segments[segment.source] = segment
+                except Exception as e:
+                    logger.warning(f"Skipping unreadable lexical index segment {base}: {e}")
+        logger.info(f"Loaded lexical index with {len(self._segments)} documents, {len(self)} chunks.")
+
+    def __len__(self) -> int:
+        return sum(len(segment.ids) for segment in self._segments.values())
+
+    def _segment_base(self, source: str) -> str:
+        return os.path.join(self.path, hashlib.sha1(source.encode("utf-8")).hexdigest())
+
+    def builder(self, source: str) -> SegmentBuilder:
+        """Builder that indexes the chunks of `source` batch by batch, replacing it on commit()."""
+        return SegmentBuilder(self, source)
+
+    def replace_document(self, source: str, ids: list, chunks: list):
+        """Index the chunks of `source`, replacing whatever was indexed for it before."""
+        builder = self.builder(source)
+        builder.add_batch(ids, chunks)
+        builder.commit()
+
+    def _install(self, source: str, segment: _Segment):
+        with self._write_lock:
+            segment.save(self._segment_base(source))
+            segments = dict(self._segments)
+            segments[source] = segment
+            self._segments = segments
+        logger.info(f"Lexical index updated for {source}: {len(segment.ids)} chunks, {len(segment.terms)} terms.")
+
+    def delete_document(self, source: str):
+        """Remove a document from the index."""
+        with self._write_lock:
+            base = self._segment_base(source)
+            for path in (base + ".npz", base + ".json"):
+                if os.path.exists(path):
+                    os.remove(path)
+            segments = dict(self._segments)
+            segments.pop(source, None)
+            self._segments = segments
+
+    def clear(self):
+        """Remove every document from the index."""
+        with self._write_lock:
+            for source in self._segments:
+                base = self._segment_base(source)
+                for path in (base + ".npz", base + ".json"):
+                    if os.path.exists(path):
+                        os.remove(path)
+            self._segments = {}
+
+    def search(self, query: str, k: int = 4, filter: dict = None) -> list:
+        """
+        Return the top `k` (Document, BM25 score) pairs for `query`, among the chunks whose
+        metadata matches `filter` if one is given.
+        """
+        segments = list(self._segments.values())
+        terms = set(tokenize(query))
+        if not segments or not terms:
+            return []
+
+        total = sum(len(segment.ids) for segment in segments)
+        if total == 0:
+            return []
+        avg_length = sum(int(segment.lengths.sum()) for segment in segments) / total or 1.0
+        scores = [np.zeros(len(segment.ids), dtype=np.float32) for segment in segments]
+        norms = [self.k1 * (1 - self.b + self.b * segment.lengths / avg_length) for segment in segments]
+
+        for term in terms:
+            hits = [segment.lookup(term) for segment in segments]
+            df = sum(len(hit[0]) for hit in hits if hit is not None)
+            if df == 0:
+                continue
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for score, norm, hit in zip(scores, norms, hits):
+                if hit is not None:
+                    rows, freqs = hit
+                    score[rows] += idf * freqs * (self.k1 + 1) / (freqs + norm[rows])
+
+        flat = np.concatenate(scores)
+        owners = np.repeat(np.arange(len(segments)), [len(s) for s in scores])
+        rows = np.concatenate([np.arange(len(s)) for s in scores])
+        candidates = np.flatnonzero(flat > 0)
+        if not filter and len(candidates) > k:
+            candidates = candidates[np.argpartition(-flat[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-flat[candidates], kind="stable")]
+
+        # best first, fetched a page at a time until k chunks exist in the store and match the filter
+        results = []
+        page = max(4 * k, 32) if filter else k
+        for start in range(0, len(candidates), page):
+            batch = candidates[start:start + page]
+            batch_ids = [segments[owners[i]].ids[rows[i]] for i in batch]
+            documents = self.fetch(batch_ids)
+            for i, chunk_id in zip(batch, batch_ids):
+                document = documents.get(chunk_id)
+                if document is None or (filter and not matches_filter(document.metadata, filter)):
+                    continue
+                results.append((document, float(flat[i])))
+                if len(results) == k:
+                    return results
+        return results
@@ -0,0 +1,541 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from collections import namedtuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from utils.logger import logger
+from utils.namespaces import filter_values
+from config.settings import settings
+
+
+# View of the index used by searches; swapped atomically on every write. Rows are only
+# appended past a snapshot's end and liveness only goes from True to False in place, so a
+# search on an older snapshot at worst skips a row deleted meanwhile. compact() and reset()
+# renumber the rows and start a new `generation`; row lookups in the sidecar check it
+_Snapshot = namedtuple("_Snapshot", ["vectors", "alive", "ivf", "namespaces", "generation"])
+# Inverted lists over the first `size` rows; rows appended since are scanned exhaustively
+_IVF = namedtuple("_IVF", ["centroids", "assign", "order", "offsets", "size"])
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so a dot product is the cosine similarity."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+class _StaleSnapshot(Exception):
+    """The rows of a snapshot were renumbered by a compaction while it was being searched."""
+
+
+def _grow(buffer: np.ndarray, size: int) -> np.ndarray:
+    """`buffer` if it holds `size` rows, else a copy with at least double the capacity."""
+    if len(buffer) >= size:
+        return buffer
+    grown = np.zeros(max(size, 2 * len(buffer), 1024), dtype=buffer.dtype)
+    grown[:len(buffer)] = buffer
+    return grown
+
+
+class LocalVectorStore(VectorStore):
+    """
+    On-disk vector store searched in-process, as an alternative to Pinecone.
+
+    Files in `path`:
+        vectors.bin  append-only (count, dim) matrix of normalized embeddings, memory-mapped for search
+        meta.json    dim, dtype and row count of vectors.bin
+        chunks.db    SQLite sidecar: row -> chunk id, namespace, text, metadata, and the source and page
+                     metadata fields in indexed columns for filtering (deleted rows are removed)
+        ivf.npz      optional IVF centroids and per-row list assignment for large corpora
+
+    Every row belongs to a namespace ("" by default). Searches can be restricted to a namespace,
+    through a per-row namespace code array kept next to the liveness mask, and to a metadata
+    filter, resolved by one query on the sidecar (indexed for source and page). Namespaces are created by their first write and deleted like any other rows, so
+    neither rebuilds the index.
+    """
+    _BLOCK_ROWS = 65536
+
+    def __init__(self, path: str = None, embedding=None, dtype: str = None, ivf_lists: int = None, nprobe: int = None):
+        self.path = path or settings.LOCAL_INDEX_DIR
+        self._embedding = embedding
+        self.dtype = np.dtype(dtype or settings.LOCAL_INDEX_DTYPE)
+        self.ivf_lists = settings.LOCAL_INDEX_IVF_LISTS if ivf_lists is None else ivf_lists
+        self.nprobe = nprobe or settings.LOCAL_INDEX_NPROBE
+        os.makedirs(self.path, exist_ok=True)
+
+        self._vectors_file = os.path.join(self.path, "vectors.bin")
+        self._meta_file = os.path.join(self.path, "meta.json")
+        self._ivf_file = os.path.join(self.path, "ivf.npz")
+
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(self.path, "chunks.db"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL, "
+            "namespace TEXT NOT NULL DEFAULT '', source TEXT, page INTEGER)"
+        )
+        columns = [column for (_, column, *_) in self._db.execute("PRAGMA table_info(chunks)")]
+        if "namespace" not in columns:
+            # index created before namespaces: every chunk is in the default namespace
+            self._db.execute("ALTER TABLE chunks ADD COLUMN namespace TEXT NOT NULL DEFAULT ''")
+        if "source" not in columns:
+            # index created before the filter columns: fill them from the stored metadata
+            self._db.execute("ALTER TABLE chunks ADD COLUMN source TEXT")
+            self._db.execute("ALTER TABLE chunks ADD COLUMN page INTEGER")
+            self._db.execute(
+                "UPDATE chunks SET source = json_extract(metadata, '$.source'), page = json_extract(metadata, '$.page')"
+            )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_namespace ON chunks (namespace)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (namespace, source)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_page ON chunks (namespace, page)")
+        self._db.commit()
+        self._namespace_codes = {}  # namespace -> small integer code used in the snapshot
+        self._generation = 0
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self):
+        return int(self._state.alive.sum())
+
+    # ---------- persistence ----------
+
+    def _load(self):
+        """Memory-map the stored vectors; nothing but row liveness is read into RAM."""
+        meta = {"dim": None, "dtype": self.dtype.name, "count": 0}
+        if os.path.exists(self._meta_file):
+            with open(self._meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        self.dim = meta["dim"]
+        self.dtype = np.dtype(meta["dtype"])
+        self._count = meta["count"]
+
+        # rows written after the last meta.json update belong to an interrupted write
+        self._db.execute("DELETE FROM chunks WHERE row >= ?", (self._count,))
+        self._db.commit()
+        size = self._count * (self.dim or 0) * self.dtype.itemsize
+        if os.path.exists(self._vectors_file) and os.path.getsize(self._vectors_file) > size:
+            logger.warning(f"Dropping the vectors of an interrupted write from {self._vectors_file}.")
+            with open(self._vectors_file, "r+b") as f:
+                f.truncate(size)
+
+        # capacity buffers: the snapshot holds views of their first `count` rows
+        self._alive = np.zeros(self._count, dtype=bool)
+        self._namespaces = np.zeros(self._count, dtype=np.int32)
+        self._assignments = np.zeros(0, dtype=np.int32)
+        for row, namespace in self._db.execute("SELECT row, namespace FROM chunks"):
+            self._alive[row] = True
+            self._namespaces[row] = self._namespace_code(namespace)
+
+        vectors = self._map_vectors()
+        ivf = None
+        if os.path.exists(self._ivf_file) and self._count:
+            data = np.load(self._ivf_file)
+            centroids, assign = data["centroids"], data["assign"][:self._count]
+            if len(assign) < self._count:
+                # rows appended after the lists were last saved
+                assign = np.concatenate([assign, self._assign(centroids, vectors[len(assign):])])
+            self._assignments = assign
+            ivf = self._build_ivf(centroids, assign)
+
+        self._state = _Snapshot(vectors, self._alive, ivf, self._namespaces, self._generation)
+        logger.info(f"Memory-mapped local vector index at {self.path}: {len(self)} vectors.")
+
+    def _namespace_code(self, namespace: str) -> int:
+        code = self._namespace_codes.get(namespace)
+        if code is None:
+            code = self._namespace_codes[namespace] = len(self._namespace_codes)
+        return code
+
+    def _map_vectors(self):
+        if not self._count:
+            return None
+        return np.memmap(self._vectors_file, dtype=self.dtype, mode="r", shape=(self._count, self.dim))
+
+    def _write_meta(self):
+        tmp = self._meta_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name, "count": self._count}, f)
+        os.replace(tmp, self._meta_file)
+
+    def _save_ivf(self, ivf):
+        if ivf is None:
+            if os.path.exists(self._ivf_file):
+                os.remove(self._ivf_file)
+            return
+        np.savez(self._ivf_file, centroids=ivf.centroids, assign=ivf.assign)
+
+    # ---------- IVF ----------
+
+    def _build_ivf(self, centroids, assign):
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(centroids)))])
+        return _IVF(centroids, assign, order, offsets, len(assign))
+
+    def _extend_ivf(self, ivf, vectors):
+        """Assign appended rows to their lists; the lists are re-sorted once the unlisted rows reach 1/8 of the listed ones."""
+        start = len(ivf.assign)
+        self._assignments = _grow(self._assignments, start + len(vectors))
+        self._assignments[start:start + len(vectors)] = self._assign(ivf.centroids, vectors)
+        assign = self._assignments[:start + len(vectors)]
+        if len(assign) - ivf.size <= ivf.size // 8:
+            return ivf._replace(assign=assign)
+        ivf = self._build_ivf(ivf.centroids, assign)
+        self._save_ivf(ivf)
+        return ivf
+
+    def _assign(self, centroids, vectors) -> np.ndarray:
+        assign = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), self._BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + self._BLOCK_ROWS], dtype=np.float32)
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assign
+
+    def _train_ivf(self, vectors, alive, iterations: int = 10):
+        """Spherical k-means on a sample of the live rows."""
+        rng = np.random.default_rng(0)
+        rows = np.flatnonzero(alive)
+        sample_size = min(len(rows), self.ivf_lists * 256)
+        sample = np.sort(rng.choice(rows, sample_size, replace=False))
+        data = np.asarray(vectors[sample], dtype=np.float32)
+
+        centroids = data[rng.choice(len(data), self.ivf_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            empty = ~np.any(sums, axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        logger.info(f"Trained IVF index with {self.ivf_lists} lists on {len(data)} vectors.")
+        self._assignments = self._assign(centroids, vectors)
+        ivf = self._build_ivf(centroids, self._assignments)
+        self._save_ivf(ivf)
+        return ivf
+
+    def _should_train_ivf(self, alive) -> bool:
+        # roughly 40 points per list are needed for useful centroids
+        return self.ivf_lists > 0 and alive.sum() >= self.ivf_lists * 39
+
+    # ---------- writes ----------
+
+    def add_vectors(self, vectors, texts, metadatas=None, ids=None, namespace: str = ""):
+        """
+        Append already-computed embeddings with their texts to `namespace`, replacing any
+        existing chunk with the same id.
+
+        Returns:
+            List[str]: ids of the added chunks.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32)).astype(self.dtype)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}.")
+
+            state = self._state
+            replaced = self._delete_rows(ids)
+            self._alive[replaced] = False
+
+            start = self._count
+            # at the end of the rows meta.json counts, over anything an interrupted write left behind
+            with open(self._vectors_file, "r+b" if os.path.exists(self._vectors_file) else "wb") as f:
+                f.seek(start * self.dim * self.dtype.itemsize)
+                f.write(vectors.tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+            self._db.executemany(
+                "INSERT INTO chunks (row, id, text, metadata, namespace, source, page) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (start + i, ids[i], texts[i], json.dumps(metadatas[i], ensure_ascii=False), namespace,
+                     metadatas[i].get("source"), metadatas[i].get("page"))
+                    for i in range(len(texts))
+                ]
+            )
+            self._db.commit()
+            self._count += len(texts)
+            self._write_meta()
+
+            # rows are written past the end of every snapshot's views, in amortized constant time per row
+            self._alive = _grow(self._alive, self._count)
+            self._alive[start:self._count] = True
+            self._namespaces = _grow(self._namespaces, self._count)
+            self._namespaces[start:self._count] = self._namespace_code(namespace)
+            alive = self._alive[:self._count]
+            mapped = self._map_vectors()
+            ivf = state.ivf
+            if ivf is not None:
+                ivf = self._extend_ivf(ivf, vectors)
+            elif self._should_train_ivf(alive):
+                ivf = self._train_ivf(mapped, alive)
+            self._state = _Snapshot(mapped, alive, ivf, self._namespaces[:self._count], self._generation)
+
+        logger.info(f"Added {len(texts)} vectors to local index {self.path} (namespace={namespace!r}).")
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, namespace: str = "", **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_vectors(vectors, texts, metadatas=metadatas, ids=ids, namespace=namespace)
+
+    def _delete_rows(self, ids) -> list:
+        rows = []
+        ids = list(ids)
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(row for (row,) in self._db.execute(f"SELECT row FROM chunks WHERE id IN ({placeholders})", batch))
+            self._db.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+        return rows
+
+    def _mark_deleted(self, rows):
+        self._alive[rows] = False
+        if self._count > 1000 and (~self._state.alive).sum() > self._count // 4:
+            self.compact()
+
+    def delete(self, ids=None, **kwargs):
+        """
+        Delete chunks by id (ids are unique across namespaces, so a `namespace` argument is not needed).
+        Their vectors are skipped by search until the next compaction.
+        """
+        if not ids:
+            return False
+        with self._lock:
+            rows = self._delete_rows(ids)
+            self._db.commit()
+            self._mark_deleted(rows)
+        logger.info(f"Deleted {len(rows)} vectors from local index {self.path}.")
+        return True
+
+    def delete_namespace(self, namespace: str) -> int:
+        """Delete every chunk of a namespace. Returns the number of chunks deleted."""
+        with self._lock:
+            rows = [row for (row,) in self._db.execute("SELECT row FROM chunks WHERE namespace = ?", (namespace,))]
+            self._db.execute("DELETE FROM chunks WHERE namespace = ?", (namespace,))
+            self._db.commit()
+            self._mark_deleted(rows)
+        logger.info(f"Deleted namespace {namespace!r} ({len(rows)} vectors) from local index {self.path}.")
+        return len(rows)
+
+    def namespaces(self) -> dict:
+        """Chunk count of every non-empty namespace."""
+        with self._lock:
+            return dict(self._db.execute("SELECT namespace, COUNT(*) FROM chunks GROUP BY namespace").fetchall())
+
+    def count(self, namespace: str = None) -> int:
+        """Live chunks in `namespace`, or in the whole index if it is None."""
+        state = self._state
+        if namespace is None:
+            return int(state.alive.sum())
+        code = self._namespace_codes.get(namespace)
+        return 0 if code is None else int((state.alive & (state.namespaces == code)).sum())
+
+    def compact(self):
+        """Rewrite vectors.bin without deleted rows and renumber the sidecar rows."""
+        with self._lock:
+            state = self._state
+            rows = np.flatnonzero(state.alive)
+            tmp = self._vectors_file + ".tmp"
+            with open(tmp, "wb") as f:
+                for start in range(0, len(rows), self._BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(state.vectors[rows[start:start + self._BLOCK_ROWS]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            # ascending old rows map to ascending new rows, so updates never collide
+            self._db.executemany("UPDATE chunks SET row = ? WHERE row = ?", [(i, int(row)) for i, row in enumerate(rows)])
+            self._db.commit()
+            os.replace(tmp, self._vectors_file)
+            self._count = len(rows)
+            self._write_meta()
+
+            self._alive = np.ones(self._count, dtype=bool)
+            self._namespaces = state.namespaces[rows]
+            mapped = self._map_vectors()
+            ivf = None
+            if self._should_train_ivf(self._alive):
+                ivf = self._train_ivf(mapped, self._alive)
+            else:
+                self._save_ivf(None)
+            self._generation += 1
+            self._state = _Snapshot(mapped, self._alive, ivf, self._namespaces, self._generation)
+        logger.info(f"Compacted local index {self.path} to {self._count} vectors.")
+
+    def reset(self):
+        """Remove every vector and chunk from the index."""
+        with self._lock:
+            self._db.execute("DELETE FROM chunks")
+            self._db.commit()
+            open(self._vectors_file, "wb").close()
+            self._count = 0
+            self._write_meta()
+            self._save_ivf(None)
+            self._alive = np.zeros(0, dtype=bool)
+            self._namespaces = np.zeros(0, dtype=np.int32)
+            self._generation += 1
+            self._state = _Snapshot(None, self._alive, None, self._namespaces, self._generation)
+
+    # ---------- search ----------
+
+    def _search_mask(self, state, namespace: str = None, filter: dict = None):
+        """Rows a search may return: live rows, restricted to a namespace and a metadata filter."""
+        mask = state.alive
+        if namespace is not None:
+            code = self._namespace_codes.get(namespace)
+            if code is None:
+                return np.zeros_like(mask)
+            mask = mask & (state.namespaces == code)
+        if filter:
+            # metadata lives in the sidecar: one query returns the matching rows
+            where, params = self._filter_clause(filter)
+            if namespace is not None:
+                where, params = f"namespace = ? AND {where}", [namespace] + params
+            with self._lock:
+                self._check_generation(state)
+                rows = [row for (row,) in self._db.execute(f"SELECT row FROM chunks WHERE {where}", params)]
+            allowed = np.zeros_like(mask)
+            allowed[rows] = True
+            mask = mask & allowed
+        return mask
+
+    @staticmethod
+    def _filter_clause(filter: dict):
+        """
+        SQL condition and parameters selecting the chunks that match a metadata filter (see
+        utils.namespaces.matches_filter): source and page are indexed columns, other fields
+        are read from the metadata JSON.
+        """
+        clauses, params = [], []
+        for key, condition in filter.items():
+            if key in ("source", "page"):
+                column = key
+            else:
+                path = '$."' + key + '"'
+                column = "json_extract(metadata, '" + path.replace("'", "''") + "')"
+            values = filter_values(condition)
+            present = [value for value in values if value is not None]
+            alternatives = []
+            if present:
+                alternatives.append(f"{column} IN ({','.join('?' * len(present))})")
+                params.extend(present)
+            if None in values:
+                alternatives.append(f"{column} IS NULL")
+            clauses.append(f"({' OR '.join(alternatives)})" if alternatives else "0")
+        return " AND ".join(clauses), params
+
+    def _score(self, state, query: np.ndarray, mask: np.ndarray):
+        """Cosine scores for the candidate rows (all rows, or the probed IVF lists); rows outside `mask` score -inf."""
+        if state.ivf is not None:
+            probes = _top_k(state.ivf.centroids @ query, self.nprobe)
+            candidates = np.sort(np.concatenate([
+                state.ivf.order[state.ivf.offsets[p]:state.ivf.offsets[p + 1]] for p in probes
+            ] + [np.arange(state.ivf.size, len(state.vectors))]))
+            scores = np.asarray(state.vectors[candidates], dtype=np.float32) @ query
+            scores[~mask[candidates]] = -np.inf
+            return candidates, scores
+
+        scores = np.empty(len(state.vectors), dtype=np.float32)
+        for start in range(0, len(state.vectors), self._BLOCK_ROWS):
+            block = np.asarray(state.vectors[start:start + self._BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        scores[~mask] = -np.inf
+        return None, scores
+
+    def _check_generation(self, state):
+        """Raise _StaleSnapshot if the rows of `state` no longer match the sidecar; call with the lock held."""
+        if state.generation != self._generation:
+            raise _StaleSnapshot()
+
+    def _fetch(self, state, rows) -> dict:
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            self._check_generation(state)
+            records = self._db.execute(
+                f"SELECT row, id, text, metadata FROM chunks WHERE row IN ({placeholders})", rows
+            ).fetchall()
+        return {row: Document(id=id_, page_content=text, metadata=json.loads(metadata)) for row, id_, text, metadata in records}
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, namespace: str = None, filter: dict = None, **kwargs):
+        """
+        Top `k` (Document, cosine score) pairs, searching only `namespace` when it is given
+        and only chunks whose metadata matches `filter` (see utils.namespaces.matches_filter).
+        """
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+        while True:
+            try:
+                return self._search(self._state, query, k, namespace, filter)
+            except _StaleSnapshot:
+                # a compaction renumbered the rows since the search started: search the new snapshot
+                continue
+
+    def _search(self, state, query: np.ndarray, k: int, namespace: str = None, filter: dict = None):
+        if state.vectors is None:
+            return []
+        mask = self._search_mask(state, namespace, filter)
+        if not mask.any():
+            return []
+        candidates, scores = self._score(state, query, mask)
+        top = _top_k(scores, k)
+        top = top[np.isfinite(scores[top])]
+        rows = (candidates[top] if candidates is not None else top).tolist()
+        if not rows:
+            return []
+        docs = self._fetch(state, rows)
+        return [(docs[row], float(scores[i])) for row, i in zip(rows, top) if row in docs]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k=k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # scores are already cosine similarities
+        return lambda score: score
+
+    def get_by_ids(self, ids):
+        ids = list(ids)
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            records = self._db.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        return [Document(id=id_, page_content=text, metadata=json.loads(metadata)) for id_, text, metadata in records]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, path: str = None, **kwargs):
+        store = cls(path=path, embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,120 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain.schema import HumanMessage, AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from utils.tokens import estimate_tokens, truncate_to_tokens
+from utils.logger import logger
+from config.settings import settings
+
+# Summaries are computed here, never on the request path
+_summary_executor = ThreadPoolExecutor(max_workers=settings.MEMORY_SUMMARY_WORKERS, thread_name_prefix="memory-summary")
+
+# LangChain's progressive summary prompt, asked to stay within a word limit
+BOUNDED_SUMMARY_PROMPT = PromptTemplate.from_template(
+    SUMMARY_PROMPT.template.replace("New summary:", "Keep the new summary under {max_words} words.\n\nNew summary:")
+)
+
+
+def _format_lines(messages) -> list:
+    return [f"{'Human' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}" for m in messages]
+
+
+class TokenBudgetMemory:
+    """
+    Conversation memory with a bounded prompt footprint: the last `keep_turns` turns are
+    kept verbatim and older turns are folded into a rolling summary by the LLM in the
+    background. The summary is capped at half of `max_tokens`, so the rendered history
+    never exceeds `max_tokens` (estimated). Summarized messages are dropped.
+    """
+    def __init__(self, llm, max_tokens: int = None, keep_turns: int = None):
+        self.max_tokens = max_tokens or settings.MEMORY_MAX_TOKENS
+        self.keep_turns = keep_turns or settings.MEMORY_KEEP_TURNS
+        self.summary_tokens = self.max_tokens // 2
+        self.summarizer = BOUNDED_SUMMARY_PROMPT | llm | StrOutputParser()
+        self.messages = []  # messages not yet folded into the summary
+        self.summary = ""
+        self._summarizing = False
+        self._lock = threading.Lock()
+
+    def add_messages(self, messages):
+        """Seed the memory (e.g. from the history file) and summarize what falls outside the window."""
+        with self._lock:
+            self.messages.extend(messages)
+        self._schedule_summary()
+
+    def save_context(self, inputs: dict, outputs: dict):
+        with self._lock:
+            self.messages.append(HumanMessage(content=inputs["question"]))
+            self.messages.append(AIMessage(content=outputs["answer"]))
+        self._schedule_summary()
+
+    def load_memory_variables(self, inputs: dict) -> dict:
+        return {"chat_history": self.render()}
+
+    def render(self) -> str:
+        """
+        History text for the prompt: the summary, then as many recent messages not yet
+        summarized as fit in the rest of the budget, newest kept first.
+        """
+        with self._lock:
+            summary = self.summary
+            pending = list(self.messages)
+
+        parts = []
+        budget = self.max_tokens
+        if summary:
+            summary_text = truncate_to_tokens(f"Summary of earlier conversation: {summary}", self.summary_tokens)
+            budget -= estimate_tokens(summary_text)
+            parts.append(summary_text)
+
+        recent = []
+        for line in reversed(_format_lines(pending)):
+            cost = estimate_tokens(line)
+            if cost > budget:
+                break
+            recent.append(line)
+            budget -= cost
+        parts.extend(reversed(recent))
+        return "\n".join(parts)
+
+    def _schedule_summary(self):
+        with self._lock:
+            window_start = max(0, len(self.messages) - 2 * self.keep_turns)
+            if self._summarizing or window_start == 0:
+                return
+            self._summarizing = True
+        _summary_executor.submit(self._summarize)
+
+    def _summarize(self):
+        """Fold the messages that left the verbatim window into the rolling summary."""
+        try:
+            with self._lock:
+                end = max(0, len(self.messages) - 2 * self.keep_turns)
+                summary = self.summary
+                new_lines = "\n".join(_format_lines(self.messages[:end]))
+
+            # about 0.75 words per token
+            new_summary = self.summarizer.invoke({
+                "summary": summary,
+                "new_lines": new_lines,
+                "max_words": max(1, self.summary_tokens * 3 // 4),
+            })
+            new_summary = truncate_to_tokens(new_summary, self.summary_tokens)
+
+            with self._lock:
+                self.summary = new_summary
+                # only this task removes messages, and only appends happened meanwhile
+                del self.messages[:end]
+            logger.info(f"Summarized {end} messages into memory summary ({estimate_tokens(new_summary)} tokens).")
+        except Exception as e:
+            logger.error(f"Error summarizing conversation memory: {e}", exc_info=True)
+            with self._lock:
+                self._summarizing = False
+            return
+
+        with self._lock:
+            self._summarizing = False
+        # more turns may have arrived while summarizing
+        self._schedule_summary()
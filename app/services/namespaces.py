@@ -0,0 +1,43 @@
+from utils import index_manifest
+from utils.logger import logger
+from config.settings import settings
+from services.resources import registry
+from services.answer_cache import answer_cache
+from services.ingestion_jobs import job_manager
+
+
+def list_namespaces() -> dict:
+    """Vector count of every namespace holding vectors in the configured backend."""
+    vector_store = registry.vector_store
+    if vector_store is None:
+        return {}
+    if settings.VECTOR_STORE_BACKEND == "local":
+        return vector_store.namespaces()
+    stats = registry.pinecone_client.Index(settings.INDEX_NAME).describe_index_stats()
+    return {name: namespace["vector_count"] for name, namespace in stats["namespaces"].items()}
+
+
+def delete_namespace(namespace: str) -> int:
+    """
+    Delete a namespace: cancel its unfinished ingestion jobs and wait for them to stop, then
+    remove its vectors, manifests, BM25 index and cached answers. Other namespaces are not
+    touched and the index is not rebuilt. Returns the number of vectors deleted.
+    """
+    cancelled = [job for job in job_manager.list() if job.namespace == namespace and not job.finished]
+    for job in cancelled:
+        job_manager.cancel(job.job_id)
+    # a cancelled job still finishes its in-flight upserts and saves a manifest of them
+    job_manager.wait(cancelled)
+
+    deleted = list_namespaces().get(namespace, 0)
+    vector_store = registry.vector_store
+    if vector_store is not None and deleted:
+        if settings.VECTOR_STORE_BACKEND == "local":
+            vector_store.delete_namespace(namespace)
+        else:
+            registry.pinecone_client.Index(settings.INDEX_NAME).delete(delete_all=True, namespace=namespace)
+    index_manifest.delete_namespace(namespace)
+    registry.namespace_lexical_index(namespace).clear()
+    answer_cache.invalidate(namespace)
+    logger.info(f"Deleted namespace {namespace!r}: {deleted} vectors.")
+    return deleted
@@ -0,0 +1,126 @@
+import os
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from utils.logger import logger
+
+
+def model_path(directory: str, quantized: bool) -> str:
+    return os.path.join(directory, "model-int8.onnx" if quantized else "model.onnx")
+
+
+def export_model(model_name: str, directory: str, quantized: bool = False, token: str = None) -> str:
+    """
+    Export the transformer of `model_name` to ONNX in `directory`, with its tokenizer, and
+    optionally an int8 copy with dynamically quantized weights. Returns the model path.
+    Needs torch and transformers (installed with sentence-transformers), and onnxruntime.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(directory, exist_ok=True)
+    path = model_path(directory, quantized=False)
+    if not os.path.exists(path):
+        tokenizer = AutoTokenizer.from_pretrained(model_name, token=token)
+        model = AutoModel.from_pretrained(model_name, token=token).eval()
+        sample = tokenizer(["export the embedding model"], return_tensors="pt")
+        names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(sample[name] for name in names),
+                path,
+                input_names=names,
+                output_names=["last_hidden_state"],
+                dynamic_axes={name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]},
+                opset_version=17
+            )
+        tokenizer.save_pretrained(directory)
+        logger.info(f"Exported {model_name} to {path}.")
+    if not quantized:
+        return path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantized_path = model_path(directory, quantized=True)
+    if not os.path.exists(quantized_path):
+        quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+        logger.info(f"Quantized {path} to int8 in {quantized_path}.")
+    return quantized_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    bge-style sentence embeddings (CLS token, L2-normalized, as sentence-transformers computes
+    them for bge) from an ONNX export of the model, run by onnxruntime on the CPU.
+
+    Texts are tokenized once, sorted by length and cut into batches of at most `batch_size`
+    texts and `max_batch_tokens` padded tokens, each padded only to its own longest text,
+    so short texts do not pay for the attention over a long neighbour's padding.
+    """
+    def __init__(self, model_file: str, tokenizer, batch_size: int = 32, max_batch_tokens: int = 16384,
+                 max_length: int = 512, threads: int = 0):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = tokenizer
+        self.pad_token_id = tokenizer.pad_token_id or 0
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_length = min(max_length, tokenizer.model_max_length)
+
+    def _batches(self, lengths: list) -> list:
+        """Indices of the texts grouped into length-sorted batches within the size and token budgets."""
+        batches, batch = [], []
+        for index in sorted(range(len(lengths)), key=lengths.__getitem__):
+            # sorted ascending, so the newest text is the longest of the batch
+            if batch and (len(batch) == self.batch_size or (len(batch) + 1) * lengths[index] > self.max_batch_tokens):
+                batches.append(batch)
+                batch = []
+            batch.append(index)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _run(self, token_ids: list) -> np.ndarray:
+        width = max(len(ids) for ids in token_ids)
+        input_ids = np.full((len(token_ids), width), self.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(token_ids), width), dtype=np.int64)
+        for row, ids in enumerate(token_ids):
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, inputs)[0]
+        cls = hidden[:, 0].astype(np.float32)
+        return cls / np.maximum(np.linalg.norm(cls, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        token_ids = self.tokenizer(texts, truncation=True, max_length=self.max_length)["input_ids"]
+        vectors = [None] * len(texts)
+        for batch in self._batches([len(ids) for ids in token_ids]):
+            for index, vector in zip(batch, self._run([token_ids[index] for index in batch])):
+                vectors[index] = vector
+        return np.stack(vectors).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def load_embeddings(model_name: str, directory: str, quantized: bool, token: str = None, **kwargs) -> OnnxEmbeddings:
+    """OnnxEmbeddings for `model_name`, exporting (and quantizing) the model into `directory` on first use."""
+    from transformers import AutoTokenizer
+
+    path = model_path(directory, quantized)
+    if not os.path.exists(path):
+        logger.info(f"No ONNX export of {model_name} in {directory}, exporting it (once).")
+        path = export_model(model_name, directory, quantized=quantized, token=token)
+    tokenizer = AutoTokenizer.from_pretrained(directory)
+    return OnnxEmbeddings(path, tokenizer, **kwargs)
@@ -1,45 +1,43 @@
-import time
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader, WikipediaLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_pinecone.vectorstores import Pinecone
-import pinecone
+import os
 from utils.logger import logger
+from utils import index_manifest
+from utils.namespaces import resolve_namespace
 from config.settings import settings
-from langchain_huggingface import HuggingFaceEmbeddings
-from huggingface_hub import login
+from services.resources import registry
+from services.ingestion_pipeline import IngestionPipeline
+from services.answer_cache import answer_cache
+from services import document_loaders
+from services.chunking import TokenChunker
 
 
 class Preprocessing:
     """
-    A class to handle preprocessing of documents.
+    A class to handle preprocessing of documents into one namespace of the index.
+    `source` is the path the document is known by (its manifest key and the "source"
+    metadata of its chunks) when the file is read from elsewhere, e.g. a spooled upload.
     """
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, namespace: str = None, source: str = None):
         self.embedding_model_name = settings.EMBEDDING_MODEL_NAME
         self.index_name = settings.INDEX_NAME
+        self.namespace = resolve_namespace(namespace)
         self.file_path = file_path
-        self.pc = pinecone.Pinecone(api_key=settings.PINECONE_KEY)
-        login(token=settings.HF_TOKEN)
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=self.embedding_model_name,
-            model_kwargs={"device": "cpu"}
-        )
+        self.document_path = source or file_path
+        # key of the document in the index manifest
+        self.source = os.path.abspath(self.document_path) if self.document_path else None
+        self.backend = settings.VECTOR_STORE_BACKEND
+        # shared, process-wide clients (loaded once at startup)
+        self.pc = registry.pinecone_client if self.backend == "pinecone" else None
+        self.embeddings = registry.embeddings
+        # chunks are sized in tokens of the embedding model
+        self.chunker = TokenChunker(registry.tokenizer)
+        self.stats = {}
 
     def load_doc(self):
         """Load a document from the specified file path.
         """
         
         try:
-            if self.file_path.endswith(".pdf"):
-                loader = PyPDFLoader(self.file_path)
-            elif self.file_path.endswith(".txt"):
-                loader = TextLoader(self.file_path, encoding='utf-8')
-            elif self.file_path.endswith(".docx"):
-                loader = Docx2txtLoader(self.file_path)
-            else:
-                logger.error("Unsupported file format. Supported formats are: .pdf, .txt, .docx")
-                raise ValueError("Unsupported file format.")
-            
-            docs = loader.load()
+            docs = list(document_loaders.iter_pages(self.file_path))
             logger.info(f"Loaded document from {self.file_path}")
             return docs
         except FileNotFoundError:
@@ -53,44 +51,53 @@ class Preprocessing:
             raise e
         
         
-    def chunk_docs(self, docs, chunk_size=512,chunk_overlap = 50):
+    def chunk_docs(self, docs, chunk_size=None, chunk_overlap=None):
         """
         Chunk the loaded documents into smaller pieces for processing.
         Args:
             docs (List[Document]): List of documents to be chunked.
-            chunk_size (int, optional): Size of each chunk. Defaults to 512.
-            chunk_overlap (int, optional): Overlap between chunks. Defaults to 50.
+            chunk_size (int, optional): Maximum tokens per chunk. Defaults to settings.CHUNK_MAX_TOKENS.
+            chunk_overlap (int, optional): Overlap between chunks, in tokens. Defaults to settings.CHUNK_OVERLAP_TOKENS.
         """
         try:
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-            )
-            
-            chunks = text_splitter.split_documents(docs)
+            chunker = TokenChunker(registry.tokenizer, max_tokens=chunk_size, overlap_tokens=chunk_overlap)
+            chunks = chunker.split_documents(docs)
             logger.info(f"Chunked documents into {len(chunks)} pieces.")
             return chunks
         except Exception as e:
             logger.error(f"Error chunking documents: {e}")
             raise e    
-        
-    def create_embeddings_pinecone(self,chunks):
-        """
-        Create embeddings for the document chunks and store them in Pinecone.
-        Args:
-            chunks (List[Document]): List of document chunks to create embeddings for.
+
+    def iter_pages(self):
+        """Lazily load the document page by page, so the whole file is never held in memory.
+        PDF pages are extracted in parallel and still yielded in order.
         """
         try:
+            for page in document_loaders.iter_pages(self.file_path):
+                page.metadata["source"] = self.document_path
+                yield page
+            logger.info(f"Loaded document from {self.file_path}")
+        except FileNotFoundError:
+            logger.error(f"File not found: {self.file_path}")
+            raise
+        except PermissionError:
+            logger.error(f"Permission denied when accessing the file: {self.file_path}")
+            raise
+        except Exception as e:
+            logger.error(f"Error loading document: {e}")
+            raise e
 
-            
-            logger.info("Testing embeddings...")
-            emb = self.embeddings.embed_query("hello world")
-            logger.info(f"Sample embedding vector (first 5 values): {emb[:5]}")
-            
+    def ensure_pinecone_index(self):
+        """
+        Create the Pinecone index if it does not exist yet. An existing index is
+        never deleted, so it stays available while documents are re-indexed.
+        """
+        import pinecone
+        try:
             if self.index_name in self.pc.list_indexes().names():
-                self.pc.delete_index(self.index_name)
-                logger.info(f"Deleted existing Pinecone index: {self.index_name}")
+                return
 
+            emb = self.embeddings.embed_query("hello world")
             self.pc.create_index(
                 name=self.index_name,
                 dimension=len(emb),
@@ -101,25 +108,95 @@ class Preprocessing:
         ) 
             )
             logger.info(f"Created Pinecone index: {self.index_name}")
-            
-            logger.info("Creating embeddings using HuggingFaceEmbeddings.")
-            vector_store = Pinecone.from_documents(
-                documents=chunks,
-                embedding=self.embeddings,
-                index_name=self.index_name
+            # a store could not be opened before the index existed
+            registry.invalidate("vector_store", "retriever")
+        except Exception as e:
+            logger.error(f"Error creating Pinecone index: {e}")
+            raise e
+
+    def index_pages(self, pages, split, progress=None, cancel_event=None):
+        """
+        Incrementally index a stream of pages in the namespace of the configured vector store backend.
+        Chunk ids are content hashes, so only chunks missing from the document's manifest
+        are embedded and upserted, and only chunks that disappeared from it are deleted.
+        The document's segment of the namespace's BM25 index is built from the same chunks as
+        they are made, and replaces the previous one once every chunk is indexed.
+        Args:
+            pages (Iterable[Document]): Pages (or chunks) of the document.
+            split (Callable[[Document], List[Document]]): Chunker for one page.
+            progress (Callable[[IngestionPipeline], None], optional): Called after every upserted batch.
+            cancel_event (threading.Event, optional): Set it to stop ingestion.
+        """
+        try:
+            if self.backend == "pinecone":
+                self.ensure_pinecone_index()
+            vector_store = registry.vector_store
+
+            indexed = set(index_manifest.load_manifest(self.source, self.namespace))
+            if indexed and self.vector_count() == 0:
+                logger.warning(f"Manifest for {self.source} lists chunks but the index is empty, re-indexing everything.")
+                indexed = set()
+            seen = {}
+            lexical = None
+            if settings.HYBRID_RETRIEVAL_ENABLED:
+                lexical = registry.namespace_lexical_index(self.namespace).builder(self.source)
+
+            pipeline = IngestionPipeline(self.embeddings, vector_store, namespace=self.namespace)
+            try:
+                ids = pipeline.run(
+                    pages,
+                    split=split,
+                    chunk_ids=lambda chunks: index_manifest.chunk_ids(self.source, chunks, seen, self.namespace),
+                    skip_ids=indexed,
+                    progress=progress,
+                    cancel_event=cancel_event,
+                    lexical=lexical
+                )
+            except Exception:
+                # keep track of what was written so a later run can clean it up
+                if pipeline.upserted_ids:
+                    index_manifest.save_manifest(self.source, list(indexed | set(pipeline.upserted_ids)), self.namespace)
+                    answer_cache.invalidate(self.namespace)
+                raise
+
+            current = set(ids)
+            stale_ids = list(indexed - current)
+            if stale_ids:
+                vector_store.delete(ids=stale_ids, namespace=self.namespace)
+            logger.info(
+                f"Indexed {self.source}: {len(current - indexed)} new, {len(stale_ids)} removed, "
+                f"{len(current & indexed)} unchanged chunks."
             )
-            logger.info(f"Created embeddings and stored in Pinecone index: {self.index_name}")
-            #  Get vector count from Pinecone stats
-            index = self.pc.Index(self.index_name)
-            stats = index.describe_index_stats()
 
-            time.sleep(5)  # Wait for a few seconds to ensure stats are updated
-            logger.info(f"Index stats: {stats}")
+            index_manifest.save_manifest(self.source, ids, self.namespace)
+            if lexical is not None:
+                lexical.commit()
+            if current != indexed:
+                # cached answers may rely on chunks that changed
+                answer_cache.invalidate(self.namespace)
+            self.stats = {name: stage.as_dict() for name, stage in pipeline.stats.items()}
+            logger.info(f"Created embeddings and stored in {self.backend} index: {self.index_name}, namespace={self.namespace!r}")
             return vector_store
         except Exception as e:
             logger.error(f"Error creating embeddings: {e}")
             raise e
-        
+
+    def create_embeddings(self, chunks):
+        """
+        Incrementally index already chunked documents.
+        Args:
+            chunks (List[Document]): List of document chunks to create embeddings for.
+        """
+        return self.index_pages(chunks, split=lambda chunk: [chunk])
+
+    def vector_count(self) -> int:
+        """Number of vectors currently stored in the namespace of the configured backend."""
+        if self.backend == "local":
+            return registry.vector_store.count(self.namespace)
+        stats = self.pc.Index(self.index_name).describe_index_stats()
+        namespace = stats["namespaces"].get(self.namespace)
+        return namespace["vector_count"] if namespace else 0
+
     def load_embeddings_pinecone(self):
         """Load existing Pinecone embeddings from the specified directory.
         
@@ -127,30 +204,29 @@ class Preprocessing:
             VectorStore: The vector store containing the embeddings.
         """
         try:
-            # Check if the directory exists
-            if not self.index_name in self.pc.list_indexes().names():
-                print(f"index {self.index_name} does not exist.")
-                return None
-            vector_store = Pinecone.from_existing_index(
-                embedding=self.embeddings,
-                index_name=self.index_name
-            )
-            logger.info(f"loaded embeddings from Pinecone index: {self.index_name}")
-            return vector_store
+            return registry.vector_store
         except Exception as e:
             logger.error(f"Error loading embeddings: {e}")
             raise e
         
-    def preprocess(self):
+    def preprocess(self, progress=None, cancel_event=None):
         """Complete preprocessing pipeline: load document, chunk it, and create/load embeddings.
+        Args:
+            progress (Callable[[IngestionPipeline], None], optional): Called after every upserted batch.
+            cancel_event (threading.Event, optional): Set it to stop ingestion.
         
         Returns:
             VectorStore: The vector store containing the embeddings.
         """
         try:
-                docs = self.load_doc()
-                chunks = self.chunk_docs(docs)
-                vector_store = self.create_embeddings_pinecone(chunks)
+                # pages are loaded, chunked, embedded and upserted as a stream; the chunker
+                # tokenizes pages in batches, so its chunks are passed on as they are
+                vector_store = self.index_pages(
+                    self.chunker.iter_chunks(self.iter_pages()),
+                    split=lambda chunk: [chunk],
+                    progress=progress,
+                    cancel_event=cancel_event
+                )
                 return vector_store
         except Exception as e:
             logger.error(f"Error in preprocessing pipeline: {e}")
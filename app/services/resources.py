@@ -0,0 +1,318 @@
+import os
+import threading
+import time
+from services.local_vector_store import LocalVectorStore
+from services.lexical_index import BM25Index
+from services.ingestion_pipeline import fetch_documents
+from services.hybrid_retriever import HybridRetriever
+from services.embeddings import CachedEmbeddings, MicroBatchedEmbeddings, TimedEmbeddings
+from services.chunking import ApproximateTokenizer
+from utils.embedding_cache import EmbeddingCache
+from utils.logger import logger
+from config.settings import settings
+
+
+def embedding_cache_name() -> str:
+    """
+    Model name the embedding cache keys vectors by. int8 vectors differ slightly from the
+    full-precision ones, so they are cached apart; torch and fp32 ONNX share their vectors.
+    """
+    if settings.EMBEDDING_BACKEND == "onnx-int8":
+        return f"{settings.EMBEDDING_MODEL_NAME}#int8"
+    return settings.EMBEDDING_MODEL_NAME
+
+
+class ResourceRegistry:
+    """
+    Process-wide registry for the heavy objects shared by every request:
+    embedding model, Pinecone client, Gemini chat model, vector store, lexical index and retriever.
+    Each resource is created once, on first use or during warm_up(), and reused afterwards.
+    The client libraries (torch, langchain integrations, Pinecone, Gemini) are imported by
+    the factories, so importing the app stays fast and they load during the warm-up.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._resources = {}
+        self._overrides = {}
+        self._status = {}  # name -> {"state": "loading" | "warm" | "absent" | "failed", ...}
+        self.warm_up_state = "pending"
+        self.warm_up_ms = {}  # component -> milliseconds spent in warm_up()
+
+    def _get_or_create(self, name: str, factory):
+        """Return the cached resource `name`, building it with `factory` the first time."""
+        resource = self._resources.get(name)
+        if resource is not None:
+            return resource
+
+        with self._lock:
+            resource = self._resources.get(name)
+            if resource is None:
+                start = time.perf_counter()
+                self._status[name] = {"state": "loading"}
+                try:
+                    resource = self._overrides.get(name, factory)()
+                except Exception as e:
+                    self._status[name] = {"state": "failed", "error": str(e) or type(e).__name__}
+                    raise
+                milliseconds = round((time.perf_counter() - start) * 1000)
+                if resource is not None:
+                    self._resources[name] = resource
+                    logger.info(f"Loaded shared resource '{name}' in {milliseconds} ms.")
+                self._status[name] = {"state": "warm" if resource is not None else "absent", "load_ms": milliseconds}
+            return resource
+
+    def status(self, name: str) -> dict:
+        """Load state of resource `name`; never blocks on a resource being built."""
+        if name in self._resources:
+            return self._status.get(name, {"state": "warm"})
+        status = self._status.get(name, {"state": "cold"})
+        # an invalidated resource is cold again until it is rebuilt
+        return {"state": "cold"} if status["state"] == "warm" else status
+
+    def override(self, name: str, factory):
+        """
+        Build resource `name` with `factory` instead of its default factory, now and after
+        every invalidation (used by the offline benchmarks to swap in stand-ins for the models
+        and Pinecone).
+        """
+        with self._lock:
+            self._overrides[name] = factory
+            self._resources.pop(name, None)
+            self._status.pop(name, None)
+
+    def invalidate(self, *names: str):
+        """
+        Drop cached resources so they are rebuilt on next access (e.g. after re-indexing).
+        Invalidating "retriever" also drops the per-namespace retrievers ("retriever:<namespace>").
+        """
+        with self._lock:
+            for name in names:
+                self._resources.pop(name, None)
+                for key in [key for key in self._resources if key.startswith(f"{name}:")]:
+                    del self._resources[key]
+
+    @property
+    def embeddings(self):
+        def factory():
+            from huggingface_hub import login
+            login(token=settings.HF_TOKEN)
+            embeddings = self._embedding_model()
+            if settings.QUERY_BATCHING_ENABLED:
+                embeddings = MicroBatchedEmbeddings(
+                    embeddings,
+                    max_batch=settings.QUERY_BATCH_MAX,
+                    max_wait=settings.QUERY_BATCH_WAIT_MS / 1000
+                )
+            if settings.EMBEDDING_CACHE_ENABLED:
+                embeddings = CachedEmbeddings(
+                    embeddings,
+                    model_name=embedding_cache_name(),
+                    cache=EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_BYTES),
+                    query_cache_size=settings.QUERY_EMBEDDING_CACHE_SIZE
+                )
+            return TimedEmbeddings(embeddings)
+        return self._get_or_create("embeddings", factory)
+
+    @staticmethod
+    def _embedding_model():
+        """Embedding model on the runtime selected by settings.EMBEDDING_BACKEND."""
+        backend = settings.EMBEDDING_BACKEND
+        if backend in ("onnx", "onnx-int8"):
+            try:
+                from services import onnx_embeddings
+                return onnx_embeddings.load_embeddings(
+                    settings.EMBEDDING_MODEL_NAME,
+                    settings.EMBEDDING_ONNX_DIR,
+                    quantized=backend == "onnx-int8",
+                    token=settings.HF_TOKEN,
+                    batch_size=settings.EMBEDDING_BATCH_SIZE,
+                    max_batch_tokens=settings.EMBEDDING_MAX_BATCH_TOKENS,
+                    threads=settings.EMBEDDING_THREADS
+                )
+            except ImportError as e:
+                logger.warning(f"EMBEDDING_BACKEND={backend} needs onnxruntime and transformers ({e}), using torch.")
+        elif backend != "torch":
+            logger.warning(f"Unknown EMBEDDING_BACKEND {backend!r}, using torch.")
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=settings.EMBEDDING_MODEL_NAME,
+            model_kwargs={"device": "cpu"},
+            encode_kwargs={"batch_size": settings.EMBEDDING_BATCH_SIZE}
+        )
+
+    @property
+    def tokenizer(self):
+        """Tokenizer of the embedding model, used to size chunks."""
+        def factory():
+            try:
+                from transformers import AutoTokenizer
+            except ImportError:
+                logger.warning("transformers is not installed, chunk sizes are approximated.")
+                return ApproximateTokenizer()
+            return AutoTokenizer.from_pretrained(settings.EMBEDDING_MODEL_NAME, token=settings.HF_TOKEN)
+        return self._get_or_create("tokenizer", factory)
+
+    @property
+    def pinecone_client(self):
+        def factory():
+            import pinecone
+            return pinecone.Pinecone(api_key=settings.PINECONE_KEY)
+        return self._get_or_create("pinecone_client", factory)
+
+    @staticmethod
+    def _chat_model(**kwargs):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(google_api_key=settings.GOOGLE_API_KEY, **kwargs)
+
+    @property
+    def llm(self):
+        return self._get_or_create(
+            "llm",
+            lambda: self._chat_model(
+                model=settings.MODEL_NAME,
+                temperature=settings.TEMPERATURE,
+                max_output_tokens=settings.MAX_TOKENS
+            )
+        )
+
+    @property
+    def condense_llm(self):
+        """Model used to rewrite follow-up questions: the main LLM unless CONDENSE_MODEL_NAME is set."""
+        if not settings.CONDENSE_MODEL_NAME:
+            return self.llm
+        return self._get_or_create(
+            "condense_llm",
+            lambda: self._chat_model(
+                model=settings.CONDENSE_MODEL_NAME,
+                temperature=0,
+                max_output_tokens=256
+            )
+        )
+
+    @property
+    def vector_store(self):
+        """
+        Vector store for the configured backend (settings.VECTOR_STORE_BACKEND),
+        or None if the Pinecone index has not been created yet.
+        """
+        def factory():
+            if settings.VECTOR_STORE_BACKEND == "local":
+                # memory-mapped, so opening the index costs no RAM for the vectors
+                return LocalVectorStore(path=settings.LOCAL_INDEX_DIR, embedding=self.embeddings)
+
+            if settings.INDEX_NAME not in self.pinecone_client.list_indexes().names():
+                logger.warning(f"index {settings.INDEX_NAME} does not exist.")
+                return None
+            from langchain_pinecone.vectorstores import Pinecone
+            vector_store = Pinecone.from_existing_index(
+                embedding=self.embeddings,
+                index_name=settings.INDEX_NAME
+            )
+            logger.info(f"loaded embeddings from Pinecone index: {settings.INDEX_NAME}")
+            return vector_store
+        return self._get_or_create("vector_store", factory)
+
+    @property
+    def lexical_index(self):
+        """BM25 index of the default namespace."""
+        return self.namespace_lexical_index("")
+
+    def namespace_lexical_index(self, namespace: str):
+        """
+        BM25 index of a namespace: LEXICAL_INDEX_DIR itself for the default one, else a subdirectory.
+        It keeps term statistics only and reads the texts of its results from the vector store.
+        """
+        path = os.path.join(settings.LEXICAL_INDEX_DIR, namespace) if namespace else settings.LEXICAL_INDEX_DIR
+        return self._get_or_create(
+            f"lexical_index:{namespace}",
+            lambda: BM25Index(
+                path,
+                fetch=lambda ids: fetch_documents(self.vector_store, ids, namespace),
+                k1=settings.BM25_K1,
+                b=settings.BM25_B
+            )
+        )
+
+    def _build_retriever(self, namespace: str, metadata_filter: dict = None):
+        vector_store = self.vector_store
+        if vector_store is None:
+            return None
+        search_kwargs = {"namespace": namespace}
+        if metadata_filter:
+            search_kwargs["filter"] = metadata_filter
+        if not settings.HYBRID_RETRIEVAL_ENABLED:
+            return vector_store.as_retriever(
+                search_type="similarity",
+                search_kwargs={"k": settings.RETRIEVER_K, **search_kwargs}
+            )
+        return HybridRetriever(
+            vector_retriever=vector_store.as_retriever(
+                search_type="similarity",
+                search_kwargs={"k": settings.HYBRID_FETCH_K, **search_kwargs}
+            ),
+            lexical_index=self.namespace_lexical_index(namespace),
+            k=settings.RETRIEVER_K,
+            fetch_k=settings.HYBRID_FETCH_K,
+            rrf_k=settings.RRF_K,
+            filter=metadata_filter
+        )
+
+    @property
+    def retriever(self):
+        """Retriever over settings.DEFAULT_NAMESPACE."""
+        return self.namespace_retriever(settings.DEFAULT_NAMESPACE)
+
+    def namespace_retriever(self, namespace: str, metadata_filter: dict = None):
+        """
+        Retriever scoped to a namespace, and to chunks matching `metadata_filter` if given.
+        Unfiltered retrievers are cached per namespace; filtered ones are cheap to build and are not.
+        """
+        if metadata_filter:
+            return self._build_retriever(namespace, metadata_filter)
+        return self._get_or_create(f"retriever:{namespace}", lambda: self._build_retriever(namespace))
+
+    def warm_up(self):
+        """
+        Load every shared resource and run one embedding so the first request
+        doesn't pay for model loading. Runs in the background while the server already
+        accepts connections: a component that fails is logged and loaded again on first use.
+        The time spent per component is kept in warm_up_ms and logged as the startup breakdown.
+        """
+        self.warm_up_state = "running"
+        steps = [("embeddings", lambda: self.embeddings.embed_query("warm up"))]
+        if settings.VECTOR_STORE_BACKEND == "pinecone":
+            steps.append(("pinecone_client", lambda: self.pinecone_client))
+        steps += [
+            ("llm", lambda: self.llm),
+            ("condense_llm", lambda: self.condense_llm),
+            ("vector_store", lambda: self.vector_store),
+            ("retriever", lambda: self.retriever),
+            ("tokenizer", lambda: self.tokenizer),
+        ]
+        start = time.perf_counter()
+        failed = []
+        for name, step in steps:
+            step_start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                failed.append(name)
+                logger.error(f"Error warming up '{name}', it will be loaded on first use: {e}", exc_info=True)
+            self.warm_up_ms[name] = round((time.perf_counter() - step_start) * 1000)
+        if self.status("vector_store")["state"] == "absent":
+            logger.warning("Retriever not available yet, it will be created after the first preprocessing.")
+        self.warm_up_state = "failed" if failed else "done"
+        breakdown = ", ".join(f"{name} {milliseconds} ms" for name, milliseconds in self.warm_up_ms.items())
+        logger.info(f"Shared resources warmed up in {(time.perf_counter() - start) * 1000:.0f} ms ({breakdown}).")
+
+    def readiness(self) -> dict:
+        """
+        Whether the embedding model, vector store and LLM client are loaded. A missing
+        Pinecone index counts as ready: the server can ingest, and chat finds no documents.
+        """
+        components = {name: self.status(name) for name in ("embeddings", "vector_store", "llm")}
+        ready = all(component["state"] in ("warm", "absent") for component in components.values())
+        return {"ready": ready, "warm_up": self.warm_up_state, "components": components, "warm_up_ms": dict(self.warm_up_ms)}
+
+
+registry = ResourceRegistry()
@@ -0,0 +1,201 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils.logger import logger
+from utils.metrics import metrics
+from config.settings import settings
+
+
+_admission_wait = metrics.histogram("chat_admission_wait_seconds", "Time chat turns waited for admission.")
+_rejected = metrics.counter("chat_rejected_total", "Chat turns rejected because a wait queue was full.", ("queue",))
+
+
+class SchedulerBusy(Exception):
+    """Raised when a question cannot be queued because the queue it needs is full."""
+
+
+class _QueueFull(Exception):
+    """Raised by _Limiter.acquire() when it would have to wait in a full queue."""
+
+
+class _Limiter:
+    """
+    FIFO counting semaphore for the event loop with a bounded wait queue.
+    A released slot is handed directly to the oldest waiter, so waiters are served in order;
+    acquire() raises _QueueFull instead of waiting once `max_waiting` acquirers already wait.
+    """
+    def __init__(self, limit: int, max_waiting: int):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.waiters = deque()
+
+    @property
+    def idle(self) -> bool:
+        return self.active == 0 and not self.waiters
+
+    def full(self) -> bool:
+        """Whether an acquire() now would have to wait in a queue that is already full."""
+        return self.active >= self.limit and len(self.waiters) >= self.max_waiting
+
+    async def acquire(self):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        # checked here, where the slot is taken, so no caller can queue past the bound
+        if len(self.waiters) >= self.max_waiting:
+            raise _QueueFull()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just before the cancellation, pass it on
+                self.release()
+            else:
+                self.waiters.remove(waiter)
+            raise
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class AnswerScheduler:
+    """
+    Admission control for chat turns.
+
+    A turn first takes a slot of its session (at most `session_concurrent` turns of one session
+    run at once, later ones wait in order), then a global slot (at most `max_concurrent` turns
+    run at once, which caps concurrent LLM and vector store calls). Both waits use bounded
+    queues; a turn that would overflow one is rejected with SchedulerBusy instead of piling up
+    until it times out. Blocking turn work runs on `executor`, sized to the global limit,
+    instead of the default asyncio executor.
+    """
+    def __init__(self, max_concurrent: int = None, max_queued: int = None, session_concurrent: int = None,
+                 session_max_queued: int = None, wait_window: int = 1000):
+        self.max_concurrent = max_concurrent or settings.CHAT_MAX_CONCURRENT
+        self.max_queued = settings.CHAT_MAX_QUEUED if max_queued is None else max_queued
+        self.session_concurrent = session_concurrent or settings.CHAT_SESSION_MAX_CONCURRENT
+        self.session_max_queued = settings.CHAT_SESSION_MAX_QUEUED if session_max_queued is None else session_max_queued
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="answer")
+        self._global = _Limiter(self.max_concurrent, self.max_queued)
+        self._sessions = {}  # session_id -> _Limiter, dropped when idle
+        self._waits = deque(maxlen=wait_window)  # recent admission waits, in seconds
+        self.admitted = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def admit(self, session_id: str):
+        """
+        Hold a session slot and a global slot for the duration of the block.
+        Yields the seconds spent waiting for admission.
+        Raises:
+            SchedulerBusy: If the session's queue or the global queue is full.
+        """
+        # fail fast when the global queue is already full, rather than after the session wait
+        if self._global.full():
+            self._reject("global")
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Limiter(self.session_concurrent, self.session_max_queued)
+
+        start = time.perf_counter()
+        try:
+            await session.acquire()
+        except _QueueFull:
+            self._reject("session")
+        except asyncio.CancelledError:
+            self._drop_if_idle(session_id, session)
+            raise
+        try:
+            try:
+                await self._global.acquire()
+            except _QueueFull:
+                self._reject("global")
+            try:
+                waited = time.perf_counter() - start
+                self._waits.append(waited)
+                _admission_wait.observe(waited)
+                self.admitted += 1
+                if waited >= 0.1:
+                    logger.info(f"Question admitted after {waited * 1000:.0f} ms in queue. session_id={session_id}")
+                yield waited
+            finally:
+                self._global.release()
+        finally:
+            session.release()
+            self._drop_if_idle(session_id, session)
+
+    def _reject(self, queue: str):
+        self.rejected += 1
+        _rejected.inc(queue=queue)
+        if queue == "session":
+            raise SchedulerBusy(f"Too many questions queued for this session (limit {self.session_max_queued}), wait for the previous answers.")
+        raise SchedulerBusy("Server busy, too many questions queued. Try again shortly.")
+
+    def _drop_if_idle(self, session_id: str, session: _Limiter):
+        if session.idle and self._sessions.get(session_id) is session:
+            del self._sessions[session_id]
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+
+        def percentile(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1) if waits else 0.0
+
+        return {
+            "active": self._global.active,
+            "queued": len(self._global.waiters),
+            "session_queued": sum(len(session.waiters) for session in self._sessions.values()),
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "coalesced": coalescer.coalesced,
+            "wait_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)},
+        }
+
+
+class RequestCoalescer:
+    """
+    Collapses identical in-flight questions into one upstream call.
+    The first caller for a key becomes the leader and computes the answer; callers arriving
+    while it runs get the same Future and wait for its result. A leader that fails or is
+    cancelled resolves the Future with None, and its followers then answer on their own.
+    Thread-safe, so it works for both the threaded and the streaming answer paths.
+    """
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def join(self, key):
+        """Return (future, is_leader) for `key`."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def finish(self, key, future: Future, result=None):
+        """Publish the leader's result (None on failure) and stop coalescing on `key`."""
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if not future.done():
+            future.set_result(result)
+
+
+scheduler = AnswerScheduler()
+coalescer = RequestCoalescer()
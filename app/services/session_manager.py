@@ -0,0 +1,137 @@
+import time
+import threading
+from collections import OrderedDict
+from utils.logger import logger
+from config.settings import settings
+
+
+class SessionState:
+    """
+    A session's conversation memory and the history version it was built from (None with
+    the file history backend). `lock` serializes refreshing the memory and saving turns.
+    """
+    def __init__(self, memory, version: int = None):
+        self.memory = memory
+        self.version = version
+        self.lock = threading.RLock()
+
+
+def _memory_size(memory) -> int:
+    """Approximate size in bytes of a session memory (its message and summary text)."""
+    if isinstance(memory, SessionState):
+        memory = memory.memory
+    if hasattr(memory, "chat_memory"):
+        messages = memory.chat_memory.messages
+    else:
+        messages = getattr(memory, "messages", [])
+    size = sum(len(message.content) for message in messages)
+    return size + len(getattr(memory, "summary", ""))
+
+
+class SessionManager:
+    """
+    Bounded in-memory registry of conversation memories, keyed by session id.
+    Sessions are evicted least recently used first when there are more than `max_sessions`
+    or their total size exceeds `max_bytes`, and expire after `ttl` seconds without use.
+    A session's size is measured when it is stored or used, and the total is kept running.
+    Evicted sessions can still be resumed: their memory is rebuilt from the history file.
+    """
+    def __init__(self, max_sessions: int = None, ttl: float = None, max_bytes: int = None):
+        self.max_sessions = max_sessions or settings.SESSION_CACHE_MAX
+        self.ttl = ttl or settings.SESSION_TTL_SECONDS
+        self.max_bytes = max_bytes or settings.SESSION_CACHE_MAX_BYTES
+        self._sessions = OrderedDict()  # session_id -> (SessionState or memory, last access time, size)
+        self._bytes = 0
+        self._building = {}  # session_id -> lock held while its memory is built
+        self._lock = threading.Lock()
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id: str):
+        memory = self.get(session_id)
+        if memory is None:
+            raise KeyError(session_id)
+        return memory
+
+    def __setitem__(self, session_id: str, memory):
+        with self._lock:
+            self._remove(session_id)
+            self._store(session_id, memory)
+            self._evict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str):
+        """Return the session memory and mark it as recently used, or None."""
+        with self._lock:
+            self._expire()
+            entry = self._remove(session_id)
+            if entry is None:
+                return None
+            self._store(session_id, entry[0])
+            self._evict()
+            return entry[0]
+
+    def get_or_create(self, session_id: str, factory):
+        """
+        Return the session memory, building it with `factory()` if it is not cached.
+        Concurrent first requests for a session build it once: the others wait for it.
+        """
+        memory = self.get(session_id)
+        if memory is not None:
+            return memory
+        with self._lock:
+            building = self._building.setdefault(session_id, threading.Lock())
+        try:
+            with building:
+                memory = self.get(session_id)
+                if memory is None:
+                    memory = factory()
+                    self[session_id] = memory
+                return memory
+        finally:
+            with self._lock:
+                if self._building.get(session_id) is building:
+                    del self._building[session_id]
+
+    def pop(self, session_id: str, default=None):
+        with self._lock:
+            entry = self._remove(session_id)
+        return default if entry is None else entry[0]
+
+    def _store(self, session_id: str, memory):
+        size = _memory_size(memory)
+        self._sessions[session_id] = (memory, time.monotonic(), size)
+        self._bytes += size
+
+    def _remove(self, session_id: str):
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+        return entry
+
+    def _pop_oldest(self):
+        session_id, entry = self._sessions.popitem(last=False)
+        self._bytes -= entry[2]
+        return session_id
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._sessions:
+            _, last_access, _ = next(iter(self._sessions.values()))
+            if now - last_access < self.ttl:
+                break
+            session_id = self._pop_oldest()
+            logger.info(f"Session {session_id} expired from memory.")
+
+    def _evict(self):
+        self._expire()
+        while len(self._sessions) > self.max_sessions:
+            session_id = self._pop_oldest()
+            logger.info(f"Session {session_id} evicted from memory (session limit).")
+
+        while self._bytes > self.max_bytes and len(self._sessions) > 1:
+            session_id = self._pop_oldest()
+            logger.info(f"Session {session_id} evicted from memory (memory cap).")
@@ -0,0 +1,211 @@
+import os
+import re
+import time
+import uuid
+import asyncio
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import MultipartParseError
+from services import document_loaders
+from utils.logger import logger
+from config.settings import settings
+
+
+class InvalidUpload(Exception):
+    """Raised when an upload request is malformed or holds an unsupported file."""
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the file, request or file-count limits."""
+
+
+def safe_filename(filename: str) -> str:
+    """Basename of a client-supplied filename, restricted to letters, digits, '.', '-' and '_'."""
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename.replace("\\", "/")))
+    return name.lstrip(".")
+
+
+class SpooledFile:
+    """
+    One uploaded file, written to the spool directory while it is received and moved to
+    a directory of its own once complete, so concurrent uploads of the same file name never
+    overwrite each other. `source` is the path the document is known by in the index
+    (upload directory + file name); the ingestion job moves the file there once indexed.
+    """
+    def __init__(self, filename: str, spool_dir: str, upload_dir: str):
+        self.filename = filename
+        upload_id = uuid.uuid4().hex
+        self.spool_path = os.path.join(spool_dir, f"{upload_id}.part")
+        self.path = os.path.join(spool_dir, upload_id, filename)
+        self.source = os.path.join(upload_dir, filename)
+        self.bytes = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        self.buffer = bytearray()
+        self.file = open(self.spool_path, "wb")
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+
+    def finish(self):
+        """Write the remaining bytes and move the file to its own directory."""
+        self.flush()
+        self.file.close()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        os.replace(self.spool_path, self.path)
+        self.finished_at = time.time()
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.spool_path):
+            os.remove(self.spool_path)
+
+    def as_dict(self) -> dict:
+        seconds = (self.finished_at or time.time()) - self.started_at
+        return {
+            "filename": self.filename,
+            "bytes": self.bytes,
+            "upload_seconds": round(seconds, 3),
+            "upload_mb_per_sec": round(self.bytes / 1e6 / seconds, 2) if seconds else 0.0,
+        }
+
+
+class MultipartSpooler:
+    """
+    Streams a multipart/form-data body to disk without holding whole files in memory.
+
+    Body chunks are fed to python-multipart as they arrive; file data is buffered per file
+    and written to the spool directory in writes of `chunk_bytes`, off the event loop.
+    Files are yielded as soon as their part ends, so they can be ingested while the rest
+    of the request is still being received. Non-file form fields are ignored.
+    """
+    def __init__(self, content_type: str, upload_dir: str = None, max_file_bytes: int = None,
+                 max_request_bytes: int = None, max_files: int = None, chunk_bytes: int = None):
+        _, params = parse_options_header(content_type or "")
+        self.boundary = params.get(b"boundary")
+        if not self.boundary:
+            raise InvalidUpload("Expected a multipart/form-data body with a boundary.")
+        self.upload_dir = upload_dir or settings.UPLOAD_DIR
+        self.spool_dir = os.path.join(self.upload_dir, ".spool")
+        self.max_file_bytes = max_file_bytes or settings.UPLOAD_MAX_FILE_BYTES
+        self.max_request_bytes = max_request_bytes or settings.UPLOAD_MAX_REQUEST_BYTES
+        self.max_files = max_files or settings.UPLOAD_MAX_FILES
+        self.chunk_bytes = chunk_bytes or settings.UPLOAD_CHUNK_BYTES
+        self.bytes_received = 0
+        self.files = []
+        self._current = None
+        self._headers = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._to_write = []
+        self._completed = []
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    # ---------- parser callbacks (run synchronously inside parser.write) ----------
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._current = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name, self._header_value = b"", b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" not in options:
+            return
+        filename = safe_filename(options[b"filename"].decode("utf-8", errors="replace"))
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in document_loaders.supported_formats():
+            raise InvalidUpload(
+                f"Unsupported file format: {filename or 'unnamed file'}. "
+                f"Supported formats are: {', '.join(document_loaders.supported_formats())}"
+            )
+        if any(spooled.filename == filename for spooled in self.files):
+            raise InvalidUpload(f"Duplicate file name in request: {filename}")
+        if len(self.files) >= self.max_files:
+            raise UploadTooLarge(f"Too many files, at most {self.max_files} per request.")
+        self._current = SpooledFile(filename, self.spool_dir, self.upload_dir)
+        self.files.append(self._current)
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        spooled = self._current
+        if spooled is None:
+            return
+        spooled.bytes += end - start
+        if spooled.bytes > self.max_file_bytes:
+            raise UploadTooLarge(f"{spooled.filename} exceeds the {self.max_file_bytes} byte limit per file.")
+        spooled.buffer += data[start:end]
+        if len(spooled.buffer) >= self.chunk_bytes:
+            self._to_write.append((spooled, bytes(spooled.buffer)))
+            spooled.buffer.clear()
+
+    def _on_part_end(self):
+        if self._current is not None:
+            self._completed.append(self._current)
+            self._current = None
+
+    # ---------- driving the parser ----------
+
+    def _write_pending(self, writes: list, completed: list):
+        for spooled, data in writes:
+            spooled.file.write(data)
+        for spooled in completed:
+            spooled.finish()
+
+    async def receive(self, stream):
+        """
+        Consume the request body stream and yield each SpooledFile once it is complete.
+        Raises:
+            InvalidUpload: If the body is malformed or holds an unsupported or duplicate file.
+            UploadTooLarge: If a size or file-count limit is exceeded.
+        """
+        parser = MultipartParser(self.boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+        try:
+            async for chunk in stream:
+                self.bytes_received += len(chunk)
+                if self.bytes_received > self.max_request_bytes:
+                    raise UploadTooLarge(f"Request body exceeds the {self.max_request_bytes} byte limit.")
+                parser.write(chunk)
+                if self._to_write or self._completed:
+                    writes, completed = self._to_write, self._completed
+                    self._to_write, self._completed = [], []
+                    await asyncio.to_thread(self._write_pending, writes, completed)
+                    for spooled in completed:
+                        yield spooled
+            parser.finalize()
+        except MultipartParseError as e:
+            self.discard()
+            raise InvalidUpload(f"Malformed multipart body: {e}") from e
+        except Exception as e:
+            if not isinstance(e, (InvalidUpload, UploadTooLarge)):
+                logger.error(f"Error receiving upload: {e}")
+            self.discard()
+            raise
+        if self._current is not None:
+            self.discard()
+            raise InvalidUpload("Request body ended in the middle of a file.")
+        if not self.files:
+            raise InvalidUpload("No files in the request.")
+
+    def discard(self):
+        """Delete the spool files of incomplete uploads; completed files are kept."""
+        for spooled in self.files:
+            if spooled.finished_at is None:
+                spooled.discard()
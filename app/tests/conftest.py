@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# tests import the app's modules the way it runs them, from the app directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fakes  # noqa: E402
+
+# before any app module opens its files: nothing a test writes lands in the repository
+fakes.isolate(tempfile.mkdtemp(prefix="chat-with-files-tests-"))
+
+from config.settings import settings  # noqa: E402
+
+# the log listener writes from its own thread, after pytest may have closed a test's captured output
+settings.LOG_LEVEL = "WARNING"
+
+
+@pytest.fixture(scope="session")
+def http():
+    """The app behind a test client; started once, since shutdown stops its worker pools for good."""
+    from fastapi.testclient import TestClient
+    from main import app
+
+    fakes.install()
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def shared_history(request, tmp_path, monkeypatch):
+    """The shared history backend every worker uses, over a temporary store."""
+    from utils import history_manager
+
+    server = None
+    monkeypatch.setattr(settings, "HISTORY_BACKEND", request.param)
+    monkeypatch.setattr(settings, "HISTORY_DB_PATH", str(tmp_path / "history.db"))
+    if request.param == "redis":
+        server = fakes.RespServer().start()
+        monkeypatch.setattr(settings, "REDIS_URL", server.url)
+    monkeypatch.setattr(history_manager, "_shared", None)
+    fakes.install()
+    yield history_manager.shared_backend()
+    if server is not None:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from benchmarks import fakes
+from config.settings import settings
+from services import conversation_answering
+from services.answer_cache import AnswerCache
+from services.conversation_answering import ConversationAnswering
+
+
+def _vector(i: int, dim: int = 8) -> np.ndarray:
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i % dim] = 1.0
+    return vector
+
+
+def _put(cache, i: int, namespace: str = ""):
+    cache.put(_vector(i), f"q{i}", f"a{i}", [], cache.namespace_version(namespace), namespace)
+
+
+def test_lookup_is_scoped_to_the_namespace():
+    cache = AnswerCache(max_entries=8, threshold=0.9)
+    _put(cache, 0, "a")
+    assert cache.get(_vector(0), "a")["answer"] == "a0"
+    assert cache.get(_vector(0), "b") is None
+    assert cache.get(_vector(1), "a") is None
+
+
+def test_invalidating_a_namespace_keeps_the_others():
+    cache = AnswerCache(max_entries=8, threshold=0.9)
+    _put(cache, 0, "a")
+    _put(cache, 1, "b")
+    cache.invalidate("a")
+    assert cache.get(_vector(0), "a") is None
+    assert cache.get(_vector(1), "b")["answer"] == "a1"
+
+    # slots of the dropped namespace are reused
+    for i in range(7):
+        _put(cache, i, "a")
+    assert cache.evictions == 0
+
+
+def test_answer_generated_before_an_invalidation_is_dropped():
+    cache = AnswerCache(max_entries=8, threshold=0.9)
+    version = cache.namespace_version("a")
+    cache.invalidate("a")
+    cache.put(_vector(0), "q0", "stale", [], version, "a")
+    assert cache.get(_vector(0), "a") is None
+
+    version = cache.namespace_version("a")
+    cache.invalidate()  # every namespace
+    cache.put(_vector(0), "q0", "stale", [], version, "a")
+    assert cache.get(_vector(0), "a") is None
+
+
+def test_invalidation_on_another_worker_drops_the_namespace(shared_history):
+    worker, other_worker = AnswerCache(max_entries=8, threshold=0.9), AnswerCache(max_entries=8, threshold=0.9)
+    _put(worker, 0, "a")
+    _put(worker, 1, "b")
+    version = worker.namespace_version("a")
+
+    other_worker.invalidate("a")
+    assert worker.namespace_version("a") != version
+    assert worker.get(_vector(0), "a") is None
+    assert worker.get(_vector(1), "b")["answer"] == "a1"
+    worker.put(_vector(0), "q0", "stale", [], version, "a")  # generated before the invalidation
+    assert worker.get(_vector(0), "a") is None
+
+    _put(worker, 2, "b")
+    other_worker.invalidate()  # every namespace
+    worker.namespace_version("b")
+    assert worker.get(_vector(2), "b") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(max_entries=3, threshold=0.9)
+    for i in range(3):
+        _put(cache, i, "a" if i % 2 else "b")
+    cache.get(_vector(0), "b")  # q0 is now more recent than q1
+    _put(cache, 3, "a")
+
+    assert cache.evictions == 1
+    assert cache.get(_vector(1), "a") is None
+    assert cache.get(_vector(0), "b")["answer"] == "a0"
+    assert cache.get(_vector(3), "a")["answer"] == "a3"
+    assert cache.stats()["entries"] == 3
+
+
+@pytest.fixture
+def lookup(monkeypatch):
+    fakes.install()
+    monkeypatch.setattr(settings, "ANSWER_CACHE_ENABLED", True)
+    cache = AnswerCache(max_entries=8, threshold=0.9)
+    monkeypatch.setattr(conversation_answering, "answer_cache", cache)
+
+    def lookup(chat_history="", metadata_filter=None, use_cache=True):
+        conversation = SimpleNamespace(vector_store=None, metadata_filter=metadata_filter, namespace="docs")
+        return ConversationAnswering._cache_lookup(conversation, "What is attention?", chat_history, use_cache)
+    return lookup
+
+
+def test_first_turn_without_filter_is_cacheable(lookup):
+    entry, embedding, version = lookup()
+    assert entry is None
+    assert embedding is not None
+    assert version == (0, 0, ())
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"chat_history": "Human: hello\nAssistant: hi"},
+    {"metadata_filter": {"source": "paper.pdf"}},
+    {"use_cache": False},
+])
+def test_follow_ups_filters_and_bypass_skip_the_cache(lookup, kwargs):
+    assert lookup(**kwargs) == (None, None, None)
@@ -0,0 +1,61 @@
+import json
+import asyncio
+from config.settings import settings
+
+
+def _lines(response) -> list:
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_every_question_gets_a_line_then_the_stats(http):
+    from services.scheduler import scheduler
+
+    admitted = scheduler.admitted
+    questions = [f"What does layer {i} do?" for i in range(6)]
+    lines = _lines(http.post("/api/qa/batch", json={"questions": questions}))
+
+    answers, stats = lines[:-1], lines[-1]
+    assert sorted(line["index"] for line in answers) == list(range(6))
+    assert all(line["type"] == "answer" and line["answer"] for line in answers)
+    assert stats["type"] == "stats" and (stats["answered"], stats["errors"]) == (6, 0)
+    assert scheduler.admitted - admitted == 6
+
+
+def test_embedding_failure_is_reported_per_question(http, monkeypatch):
+    from services import batch_answering
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("embedding service unavailable")
+
+    monkeypatch.setattr(batch_answering, "embed_queries", fail)
+    lines = _lines(http.post("/api/qa/batch", json={"questions": ["first?", "second?"]}))
+
+    assert [line["index"] for line in lines[:-1]] == [0, 1]
+    assert all("embedding service unavailable" in line["error"] for line in lines[:-1])
+    assert lines[-1]["type"] == "stats" and (lines[-1]["answered"], lines[-1]["errors"]) == (0, 2)
+
+
+def test_questions_in_flight_are_bounded(http, monkeypatch):
+    from services.batch_answering import BatchAnswering
+
+    monkeypatch.setattr(settings, "BATCH_QA_RETRIEVAL_CONCURRENCY", 2)
+    batch = BatchAnswering(llm_concurrency=1)
+    in_flight, peak = 0, 0
+
+    async def answer(index, question, embedding, llm_slots, session_id):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return {"type": "answer", "index": index, "question": question, "error": "skipped"}
+
+    monkeypatch.setattr(batch, "_answer", answer)
+
+    async def run():
+        return [result async for result in batch.astream([f"q{i}?" for i in range(30)])]
+
+    results = asyncio.run(run())
+    assert len(results) == 31 and results[-1]["errors"] == 30
+    assert peak == 3
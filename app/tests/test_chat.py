@@ -0,0 +1,18 @@
+def test_streamed_answer_ends_with_a_final_frame(http):
+    with http.websocket_connect("/api/ws/chat") as websocket:
+        websocket.send_json({"message": "What does the encoder do?", "stream": True, "bypass_cache": True})
+        frames = [websocket.receive_json()]
+        while frames[-1]["type"] == "token":
+            frames.append(websocket.receive_json())
+
+    final = frames[-1]
+    assert final["type"] == "final" and len(frames) > 1
+    assert "".join(frame["token"] for frame in frames[:-1]) == final["reply"]
+    assert final["session_id"] == frames[0]["session_id"]
+
+
+def test_single_frame_answer_is_a_final_frame(http):
+    with http.websocket_connect("/api/ws/chat") as websocket:
+        websocket.send_json({"message": "What does the decoder do?", "bypass_cache": True})
+        frame = websocket.receive_json()
+    assert frame["type"] == "final" and frame["reply"]
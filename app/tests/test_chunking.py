@@ -0,0 +1,77 @@
+import numpy as np
+from langchain_core.documents import Document
+from services.chunking import ApproximateTokenizer, TokenChunker, _boundaries
+
+SENTENCES = [f"Sentence number {i} talks about attention layers." for i in range(40)]
+
+
+def _page(text: str, page: int = 1) -> Document:
+    return Document(page_content=text, metadata={"source": "paper.pdf", "page": page})
+
+
+def _tokens(text: str) -> int:
+    return len(ApproximateTokenizer().token_spans([text])[0][0])
+
+
+def _chunker(**kwargs) -> TokenChunker:
+    return TokenChunker(ApproximateTokenizer(), **kwargs)
+
+
+def test_chunk_metadata_matches_the_page_text():
+    page = _page(" ".join(SENTENCES))
+    chunks = _chunker(max_tokens=60, overlap_tokens=10).split_page(page)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        start, end = chunk.metadata["start_index"], chunk.metadata["end_index"]
+        assert page.page_content[start:end] == chunk.page_content
+        assert chunk.metadata["token_count"] == _tokens(chunk.page_content)
+        assert chunk.metadata["token_count"] <= 60
+        assert chunk.metadata["page"] == 1
+
+
+def test_chunks_end_at_sentence_ends_and_overlap():
+    page = _page(" ".join(SENTENCES))
+    chunks = _chunker(max_tokens=60, overlap_tokens=15).split_page(page)
+    for chunk in chunks:
+        assert chunk.page_content.startswith("Sentence")
+        assert chunk.page_content.endswith(".")
+    for first, second in zip(chunks, chunks[1:]):
+        assert second.metadata["start_index"] < first.metadata["end_index"]
+
+
+def test_without_overlap_chunks_cover_the_page_once():
+    page = _page(" ".join(SENTENCES))
+    chunks = _chunker(max_tokens=60, overlap_tokens=0).split_page(page)
+    for first, second in zip(chunks, chunks[1:]):
+        assert second.metadata["start_index"] >= first.metadata["end_index"]
+    assert chunks[0].metadata["start_index"] == 0
+    assert chunks[-1].metadata["end_index"] == len(page.page_content)
+
+
+def test_paragraph_break_closes_a_big_enough_chunk():
+    # 45 tokens, then 90: the first chunk stops at the break although 100 tokens would fit
+    text = " ".join(SENTENCES[:3]) + "\n\n" + " ".join(SENTENCES[3:9])
+    chunks = _chunker(max_tokens=100, overlap_tokens=0, min_tokens=10).split_page(_page(text))
+    assert [chunk.page_content.strip() for chunk in chunks] == [" ".join(SENTENCES[:3]), " ".join(SENTENCES[3:9])]
+
+
+def test_sentence_longer_than_a_chunk_is_split_on_tokens():
+    text = "word " * 300
+    chunks = _chunker(max_tokens=50, overlap_tokens=0).split_page(_page(text))
+    assert len(chunks) == 6
+    assert all(chunk.metadata["token_count"] <= 50 for chunk in chunks)
+
+
+def test_iter_chunks_batches_pages_like_split_page():
+    pages = [_page(" ".join(SENTENCES[i:i + 10]) + "\n\nLast one here.", page=i) for i in range(7)]
+    chunker = _chunker(max_tokens=40, overlap_tokens=8, batch_size=3)
+    expected = [chunk for page in pages for chunk in chunker.split_page(page)]
+    streamed = list(chunker.iter_chunks(iter(pages)))
+    assert [(c.page_content, c.metadata) for c in streamed] == [(c.page_content, c.metadata) for c in expected]
+
+
+def test_boundaries():
+    sentences, paragraphs = _boundaries('One. "Two." Three?\n\nFour')
+    assert sentences.tolist() == [4, 11, 18]
+    assert paragraphs.tolist() == [19]
+    assert isinstance(sentences, np.ndarray)
@@ -0,0 +1,65 @@
+from langchain_core.documents import Document
+from utils.context_packing import drop_near_duplicates, merge_adjacent, pack_context
+from utils.tokens import estimate_tokens
+
+TEXT = " ".join(f"word{i}" for i in range(200))
+
+
+def _chunk(start: int, end: int, page: int = 1, indexed: bool = True) -> Document:
+    metadata = {"source": "paper.pdf", "page": page}
+    if indexed:
+        metadata["start_index"] = start
+    return Document(page_content=TEXT[start:end], metadata=metadata)
+
+
+def test_overlapping_chunks_of_a_page_are_merged_once():
+    merged = merge_adjacent([_chunk(100, 300), _chunk(0, 150)])
+    assert len(merged) == 1
+    rank, doc = merged[0]
+    assert rank == 0
+    assert doc.page_content == TEXT[0:300]
+
+
+def test_contiguous_chunks_are_merged():
+    [(_, doc)] = merge_adjacent([_chunk(0, 100), _chunk(100, 200)])
+    assert doc.page_content == TEXT[0:200]
+
+
+def test_gaps_and_other_pages_are_not_merged():
+    merged = merge_adjacent([_chunk(0, 100), _chunk(150, 250), _chunk(50, 150, page=2)])
+    assert [rank for rank, _ in merged] == [0, 1, 2]
+
+
+def test_chunks_without_offsets_are_merged_on_their_text_overlap():
+    [(_, doc)] = merge_adjacent([_chunk(0, 120, indexed=False), _chunk(80, 200, indexed=False)])
+    assert doc.page_content == TEXT[0:200]
+
+    # an overlap shorter than MIN_OVERLAP_CHARS is a coincidence
+    assert len(merge_adjacent([_chunk(0, 110, indexed=False), _chunk(100, 200, indexed=False)])) == 2
+
+
+def test_near_duplicates_keep_the_best_ranked():
+    ranked = [
+        (0, Document(page_content="the encoder maps an input sequence to continuous representations")),
+        (1, Document(page_content="The encoder maps an input sequence to continuous representations.")),
+        (2, Document(page_content="the decoder generates an output sequence one symbol at a time")),
+    ]
+    kept = drop_near_duplicates(ranked, threshold=0.9)
+    assert [rank for rank, _ in kept] == [0, 2]
+
+
+def test_pack_context_fits_the_budget_in_rank_order():
+    docs = [_chunk(0, 200), _chunk(400, 600), _chunk(800, 1000)]
+    packed, stats = pack_context(docs, max_tokens=110)
+    assert [doc.page_content for doc in packed] == [TEXT[0:200], TEXT[400:600]]
+    assert stats["chunks_in"] == 3
+    assert stats["chunks_out"] == 2
+    assert stats["tokens_after"] <= 110
+
+
+def test_oversized_first_chunk_is_truncated_to_the_budget():
+    packed, stats = pack_context([_chunk(0, 1000), _chunk(1000, 1100, page=2)], max_tokens=50)
+    assert len(packed) == 1
+    assert TEXT.startswith(packed[0].page_content)
+    assert estimate_tokens(packed[0].page_content) <= 50
+    assert stats["tokens_after"] <= 50
@@ -0,0 +1,74 @@
+import sys
+import threading
+import numpy as np
+from services.embeddings import CachedEmbeddings
+from benchmarks.fakes import FakeEmbeddings
+from utils.embedding_cache import EmbeddingCache
+
+
+def _vector(seed: int, dim: int = 4) -> list:
+    return np.random.default_rng(seed).normal(size=dim).astype(np.float32).tolist()
+
+
+def _stored_bytes(cache) -> int:
+    return cache._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+
+def test_replaced_entries_are_counted_once(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=1 << 20)
+    for _ in range(3):
+        cache.put_many({"a": _vector(0), "b": _vector(1)})
+    assert cache._bytes == _stored_bytes(cache) == 32
+    assert EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=1 << 20)._bytes == 32
+
+
+def test_hits_are_not_written_on_every_read(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=1 << 20)
+    cache.put_many({"a": _vector(0)})
+    before = cache._db.total_changes
+    for _ in range(10):
+        assert np.allclose(cache.get_many(["a", "missing"])["a"], _vector(0))
+    assert cache._db.total_changes == before
+    assert (cache.hits, cache.misses) == (10, 10)
+
+    cache.touch_batch = 1
+    cache.get_many(["a"])
+    assert cache._db.total_changes == before + 1 and not cache._touched
+
+
+def test_eviction_keeps_recently_read_entries(tmp_path):
+    # room for 10 vectors of 16 bytes; eviction goes down to 90%
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=160)
+    for i in range(10):
+        cache.put_many({f"k{i}": _vector(i)})
+    cache.get_many(["k0", "k1"])  # pending access times, not written yet
+    cache.put_many({"k10": _vector(10)})
+
+    assert cache.evictions == 2
+    assert set(cache.get_many([f"k{i}" for i in range(11)])) == {"k0", "k1"} | {f"k{i}" for i in range(4, 11)}
+    assert cache._bytes == _stored_bytes(cache) == 144
+
+
+def test_query_cache_hits_are_counted_under_concurrency(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=1 << 20)
+    embeddings = CachedEmbeddings(FakeEmbeddings(dimension=8), model_name="fake", cache=cache)
+    embeddings.embed_query("what is attention?")
+    barrier = threading.Barrier(8)
+
+    def ask():
+        barrier.wait()
+        for _ in range(500):
+            embeddings.embed_query("what is attention?")
+            embeddings.embed_queries(["what is attention?"])
+
+    threads = [threading.Thread(target=ask) for _ in range(8)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often, so unguarded increments would lose counts
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert cache.hits == 8 * 500 * 2
@@ -0,0 +1,28 @@
+import pytest
+from utils.followup import is_self_contained
+
+
+@pytest.mark.parametrize("question", [
+    "What does the encoder layer do?",
+    "How is multi-head attention computed in the Transformer?",
+    "What is this paper about?",
+    "Summarize these documents in three sentences.",
+    "Which datasets were used for training the model?",
+])
+def test_self_contained_questions(question):
+    assert is_self_contained(question)
+
+
+@pytest.mark.parametrize("question", [
+    "Why is it faster?",
+    "How do they compare to recurrent layers?",
+    "What did the previous answer mean?",
+    "Explain that again.",
+    "And the decoder?",
+    "what about positional encodings in the model",
+    "But why does the model need masking?",
+    "Why?",
+    "More details",
+])
+def test_follow_ups_need_rewriting(question):
+    assert not is_self_contained(question)
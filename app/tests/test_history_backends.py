@@ -0,0 +1,145 @@
+import time
+import uuid
+import threading
+import pytest
+from benchmarks import fakes
+from config.settings import settings
+from utils.history_backends import BatchedReader, HistoryConflict, RedisHistoryBackend, SQLiteHistoryBackend
+from utils.resp import RespClient
+
+
+def _turn(question: str) -> list:
+    return [{"role": "human", "content": question}, {"role": "ai", "content": f"Answer to {question}"}]
+
+
+@pytest.fixture
+def redis_server():
+    server = fakes.RespServer().start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        yield SQLiteHistoryBackend(str(tmp_path / "history.db"), max_sessions=1000)
+        return
+    server = fakes.RespServer().start()
+    yield RedisHistoryBackend(RespClient(server.url), "test:", max_sessions=1000)
+    server.shutdown()
+    server.server_close()
+
+
+def test_append_checks_the_expected_version(backend):
+    assert backend.append("s1", _turn("first")) == 2
+    with pytest.raises(HistoryConflict):
+        backend.append("s1", _turn("stale"), expected_version=0)
+    assert backend.append("s1", _turn("second"), expected_version=2) == 4
+
+    records, version = backend.load("s1")
+    assert version == 4
+    assert [record["content"] for record in records[::2]] == ["first", "second"]
+    assert backend.version("unknown") == 0
+
+
+def test_prune_deletes_least_recently_written_sessions(backend):
+    backend.max_sessions = 3
+    backend.prune_every = 1
+    for i in range(5):
+        backend.append(f"s{i}", _turn(f"question {i}"))
+        time.sleep(0.01)
+    assert backend.versions([f"s{i}" for i in range(5)]) == {"s0": 0, "s1": 0, "s2": 2, "s3": 2, "s4": 2}
+
+
+def test_counters_and_state_are_shared(backend):
+    assert backend.counters(["a", "b"]) == {"a": 0, "b": 0}
+    assert [backend.increment("a") for _ in range(2)] == [1, 2]
+    assert backend.counters(["a", "b"]) == {"a": 2, "b": 0}
+
+    assert backend.get_state("job") is None
+    backend.put_state("job", {"state": "running", "chunks": 3})
+    backend.put_state("job", {"state": "succeeded", "chunks": 5})
+    assert backend.get_state("job") == {"state": "succeeded", "chunks": 5}
+
+
+def test_batched_reader_leader_runs_a_single_batch():
+    gate = threading.Event()
+    batches = []
+
+    def fetch_many(keys):
+        batches.append((threading.current_thread().name, sorted(keys)))
+        if len(batches) == 1:
+            gate.wait(5)
+        return {key: key.upper() for key in keys}
+
+    reader = BatchedReader(fetch_many)
+    results = {}
+
+    def read(key):
+        results[key] = reader.get(key)
+
+    threads = [threading.Thread(target=read, args=("a",), name="leader")]
+    threads[0].start()
+    while not batches:
+        time.sleep(0.001)
+    for key in "bcd":
+        threads.append(threading.Thread(target=read, args=(key,), name=f"follower-{key}"))
+        threads[-1].start()
+    while len(reader._pending) < 3:
+        time.sleep(0.001)
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == {"a": "A", "b": "B", "c": "C", "d": "D"}
+    assert batches[0] == ("leader", ["a"])
+    # the queued reads ran in one batch, led by one of their own callers
+    assert len(batches) == 2
+    assert batches[1][0] != "leader" and batches[1][1] == ["b", "c", "d"]
+
+
+def _ask(conversation, question: str) -> dict:
+    answer = conversation.conversation_answer(question, use_cache=False)
+    assert answer["answer"] != "Error while generating response."
+    return answer
+
+
+def test_other_sessions_do_not_prune_a_live_session(shared_history):
+    from services.conversation_answering import ConversationAnswering
+
+    conversation = ConversationAnswering(session_id=str(uuid.uuid4()))
+    _ask(conversation, "What does the encoder layer do?")
+    for _ in range(settings.MAX_SESSIONS + 2):
+        _ask(ConversationAnswering(session_id=str(uuid.uuid4())), "What is attention?")
+
+    assert shared_history.version(conversation.session_id) == 2
+    assert "What does the encoder layer do?" in conversation._get_chat_history()
+
+
+def test_pruned_session_keeps_its_memory(shared_history):
+    from services.conversation_answering import ConversationAnswering
+
+    conversation = ConversationAnswering(session_id=str(uuid.uuid4()))
+    _ask(conversation, "What does the encoder layer do?")
+    shared_history.delete(conversation.session_id)  # as pruning or another worker's delete would
+
+    # the version went back to 0: not another worker's turns, so the memory is kept
+    assert "What does the encoder layer do?" in conversation._get_chat_history()
+    _ask(conversation, "And the decoder layer?")
+    records, version = shared_history.load(conversation.session_id)
+    assert version == 2 and records[0]["content"] == "And the decoder layer?"
+    history = conversation._get_chat_history()
+    assert "What does the encoder layer do?" in history and "And the decoder layer?" in history
+
+
+def test_turns_of_another_worker_are_loaded(shared_history):
+    from services.conversation_answering import ConversationAnswering
+
+    conversation = ConversationAnswering(session_id=str(uuid.uuid4()))
+    _ask(conversation, "What does the encoder layer do?")
+    shared_history.append(conversation.session_id, _turn("Asked on another worker"), expected_version=2)
+
+    assert "Asked on another worker" in conversation._get_chat_history()
+    _ask(conversation, "And the decoder layer?")
+    assert shared_history.version(conversation.session_id) == 6
@@ -0,0 +1,56 @@
+import uuid
+import threading
+import pytest
+from config.settings import settings
+from utils import history_manager
+
+
+@pytest.fixture
+def file_backend(monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_BACKEND", "file")
+    yield
+    history_manager.flush()
+
+
+def test_reading_a_session_does_not_wait_for_other_sessions(file_backend, monkeypatch):
+    slow, fast = str(uuid.uuid4()), str(uuid.uuid4())
+    history_manager.save_history(fast, "First question", "First answer")
+    history_manager.flush()
+
+    writing, release = threading.Event(), threading.Event()
+    append = history_manager._append
+
+    def slow_append(session_id, records):
+        if session_id == slow:
+            writing.set()
+            release.wait(5)
+        append(session_id, records)
+
+    monkeypatch.setattr(history_manager, "_append", slow_append)
+    history_manager.save_history(slow, "Slow question", "Slow answer")
+    assert writing.wait(5)
+
+    # the writer is stuck on the other session: this read returns without waiting for it
+    assert [record["content"] for record in history_manager.load_history(fast)] == ["First question", "First answer"]
+
+    loaded = []
+    reader = threading.Thread(target=lambda: loaded.append(history_manager.load_history(slow)))
+    reader.start()
+    reader.join(0.2)
+    assert reader.is_alive()  # waits for its own session's pending turn
+    release.set()
+    reader.join(5)
+    assert [record["content"] for record in loaded[0]] == ["Slow question", "Slow answer"]
+
+
+def test_failed_write_does_not_block_readers(file_backend, monkeypatch):
+    session_id = str(uuid.uuid4())
+
+    def failing_append(session_id, records):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(history_manager, "_append", failing_append)
+    history_manager.save_history(session_id, "Lost question", "Lost answer")
+    history_manager.flush()
+    assert history_manager.load_history(session_id) == []
+    assert session_id not in history_manager._pending
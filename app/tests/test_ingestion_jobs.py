@@ -0,0 +1,184 @@
+import os
+import time
+import threading
+import pytest
+from types import SimpleNamespace
+from benchmarks import fakes
+from services.ingestion_jobs import IngestionJobManager
+from services.ingestion_pipeline import IngestionCancelled
+
+
+class FakePreprocessing:
+    """Stands in for Preprocessing: runs until released or cancelled, recording what happened."""
+    def __init__(self, name: str, events: list, release: threading.Event = None, stop_delay: float = 0.0):
+        self.name = name
+        self.events = events
+        self.release = release
+        self.stop_delay = stop_delay
+        self.stats = {}
+
+    def preprocess(self, progress=None, cancel_event=None):
+        self.events.append(f"{self.name} started")
+        while self.release is not None and not self.release.is_set():
+            if cancel_event.is_set():
+                time.sleep(self.stop_delay)  # in-flight batches finish, a manifest is saved
+                self.events.append(f"{self.name} stopped")
+                raise IngestionCancelled("Ingestion cancelled.")
+            time.sleep(0.005)
+        self.events.append(f"{self.name} finished")
+
+    def vector_count(self) -> int:
+        return 0
+
+
+class ReportingPreprocessing(FakePreprocessing):
+    """Reports progress while it runs, as the ingestion pipeline does after each batch."""
+    def preprocess(self, progress=None, cancel_event=None):
+        self.events.append(f"{self.name} started")
+        while not self.release.is_set():
+            progress(SimpleNamespace(processed=0, stats={}))
+            if cancel_event.is_set():
+                raise IngestionCancelled("Ingestion cancelled.")
+            time.sleep(0.005)
+
+
+def _submit(manager, path, name, events, namespace="", **kwargs):
+    return manager.submit(path, preprocessor_factory=lambda: FakePreprocessing(name, events, **kwargs), namespace=namespace)
+
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_jobs_for_the_same_file_run_one_after_the_other():
+    manager = IngestionJobManager(max_concurrent=4)
+    events, release = [], threading.Event()
+    first = _submit(manager, "report.pdf", "first", events, release=release)
+    second = _submit(manager, "report.pdf", "second", events)
+    other_namespace = _submit(manager, "report.pdf", "other namespace", events, namespace="team-a")
+    other_file = _submit(manager, "notes.txt", "other file", events)
+
+    assert manager.wait([other_namespace, other_file], timeout=5)
+    assert second.state == "queued" and second.future is None
+    release.set()
+    assert manager.wait([first, second], timeout=5)
+    assert events.index("first finished") < events.index("second started")
+    assert [job.state for job in (first, second)] == ["succeeded", "succeeded"]
+    assert not manager._waiting
+
+
+def test_cancelling_a_job_waiting_for_its_file():
+    manager = IngestionJobManager(max_concurrent=2)
+    events, release = [], threading.Event()
+    first = _submit(manager, "report.pdf", "first", events, release=release)
+    second = _submit(manager, "report.pdf", "second", events)
+    third = _submit(manager, "report.pdf", "third", events)
+
+    assert manager.cancel(second.job_id)
+    assert second.state == "cancelled" and second.done.is_set()
+    release.set()
+    assert manager.wait([first, third], timeout=5)
+    assert "second started" not in events and third.state == "succeeded"
+
+
+def test_delete_namespace_waits_for_cancelled_jobs(monkeypatch):
+    from services import namespaces
+
+    fakes.install()
+    manager = IngestionJobManager(max_concurrent=2)
+    monkeypatch.setattr(namespaces, "job_manager", manager)
+    events = []
+    monkeypatch.setattr(namespaces.index_manifest, "delete_namespace", lambda namespace: events.append("manifests deleted"))
+    job = _submit(manager, "report.pdf", "job", events, namespace="team-a", release=threading.Event(), stop_delay=0.1)
+    _wait_for(lambda: "job started" in events)
+
+    namespaces.delete_namespace("team-a")
+    assert events == ["job started", "job stopped", "manifests deleted"]
+    assert job.state == "cancelled"
+
+
+@pytest.mark.parametrize("cancel_before_start", [True, False])
+def test_wait_returns_for_cancelled_jobs(cancel_before_start):
+    manager = IngestionJobManager(max_concurrent=1)
+    events, release = [], threading.Event()
+    blocker = _submit(manager, "a.pdf", "blocker", events, release=release)
+    job = _submit(manager, "b.pdf", "job", events, release=threading.Event())
+    if cancel_before_start:
+        manager.cancel(job.job_id)  # still in the pool's queue
+        release.set()
+    else:
+        release.set()
+        _wait_for(lambda: "job started" in events)
+        manager.cancel(job.job_id)
+    assert manager.wait([blocker, job], timeout=5)
+    assert job.state == "cancelled" and not manager._waiting
+
+
+def _spool(tmp_path, content: bytes):
+    from services.uploads import SpooledFile
+
+    os.makedirs(tmp_path / ".spool", exist_ok=True)
+    spooled = SpooledFile("report.txt", str(tmp_path / ".spool"), str(tmp_path))
+    spooled.buffer += content
+    spooled.finish()
+    return spooled
+
+
+class FailingPreprocessing(FakePreprocessing):
+    def preprocess(self, progress=None, cancel_event=None):
+        raise RuntimeError("parse error")
+
+
+def test_uploads_of_the_same_name_are_kept_apart_until_indexed(tmp_path):
+    manager = IngestionJobManager(max_concurrent=2)
+    events, release = [], threading.Event()
+    first, second = _spool(tmp_path, b"first"), _spool(tmp_path, b"second")
+    assert first.path != second.path and first.source == second.source == str(tmp_path / "report.txt")
+
+    first_job = manager.submit(first.path, source=first.source,
+                               preprocessor_factory=lambda: FakePreprocessing("first", events, release=release))
+    second_job = manager.submit(second.path, source=second.source,
+                                preprocessor_factory=lambda: FakePreprocessing("second", events))
+    # both uploads are the same document: the second one waits, its file untouched
+    assert second_job.state == "queued" and open(second.path, "rb").read() == b"second"
+    release.set()
+    assert manager.wait([first_job, second_job], timeout=5)
+
+    assert (tmp_path / "report.txt").read_bytes() == b"second"
+    assert not os.path.exists(first.path) and not os.path.exists(second.path)
+    assert os.listdir(tmp_path / ".spool") == []
+    assert first_job.as_dict()["file_path"] == first.source
+
+
+def test_failed_upload_keeps_the_indexed_copy(tmp_path):
+    (tmp_path / "report.txt").write_bytes(b"indexed")
+    manager = IngestionJobManager(max_concurrent=1)
+    spooled = _spool(tmp_path, b"broken")
+    job = manager.submit(spooled.path, source=spooled.source,
+                         preprocessor_factory=lambda: FailingPreprocessing("broken", []))
+    assert manager.wait([job], timeout=5)
+
+    assert job.state == "failed"
+    assert (tmp_path / "report.txt").read_bytes() == b"indexed"
+    assert os.listdir(tmp_path / ".spool") == []
+
+
+def test_status_and_cancellation_reach_other_workers(shared_history):
+    worker, other_worker = IngestionJobManager(max_concurrent=1), IngestionJobManager(max_concurrent=1)
+    worker.publish_interval = 0.0
+    events = []
+    batch = worker.create_batch()
+    job = worker.submit("report.pdf", batch=batch,
+                        preprocessor_factory=lambda: ReportingPreprocessing("job", events, release=threading.Event()))
+    worker.close_batch(batch)
+    _wait_for(lambda: other_worker.status(job.job_id)["state"] == "running")
+    assert other_worker.batch_status(batch.batch_id)["jobs"][0]["job_id"] == job.job_id
+    assert other_worker.status("unknown") is None
+
+    assert other_worker.cancel(job.job_id)
+    assert worker.wait([job], timeout=5) and job.state == "cancelled"
+    assert other_worker.status(job.job_id)["state"] == "cancelled"
+    assert not other_worker.cancel(job.job_id)
@@ -0,0 +1,71 @@
+import json
+import os
+import numpy as np
+from langchain_core.documents import Document
+from services.ingestion_pipeline import fetch_documents
+from services.lexical_index import BM25Index, tokenize
+from services.local_vector_store import LocalVectorStore
+
+TEXTS = [
+    "The XJ-200 encoder maps tokens to vectors.",
+    "Attention weights are computed with a softmax.",
+    "The decoder attends to the encoder output.",
+    "Positional encodings are added to the embeddings.",
+    "Multi-head attention runs several attention layers in parallel.",
+]
+
+
+def _chunks(texts, source="paper.pdf"):
+    return [Document(page_content=text, metadata={"source": source, "page": i}) for i, text in enumerate(texts)]
+
+
+def _store(tmp_path, texts, ids):
+    store = LocalVectorStore(path=str(tmp_path / "vectors"))
+    chunks = _chunks(texts)
+    vectors = np.random.default_rng(0).normal(size=(len(chunks), 8))
+    store.add_vectors(vectors, texts, metadatas=[chunk.metadata for chunk in chunks], ids=ids)
+    return store
+
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    assert tokenize("The XJ-200 v1.2") == ["the", "xj-200", "xj", "200", "v1.2", "v1", "2"]
+
+
+def test_batches_build_the_same_segment_as_one_call(tmp_path):
+    ids = [f"c{i}" for i in range(len(TEXTS))]
+    index = BM25Index(str(tmp_path / "lexical"), fetch=dict)
+    builder = index.builder("batched.pdf")
+    builder.add_batch(ids[:2], _chunks(TEXTS[:2]))
+    builder.add_batch(ids[2:], _chunks(TEXTS[2:]))
+    index.replace_document("whole.pdf", ids, _chunks(TEXTS))
+
+    batched, whole = builder.build(), index._segments["whole.pdf"]
+    for name in ("terms", "offsets", "postings", "freqs", "lengths"):
+        assert np.array_equal(getattr(batched, name), getattr(whole, name)), name
+    attention = batched.lookup("attention")
+    assert attention[0].tolist() == [1, 4] and attention[1].tolist() == [1, 2]
+
+
+def test_search_reads_texts_from_the_vector_store(tmp_path):
+    ids = [f"c{i}" for i in range(len(TEXTS))]
+    store = _store(tmp_path, TEXTS, ids)
+    index = BM25Index(str(tmp_path / "lexical"), fetch=lambda chunk_ids: fetch_documents(store, chunk_ids))
+    builder = index.builder("paper.pdf")
+    builder.add_batch(ids, _chunks(TEXTS))
+    builder.commit()
+
+    # the segment on disk holds ids and statistics, not the texts
+    sidecars = [name for name in os.listdir(tmp_path / "lexical") if name.endswith(".json")]
+    with open(tmp_path / "lexical" / sidecars[0], encoding="utf-8") as f:
+        assert json.load(f) == {"source": "paper.pdf", "ids": ids}
+
+    results = BM25Index(str(tmp_path / "lexical"), fetch=index.fetch).search("xj-200", k=3)
+    assert [document.id for document, _ in results] == ["c0"]
+    assert results[0][0].page_content == TEXTS[0] and results[0][0].metadata["page"] == 0
+
+    results = index.search("attention", k=1, filter={"page": {"$in": [1, 2, 3]}})
+    assert [document.id for document, _ in results] == ["c1"]
+
+    # chunks missing from the vector store are skipped, the next best are returned
+    store.delete(["c4"])
+    assert [document.id for document, _ in index.search("attention", k=2)] == ["c1"]
@@ -0,0 +1,159 @@
+import os
+import numpy as np
+from services.local_vector_store import LocalVectorStore
+
+
+def _vectors(count: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def _add(store, vectors, prefix: str, namespace: str = ""):
+    ids = [f"{prefix}-{i}" for i in range(len(vectors))]
+    metadatas = [{"source": f"{prefix}.pdf", "page": i} for i in range(len(vectors))]
+    return store.add_vectors(vectors, [f"text of {id_}" for id_ in ids], metadatas=metadatas, ids=ids, namespace=namespace)
+
+
+def test_interrupted_write_does_not_shift_later_rows(tmp_path):
+    store = LocalVectorStore(path=str(tmp_path))
+    first = _vectors(10)
+    _add(store, first, "a")
+    # a write that crashed after appending its vectors, before meta.json counted them
+    with open(os.path.join(str(tmp_path), "vectors.bin"), "ab") as f:
+        f.write(_vectors(3, seed=1).tobytes())
+
+    reopened = LocalVectorStore(path=str(tmp_path))
+    assert os.path.getsize(os.path.join(str(tmp_path), "vectors.bin")) == first.nbytes
+    second = _vectors(5, seed=2)
+    _add(reopened, second, "b")
+
+    for prefix, vectors in (("a", first), ("b", second)):
+        for i, vector in enumerate(vectors):
+            doc, score = reopened.similarity_search_with_score_by_vector(vector, k=1)[0]
+            assert doc.id == f"{prefix}-{i}" and score > 0.999
+
+
+def test_leftover_bytes_in_the_running_store_are_overwritten(tmp_path):
+    store = LocalVectorStore(path=str(tmp_path))
+    _add(store, _vectors(4), "a")
+    with open(os.path.join(str(tmp_path), "vectors.bin"), "ab") as f:
+        f.write(b"\0" * 7)  # a partial write that failed in this process
+    second = _vectors(4, seed=2)
+    _add(store, second, "b")
+    doc, score = store.similarity_search_with_score_by_vector(second[3], k=1)[0]
+    assert doc.id == "b-3" and score > 0.999
+
+
+def test_ivf_covers_rows_appended_after_training(tmp_path):
+    store = LocalVectorStore(path=str(tmp_path), ivf_lists=4, nprobe=1)
+    batches = [_vectors(50, seed=seed) for seed in range(8)]
+    for seed, vectors in enumerate(batches):
+        _add(store, vectors, f"batch{seed}", namespace=f"ns{seed % 2}")
+    assert store._state.ivf is not None
+
+    # every row is found, whether it is in the inverted lists or appended since they were sorted
+    for seed, vectors in enumerate(batches):
+        doc = store.similarity_search_by_vector(vectors[7], k=1)[0]
+        assert doc.id == f"batch{seed}-7"
+    assert store.count("ns0") == store.count("ns1") == 200
+
+    reopened = LocalVectorStore(path=str(tmp_path), ivf_lists=4, nprobe=1)
+    assert len(reopened._state.ivf.assign) == 400
+    assert reopened.similarity_search_by_vector(batches[-1][0], k=1)[0].id == "batch7-0"
+
+
+def test_replacing_and_deleting_rows(tmp_path):
+    store = LocalVectorStore(path=str(tmp_path))
+    vectors = _vectors(6)
+    _add(store, vectors, "a")
+    old = store._state
+    _add(store, vectors[:2] * -1, "a")  # same ids: replaces a-0 and a-1
+    store.delete(["a-5"])
+
+    assert len(store) == 5 and len(old.alive) == 6
+    assert store.similarity_search_by_vector(vectors[0], k=1)[0].id != "a-0"
+    assert store.similarity_search_by_vector(-vectors[0], k=1)[0].id == "a-0"
+    assert "a-5" not in [doc.id for doc in store.similarity_search_by_vector(vectors[5], k=6)]
+
+
+def test_search_interleaved_with_a_compaction(tmp_path):
+    store = LocalVectorStore(path=str(tmp_path))
+    vectors = _vectors(40)
+    _add(store, vectors, "a", namespace="ns")
+    # the survivors move to lower row numbers when the index is compacted
+    store.delete([f"a-{i}" for i in range(0, 40, 2)])
+
+    score = store._score
+    compactions = []
+
+    def score_then_compact(state, query, mask):
+        result = score(state, query, mask)
+        if not compactions:
+            compactions.append(state.generation)
+            store.compact()
+        return result
+
+    store._score = score_then_compact
+    for i in range(1, 40, 10):
+        compactions.clear()
+        for kwargs in ({}, {"namespace": "ns"}, {"filter": {"source": "a.pdf"}}):
+            doc, score_ = store.similarity_search_with_score_by_vector(vectors[i], k=1, **kwargs)[0]
+            assert doc.id == f"a-{i}" and score_ > 0.999
+    assert store._state.generation > compactions[0]
+    assert len(store) == 20
+
+
+def test_filtered_mask_of_a_compacted_snapshot_is_retried(tmp_path):
+    store = LocalVectorStore(path=str(tmp_path))
+    vectors = _vectors(10)
+    _add(store, vectors, "a")
+    store.delete(["a-0", "a-1"])
+    stale = store._state
+    store.compact()
+
+    mask = store._search_mask
+    calls = []
+
+    def record_mask(state, namespace=None, filter=None):
+        calls.append(state.generation)
+        return mask(stale if len(calls) == 1 else state, namespace, filter)
+
+    store._search_mask = record_mask
+    doc = store.similarity_search_by_vector(vectors[5], k=1, filter={"source": "a.pdf"})[0]
+    assert doc.id == "a-5" and len(calls) == 2
+
+
+def _ids(store, vector, k=20, **kwargs):
+    return sorted(doc.id for doc in store.similarity_search_by_vector(vector, k=k, **kwargs))
+
+
+def test_filters_match_like_matches_filter(tmp_path):
+    store = LocalVectorStore(path=str(tmp_path))
+    vectors = _vectors(6)
+    _add(store, vectors[:3], "a")
+    _add(store, vectors[3:], "b", namespace="ns")
+    store.add_vectors(_vectors(1, seed=3), ["no metadata"], metadatas=[{"lang": "en"}], ids=["c-0"])
+
+    query = vectors[0]
+    assert _ids(store, query, filter={"source": "a.pdf"}) == ["a-0", "a-1", "a-2"]
+    assert _ids(store, query, filter={"source": {"$eq": "b.pdf"}}) == ["b-0", "b-1", "b-2"]
+    assert _ids(store, query, filter={"source": "b.pdf"}, namespace="") == []
+    assert _ids(store, query, filter={"page": {"$in": [0, 2]}, "source": "b.pdf"}) == ["b-0", "b-2"]
+    assert _ids(store, query, filter={"page": {"$in": []}}) == []
+    assert _ids(store, query, filter={"source": None}) == ["c-0"]
+    assert _ids(store, query, filter={"lang": "en"}) == ["c-0"]
+    assert _ids(store, query, filter={"lang": {"$in": ["fr", None]}}) == ["a-0", "a-1", "a-2", "b-0", "b-1", "b-2"]
+
+
+def test_filter_columns_are_filled_for_an_older_index(tmp_path):
+    store = LocalVectorStore(path=str(tmp_path))
+    vectors = _vectors(4)
+    _add(store, vectors, "a")
+    # the sidecar of an index written before source and page had columns of their own
+    store._db.executescript(
+        "DROP INDEX chunks_source; DROP INDEX chunks_page;"
+        "ALTER TABLE chunks DROP COLUMN source; ALTER TABLE chunks DROP COLUMN page;"
+    )
+    store._db.close()
+
+    reopened = LocalVectorStore(path=str(tmp_path))
+    assert _ids(reopened, vectors[0], filter={"source": "a.pdf", "page": 3}) == ["a-3"]
@@ -0,0 +1,49 @@
+import time
+
+from benchmarks.fakes import FakeChatModel
+from services.memory import TokenBudgetMemory
+from utils.tokens import estimate_tokens, truncate_to_tokens
+
+
+def _wait_summarized(memory, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with memory._lock:
+            if memory.summary and not memory._summarizing and len(memory.messages) <= 2 * memory.keep_turns:
+                return
+        time.sleep(0.01)
+    raise AssertionError("memory was not summarized")
+
+
+def _turns(memory, count, words=30):
+    for i in range(count):
+        memory.save_context({"question": f"question {i} " + "word " * words}, {"answer": f"answer {i} " + "word " * words})
+
+
+def test_long_summary_is_capped_to_the_budget():
+    # the model ignores the word limit: its summary is about 400 tokens
+    memory = TokenBudgetMemory(FakeChatModel(answer_tokens=400), max_tokens=200, keep_turns=1)
+    _turns(memory, 4)
+    _wait_summarized(memory)
+
+    assert estimate_tokens(memory.summary) <= memory.summary_tokens
+    rendered = memory.render()
+    assert rendered.startswith("Summary of earlier conversation:")
+    assert estimate_tokens(rendered) <= memory.max_tokens
+
+
+def test_summarized_messages_are_dropped():
+    memory = TokenBudgetMemory(FakeChatModel(answer_tokens=10), max_tokens=1000, keep_turns=2)
+    _turns(memory, 5)
+    _wait_summarized(memory)
+
+    assert len(memory.messages) == 4
+    assert memory.messages[0].content.startswith("question 3")
+    assert "answer 4" in memory.render()
+
+
+def test_truncate_to_tokens():
+    text = "word " * 100
+    assert truncate_to_tokens("short", 10) == "short"
+    assert estimate_tokens(truncate_to_tokens(text, 10)) <= 10
+    assert not truncate_to_tokens(text, 10).endswith("wor")
@@ -0,0 +1,71 @@
+import pytest
+from benchmarks import fakes
+from utils.resp import RespClient, RespConnection, RespError
+
+
+@pytest.fixture
+def server():
+    server = fakes.RespServer().start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    client = RespClient(server.url)
+    yield client
+    client.close()
+
+
+def test_url_parsing():
+    client = RespClient("rediss://:secret@cache.internal:6380/2")
+    assert (client.host, client.port, client.password, client.db, client.tls) == ("cache.internal", 6380, "secret", 2, True)
+    client = RespClient("redis://localhost")
+    assert (client.port, client.password, client.db, client.tls) == (6379, None, 0, False)
+
+
+def test_watch_conflict_aborts_the_transaction(server, client):
+    other = RespConnection("127.0.0.1", server.server_address[1])
+    with client.connection() as connection:
+        connection.execute("WATCH", "history")
+        other.execute("RPUSH", "history", "written by another client")
+        replies = connection.pipeline([("MULTI",), ("RPUSH", "history", "mine"), ("EXEC",)])
+    other.close()
+
+    assert replies == [b"OK", b"QUEUED", None]
+    assert client.execute("LRANGE", "history", 0, -1) == [b"written by another client"]
+
+
+def test_error_reply_keeps_the_connection(client):
+    with pytest.raises(RespError, match="unknown command"):
+        client.execute("NOSUCHCOMMAND", "history")
+    # error replies inside a pipeline are returned in place, not raised
+    replies = client.pipeline([("NOSUCHCOMMAND", "history"), ("PING",)])
+    assert isinstance(replies[0], RespError) and replies[1] == b"PONG"
+
+    assert client.execute("PING") == b"PONG"
+    assert client._idle.qsize() == 1
+
+
+def test_dropped_connections_are_replaced(server, client):
+    client.execute("RPUSH", "history", "kept")
+    with client.connection() as first, client.connection() as second:
+        pass
+    server.drop_connections()
+
+    assert client.execute("LRANGE", "history", 0, -1) == [b"kept"]
+    with client.connection() as connection:
+        assert connection not in (first, second)
+        assert connection.execute("PING") == b"PONG"
+
+
+def test_connection_dropped_during_a_command_raises(server, client):
+    with pytest.raises(OSError):
+        with client.connection() as connection:
+            connection.execute("PING")
+            server.drop_connections()
+            connection.execute("PING")
+    # the broken connection was not returned to the pool
+    assert client._idle.qsize() == 0
+    assert client.execute("PING") == b"PONG"
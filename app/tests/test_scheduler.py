@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import pytest
+from services.scheduler import AnswerScheduler, RequestCoalescer, SchedulerBusy, _Limiter, _QueueFull
+
+
+def test_limiter_serves_waiters_in_order():
+    async def scenario():
+        limiter = _Limiter(limit=1, max_waiting=10)
+        await limiter.acquire()
+        order = []
+
+        async def waiter(name):
+            await limiter.acquire()
+            order.append(name)
+
+        tasks = [asyncio.create_task(waiter(name)) for name in "abcd"]
+        await asyncio.sleep(0)
+        for _ in tasks:
+            limiter.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        limiter.release()
+        return order, limiter
+
+    order, limiter = asyncio.run(scenario())
+    assert order == ["a", "b", "c", "d"]
+    assert limiter.idle
+
+
+def test_limiter_rejects_at_capacity_and_skips_cancelled_waiters():
+    async def scenario():
+        limiter = _Limiter(limit=1, max_waiting=2)
+        await limiter.acquire()
+        first = asyncio.create_task(limiter.acquire())
+        second = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.full()
+        with pytest.raises(_QueueFull):
+            await limiter.acquire()
+
+        first.cancel()
+        await asyncio.sleep(0)
+        assert len(limiter.waiters) == 1 and not limiter.full()
+        limiter.release()
+        await second
+        assert limiter.active == 1
+        limiter.release()
+        return limiter
+
+    assert asyncio.run(scenario()).idle
+
+
+class _FullLimiter(_Limiter):
+    """A global queue that fills up while a turn waits for its session slot."""
+    async def acquire(self):
+        raise _QueueFull()
+
+
+def test_session_slot_is_released_when_the_global_queue_is_full():
+    async def scenario():
+        scheduler = AnswerScheduler(max_concurrent=1, max_queued=1, session_concurrent=1, session_max_queued=1)
+        scheduler._global = _FullLimiter(1, 1)
+        with pytest.raises(SchedulerBusy):
+            async with scheduler.admit("s1"):
+                pass
+        assert "s1" not in scheduler._sessions
+        assert scheduler.rejected == 1
+
+        scheduler._global = _Limiter(1, 1)
+        async with scheduler.admit("s1") as waited:
+            assert waited < 1
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.admitted == 1 and not scheduler._sessions
+
+
+def test_session_queue_overflow_is_rejected():
+    async def scenario():
+        scheduler = AnswerScheduler(max_concurrent=4, max_queued=4, session_concurrent=1, session_max_queued=1)
+        release = asyncio.Event()
+
+        async def turn():
+            async with scheduler.admit("s1"):
+                await release.wait()
+
+        running = asyncio.create_task(turn())
+        queued = asyncio.create_task(turn())
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerBusy, match="this session"):
+            async with scheduler.admit("s1"):
+                pass
+        release.set()
+        await asyncio.gather(running, queued)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert (scheduler.admitted, scheduler.rejected) == (2, 1)
+
+
+def test_coalescer_shares_the_leader_result():
+    coalescer = RequestCoalescer()
+    future, leader = coalescer.join("q")
+    follower, is_leader = coalescer.join("q")
+    assert leader and not is_leader and follower is future
+    coalescer.finish("q", future, {"answer": "42"})
+    assert follower.result(timeout=1) == {"answer": "42"}
+    assert coalescer.coalesced == 1
+
+    # the key is free again: the next caller computes a fresh answer
+    _, leader = coalescer.join("q")
+    assert leader
+
+
+def test_failed_leader_lets_followers_answer_on_their_own():
+    coalescer = RequestCoalescer()
+    future, _ = coalescer.join("q")
+    followers = [coalescer.join("q")[0] for _ in range(3)]
+    results = []
+    waiting = [threading.Thread(target=lambda f=f: results.append(f.result(timeout=5))) for f in followers]
+    for thread in waiting:
+        thread.start()
+
+    coalescer.finish("q", future, None)  # the leader failed
+    for thread in waiting:
+        thread.join()
+    assert results == [None, None, None]
+    assert not coalescer._inflight
+    # a leader that already published is not overwritten by a late finish
+    coalescer.finish("q", future, {"answer": "late"})
+    assert future.result() is None
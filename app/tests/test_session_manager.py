@@ -0,0 +1,80 @@
+import threading
+import time
+
+from langchain.schema import HumanMessage
+from services.session_manager import SessionManager, _memory_size
+
+
+class _Memory:
+    def __init__(self, text: str):
+        self.messages = [HumanMessage(content=text)]
+
+
+def test_concurrent_first_requests_build_the_session_once():
+    sessions = SessionManager(max_sessions=10, ttl=60, max_bytes=10_000)
+    builds = []
+    start = threading.Barrier(8)
+
+    def factory():
+        builds.append(1)
+        time.sleep(0.05)
+        return _Memory("hello")
+
+    results = []
+
+    def request():
+        start.wait()
+        results.append(sessions.get_or_create("s1", factory))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert all(result is results[0] for result in results)
+    assert not sessions._building
+
+
+def test_failed_build_lets_the_next_request_retry():
+    sessions = SessionManager(max_sessions=10, ttl=60, max_bytes=10_000)
+
+    def failing():
+        raise RuntimeError("history unavailable")
+
+    try:
+        sessions.get_or_create("s1", failing)
+    except RuntimeError:
+        pass
+    assert sessions.get_or_create("s1", lambda: _Memory("hello")).messages[0].content == "hello"
+
+
+def test_byte_cap_evicts_least_recently_used():
+    sessions = SessionManager(max_sessions=10, ttl=60, max_bytes=250)
+    for name in ("a", "b", "c"):
+        sessions[name] = _Memory("x" * 100)
+    assert "a" not in sessions._sessions
+    assert list(sessions._sessions) == ["b", "c"]
+    assert sessions._bytes == 200
+
+    sessions.pop("b")
+    assert sessions._bytes == 100
+
+
+def test_running_total_follows_memory_growth():
+    memory = _Memory("x" * 10)
+    sessions = SessionManager(max_sessions=10, ttl=60, max_bytes=10_000)
+    sessions["s1"] = memory
+    memory.messages.append(HumanMessage(content="y" * 50))
+
+    sessions.get("s1")
+    assert sessions._bytes == _memory_size(memory) == 60
+
+
+def test_expired_sessions_leave_the_total():
+    sessions = SessionManager(max_sessions=10, ttl=0.01, max_bytes=10_000)
+    sessions["s1"] = _Memory("x" * 10)
+    time.sleep(0.02)
+    assert sessions.get("s1") is None
+    assert sessions._bytes == 0
@@ -0,0 +1,114 @@
+import re
+from langchain_core.documents import Document
+from utils.tokens import estimate_tokens
+
+# Overlaps shorter than this are treated as coincidental
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 400
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of `first` that is a prefix of `second` (0 if too short)."""
+    for size in range(min(len(first), len(second), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def _join(first: Document, second: Document):
+    """Merge two chunks of the same page if they overlap or touch, else return None."""
+    start_a = first.metadata.get("start_index")
+    start_b = second.metadata.get("start_index")
+    if start_a is not None and start_b is not None:
+        if start_b < start_a:
+            first, second, start_a, start_b = second, first, start_b, start_a
+        overlap = start_a + len(first.page_content) - start_b
+        if overlap < 0:
+            return None
+        text = first.page_content + second.page_content[min(overlap, len(second.page_content)):]
+        return Document(id=first.id, page_content=text, metadata=first.metadata)
+
+    if second.page_content in first.page_content:
+        return first
+    if first.page_content in second.page_content:
+        return Document(id=first.id, page_content=second.page_content, metadata=first.metadata)
+    for a, b in ((first, second), (second, first)):
+        overlap = _overlap(a.page_content, b.page_content)
+        if overlap:
+            return Document(id=a.id, page_content=a.page_content + b.page_content[overlap:], metadata=a.metadata)
+    return None
+
+
+def merge_adjacent(docs):
+    """
+    Merge chunks of the same source and page whose text overlaps or is contiguous, so
+    the overlap between neighbouring chunks is sent once. Merged chunks keep the rank of
+    their best-ranked part. Returns [(rank, Document)] in rank order.
+    """
+    groups = {}
+    for rank, doc in enumerate(docs):
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        merged = [(rank, doc)]
+        for other_rank, other in groups.get(key, []):
+            joined = _join(other, merged[0][1])
+            if joined is None:
+                merged.append((other_rank, other))
+            else:
+                merged[0] = (min(rank, other_rank, merged[0][0]), joined)
+        groups[key] = merged
+    return sorted((item for group in groups.values() for item in group), key=lambda item: item[0])
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def drop_near_duplicates(ranked, threshold: float):
+    """Drop chunks whose word shingles overlap a better ranked chunk's by at least `threshold` (Jaccard)."""
+    kept, kept_shingles = [], []
+    for rank, doc in ranked:
+        shingles = _shingles(doc.page_content)
+        if any(len(shingles & other) / (len(shingles | other) or 1) >= threshold for other in kept_shingles):
+            continue
+        kept.append((rank, doc))
+        kept_shingles.append(shingles)
+    return kept
+
+
+def pack_context(docs, max_tokens: int, dedup_threshold: float = 0.9):
+    """
+    Post-retrieval packing: merge overlapping neighbours, drop near-duplicates and keep
+    the best ranked chunks that fit in `max_tokens` (estimated). The best chunk is
+    truncated rather than dropped if it alone exceeds the budget.
+    Args:
+        docs (List[Document]): Retrieved chunks, best first.
+        max_tokens (int): Token budget of the packed context.
+        dedup_threshold (float): Jaccard similarity above which a chunk counts as a duplicate.
+    Returns:
+        Tuple[List[Document], dict]: the packed chunks, best first, and packing stats.
+    """
+    tokens_before = sum(estimate_tokens(doc.page_content) for doc in docs)
+    ranked = drop_near_duplicates(merge_adjacent(docs), dedup_threshold)
+
+    packed, used = [], 0
+    for _, doc in ranked:
+        cost = estimate_tokens(doc.page_content)
+        if used + cost <= max_tokens:
+            packed.append(doc)
+            used += cost
+        elif not packed:
+            text = doc.page_content[:max_tokens * 4]
+            packed.append(Document(id=doc.id, page_content=text, metadata=doc.metadata))
+            used += estimate_tokens(text)
+
+    stats = {
+        "chunks_in": len(docs),
+        "chunks_out": len(packed),
+        "tokens_before": tokens_before,
+        "tokens_after": used,
+        "tokens_saved": tokens_before - used,
+    }
+    return packed, stats
@@ -0,0 +1,138 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from utils.logger import logger
+
+
+def text_key(model_name: str, text: str) -> str:
+    """Cache key for `text` embedded by `model_name`: hash of the whitespace-normalized text."""
+    normalized = re.sub(r"\s+", " ", text).strip()
+    return hashlib.sha256(f"{model_name}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Size-bounded on-disk embedding cache backed by SQLite.
+    Vectors are stored as float32 blobs keyed by text_key(); once the stored bytes exceed
+    `max_bytes`, the least recently used entries are evicted.
+    Access times of hits are kept in memory and written in batches (every `touch_batch` hits,
+    `touch_interval` seconds, or before an eviction), so reads do not commit.
+    """
+    touch_batch = 1000
+    touch_interval = 30.0
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self._db.commit()
+
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._touched = {}  # key -> last access not written yet
+        self._touched_at = time.monotonic()
+
+    def get_many(self, keys: list) -> dict:
+        """Return {key: vector} for the cached keys and refresh their access time."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, blob in self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ):
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            now = time.time()
+            for key in found:
+                self._touched[key] = now
+            if len(self._touched) >= self.touch_batch or time.monotonic() - self._touched_at >= self.touch_interval:
+                self._write_touched()
+                self._db.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def record_hits(self, count: int):
+        """Count hits served by a cache in front of this one (e.g. an in-memory LRU)."""
+        with self._lock:
+            self.hits += count
+
+    def _write_touched(self):
+        """Write the pending access times; call with the lock held, the caller commits."""
+        if self._touched:
+            self._db.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                 [(last_access, key) for key, last_access in self._touched.items()])
+            self._touched = {}
+        self._touched_at = time.monotonic()
+
+    def put_many(self, items: dict):
+        """Store {key: vector} entries, evicting the least recently used ones if over budget."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            # concurrent misses on the same text store it twice: count replaced entries once
+            replaced = 0
+            keys = list(items)
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                replaced += self._db.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchone()[0]
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows)
+            self._db.commit()
+            self._bytes += sum(len(blob) for _, blob, _ in rows) - replaced
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is at 90% of its budget."""
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        # recent hits must count before picking the least recently used entries
+        self._write_touched()
+        while self._bytes > target:
+            rows = self._db.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._bytes = 0
+                break
+            for key, size in rows:
+                if self._bytes <= target:
+                    break
+                self._db.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self._bytes -= size
+                evicted += 1
+        self._db.commit()
+        self.evictions += evicted
+        logger.info(f"Evicted {evicted} entries from embedding cache {self.path}.")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "bytes": self._bytes,
+        }
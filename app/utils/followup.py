@@ -0,0 +1,31 @@
+import re
+
+# Words that usually point back at earlier turns
+_REFERRING_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "theirs",
+    "he", "him", "his", "she", "her", "hers", "there", "former", "latter", "above",
+    "previous", "earlier", "same", "again", "else", "another", "one", "ones",
+}
+# "this document" / "that paper" name the uploaded file, not an earlier turn
+_DOCUMENT_NOUNS = {"document", "file", "paper", "pdf", "book", "report", "article", "text"}
+_FOLLOW_UP_STARTS = ("and ", "but ", "so ", "also ", "or ", "then ", "what about", "how about", "why not", "what else")
+
+
+def is_self_contained(question: str) -> bool:
+    """
+    Cheap local check that a question can be understood without the conversation history,
+    so the LLM call that rewrites follow-ups into standalone questions can be skipped.
+    Errs on the side of False: very short questions, questions opening like a follow-up
+    ("and what about ...") and questions with referring words ("it", "those", ...) need rewriting.
+    """
+    text = question.strip().lower()
+    words = re.findall(r"[a-z0-9']+", text)
+    if len(words) < 3 or text.startswith(_FOLLOW_UP_STARTS):
+        return False
+    for i, word in enumerate(words):
+        if word in _REFERRING_WORDS:
+            next_word = words[i + 1] if i + 1 < len(words) else ""
+            if word in ("this", "that", "these", "those") and next_word.rstrip("s") in _DOCUMENT_NOUNS:
+                continue
+            return False
+    return True
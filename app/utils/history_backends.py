@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import Future
+from utils.resp import RespClient, RespError
+from utils.logger import logger
+from config.settings import settings
+
+
+class HistoryConflict(Exception):
+    """Raised when a session's history changed since the version a writer expected."""
+
+
+class BatchedReader:
+    """
+    Coalesces concurrent single-session reads into one batched backend call.
+    The first caller runs a batch; callers arriving meanwhile queue up. When the batch is
+    done its caller returns, and one of the callers still waiting runs the next batch with
+    everything queued, so reads are grouped under load without delaying a lone read, and no
+    caller keeps serving the others.
+    """
+    def __init__(self, fetch_many):
+        self.fetch_many = fetch_many
+        self._pending = []
+        self._running = False
+        self._changed = threading.Condition()
+
+    def get(self, key):
+        future = Future()
+        with self._changed:
+            self._pending.append((key, future))
+            while self._running and not future.done():
+                self._changed.wait()
+            if not future.done():
+                self._running = True
+                batch, self._pending = self._pending, []
+        if not future.done():
+            try:
+                results = self.fetch_many(list(dict.fromkeys(key for key, _ in batch)))
+                for batch_key, batch_future in batch:
+                    batch_future.set_result(results[batch_key])
+            except Exception as e:
+                for _, batch_future in batch:
+                    if not batch_future.done():
+                        batch_future.set_exception(e)
+            finally:
+                with self._changed:
+                    # hand over: a waiter whose read is still pending runs the next batch
+                    self._running = False
+                    self._changed.notify_all()
+        return future.result()
+
+
+class HistoryBackend:
+    """
+    History storage shared by every worker process. A session's version is its number of
+    records; append() with `expected_version` fails with HistoryConflict if another writer
+    appended to the session first. Single-session reads are batched (see BatchedReader).
+    Sessions beyond `max_sessions` are deleted, least recently written first, checked every
+    `prune_every` appends, so the store can exceed the limit by that many sessions.
+
+    The backend also holds the little other state workers share: named counters (the answer
+    cache's namespace versions) and JSON snapshots (ingestion job and batch status), which
+    expire `state_ttl` seconds after their last write.
+    """
+    prune_every = 256
+    state_ttl = 24 * 3600
+
+    def __init__(self, max_sessions: int):
+        self.max_sessions = max_sessions
+        self._appends = 0
+        self._appends_lock = threading.Lock()
+        self._versions = BatchedReader(self.versions)
+        self._loads = BatchedReader(self.load_many)
+
+    def _prune_due(self) -> bool:
+        with self._appends_lock:
+            self._appends += 1
+            return self._appends % self.prune_every == 0
+
+    def version(self, session_id: str) -> int:
+        return self._versions.get(session_id)
+
+    def load(self, session_id: str):
+        """Return (records, version) of a session."""
+        return self._loads.get(session_id)
+
+    def append(self, session_id: str, records: list, expected_version: int = None) -> int:
+        """Append records and return the new version."""
+        raise NotImplementedError
+
+    def versions(self, session_ids: list) -> dict:
+        """Return {session_id: version}, 0 for unknown sessions."""
+        raise NotImplementedError
+
+    def load_many(self, session_ids: list) -> dict:
+        """Return {session_id: (records, version)}."""
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def increment(self, name: str) -> int:
+        """Increment a shared counter and return its new value."""
+        raise NotImplementedError
+
+    def counters(self, names: list) -> dict:
+        """Return {name: value}, 0 for counters never incremented."""
+        raise NotImplementedError
+
+    def put_state(self, key: str, value: dict):
+        """Store a JSON snapshot under `key`, replacing the previous one."""
+        raise NotImplementedError
+
+    def get_state(self, key: str):
+        """Return the snapshot stored under `key`, or None."""
+        raise NotImplementedError
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """
+    Histories in one SQLite database in WAL mode, shared by the worker processes of a host.
+    Appends run in an immediate transaction, so the version check and the write are atomic
+    across processes.
+    """
+    def __init__(self, path: str, max_sessions: int):
+        super().__init__(max_sessions)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "session_id TEXT NOT NULL, seq INTEGER NOT NULL, record TEXT NOT NULL, PRIMARY KEY (session_id, seq))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS worker_state (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._state_writes = 0
+
+    def append(self, session_id: str, records: list, expected_version: int = None) -> int:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+                version = row[0] if row else 0
+                if expected_version is not None and version != expected_version:
+                    raise HistoryConflict(f"Session {session_id} is at version {version}, expected {expected_version}.")
+                self._db.executemany(
+                    "INSERT INTO records (session_id, seq, record) VALUES (?, ?, ?)",
+                    [(session_id, version + i, json.dumps(record, ensure_ascii=False)) for i, record in enumerate(records)]
+                )
+                self._db.execute(
+                    "INSERT INTO sessions (session_id, version, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET version = excluded.version, updated_at = excluded.updated_at",
+                    (session_id, version + len(records), time.time())
+                )
+                evicted = []
+                if self._prune_due():
+                    evicted = [row[0] for row in self._db.execute(
+                        "SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?", (self.max_sessions,)
+                    )]
+                for old_session in evicted:
+                    self._delete(old_session)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        for old_session in evicted:
+            logger.info(f"Deleted old history for session {old_session}")
+        return version + len(records)
+
+    def versions(self, session_ids: list) -> dict:
+        found = {}
+        with self._lock:
+            for start in range(0, len(session_ids), 500):
+                batch = session_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._db.execute(
+                    f"SELECT session_id, version FROM sessions WHERE session_id IN ({placeholders})", batch
+                ).fetchall())
+        return {session_id: found.get(session_id, 0) for session_id in session_ids}
+
+    def load_many(self, session_ids: list) -> dict:
+        loaded = {session_id: [] for session_id in session_ids}
+        with self._lock:
+            # one read transaction, so records and versions are from the same snapshot
+            self._db.execute("BEGIN")
+            try:
+                for start in range(0, len(session_ids), 500):
+                    batch = session_ids[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    for session_id, record in self._db.execute(
+                        f"SELECT session_id, record FROM records WHERE session_id IN ({placeholders}) ORDER BY session_id, seq",
+                        batch
+                    ):
+                        loaded[session_id].append(json.loads(record))
+            finally:
+                self._db.execute("COMMIT")
+        return {session_id: (records, len(records)) for session_id, records in loaded.items()}
+
+    def _delete(self, session_id: str):
+        self._db.execute("DELETE FROM records WHERE session_id = ?", (session_id,))
+        self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete(session_id)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def increment(self, name: str) -> int:
+        with self._lock:
+            return self._db.execute(
+                "INSERT INTO counters (name, value) VALUES (?, 1) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + 1 RETURNING value", (name,)
+            ).fetchone()[0]
+
+    def counters(self, names: list) -> dict:
+        placeholders = ",".join("?" * len(names))
+        with self._lock:
+            found = dict(self._db.execute(f"SELECT name, value FROM counters WHERE name IN ({placeholders})", names).fetchall())
+        return {name: found.get(name, 0) for name in names}
+
+    def put_state(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO worker_state (key, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                (key, json.dumps(value, ensure_ascii=False, default=str), now)
+            )
+            self._state_writes += 1
+            if self._state_writes % self.prune_every == 0:
+                self._db.execute("DELETE FROM worker_state WHERE updated_at < ?", (now - self.state_ttl,))
+
+    def get_state(self, key: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM worker_state WHERE key = ? AND updated_at >= ?", (key, time.time() - self.state_ttl)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+class RedisHistoryBackend(HistoryBackend):
+    """
+    Histories in Redis (or any server speaking its protocol), shared by workers on any host.
+    A session is a list of JSON records under `<prefix><session_id>`, and a sorted set
+    `<prefix>sessions` orders sessions by last write. Versioned appends use WATCH/MULTI/EXEC;
+    batched reads are pipelined into one round trip. Counters and snapshots are plain keys
+    under `<prefix>counter:` and `<prefix>state:`, the snapshots with an expiry.
+    """
+    def __init__(self, client: RespClient, prefix: str, max_sessions: int):
+        super().__init__(max_sessions)
+        self.client = client
+        self.prefix = prefix
+        self.sessions_key = f"{prefix}sessions"
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def append(self, session_id: str, records: list, expected_version: int = None) -> int:
+        key = self._key(session_id)
+        encoded = [json.dumps(record, ensure_ascii=False) for record in records]
+        with self.client.connection() as connection:
+            if expected_version is not None:
+                connection.execute("WATCH", key)
+                version = connection.execute("LLEN", key)
+                if version != expected_version:
+                    connection.execute("UNWATCH")
+                    raise HistoryConflict(f"Session {session_id} is at version {version}, expected {expected_version}.")
+            replies = connection.pipeline([
+                ("MULTI",),
+                ("RPUSH", key, *encoded),
+                ("ZADD", self.sessions_key, time.time(), session_id),
+                ("EXEC",),
+            ])
+            for reply in replies:
+                if isinstance(reply, RespError):
+                    raise reply
+            if replies[-1] is None:
+                # the session was written between WATCH and EXEC
+                raise HistoryConflict(f"Session {session_id} changed while appending.")
+            version = replies[-1][0]
+            if self._prune_due():
+                self._prune(connection)
+        return version
+
+    def _prune(self, connection):
+        excess = connection.execute("ZCARD", self.sessions_key) - self.max_sessions
+        if excess <= 0:
+            return
+        evicted = [session_id.decode("utf-8") for session_id in connection.execute("ZRANGE", self.sessions_key, 0, excess - 1)]
+        if evicted:
+            connection.pipeline([("DEL", *[self._key(session_id) for session_id in evicted]), ("ZREM", self.sessions_key, *evicted)])
+            for session_id in evicted:
+                logger.info(f"Deleted old history for session {session_id}")
+
+    def versions(self, session_ids: list) -> dict:
+        replies = self.client.pipeline([("LLEN", self._key(session_id)) for session_id in session_ids])
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return dict(zip(session_ids, replies))
+
+    def load_many(self, session_ids: list) -> dict:
+        replies = self.client.pipeline([("LRANGE", self._key(session_id), 0, -1) for session_id in session_ids])
+        loaded = {}
+        for session_id, reply in zip(session_ids, replies):
+            if isinstance(reply, RespError):
+                raise reply
+            records = [json.loads(item) for item in reply or []]
+            loaded[session_id] = (records, len(records))
+        return loaded
+
+    def delete(self, session_id: str):
+        self.client.pipeline([("DEL", self._key(session_id)), ("ZREM", self.sessions_key, session_id)])
+
+    def increment(self, name: str) -> int:
+        return self.client.execute("INCR", f"{self.prefix}counter:{name}")
+
+    def counters(self, names: list) -> dict:
+        values = self.client.execute("MGET", *[f"{self.prefix}counter:{name}" for name in names])
+        return {name: int(value) if value is not None else 0 for name, value in zip(names, values)}
+
+    def put_state(self, key: str, value: dict):
+        self.client.execute(
+            "SET", f"{self.prefix}state:{key}", json.dumps(value, ensure_ascii=False, default=str), "EX", self.state_ttl
+        )
+
+    def get_state(self, key: str):
+        value = self.client.execute("GET", f"{self.prefix}state:{key}")
+        return json.loads(value) if value is not None else None
+
+
+def create_backend(name: str) -> HistoryBackend:
+    """History backend named by settings.HISTORY_BACKEND ("sqlite" or "redis")."""
+    if name == "sqlite":
+        return SQLiteHistoryBackend(settings.HISTORY_DB_PATH, settings.HISTORY_SHARED_MAX_SESSIONS)
+    if name == "redis":
+        return RedisHistoryBackend(RespClient(settings.REDIS_URL), settings.HISTORY_REDIS_PREFIX, settings.HISTORY_SHARED_MAX_SESSIONS)
+    raise ValueError(f"Unknown history backend {name!r}, use 'file', 'sqlite' or 'redis'.")
@@ -1,48 +1,231 @@
 import os
 import json
+import time
+import queue
+import atexit
+import threading
+from collections import OrderedDict
 from config.settings import settings
 from utils.logger import logger
+from utils.metrics import span
+from utils.history_backends import create_backend, HistoryConflict
 
 # History directory
 HISTORY_DIR =settings.HISTORY_DIR
 os.makedirs(HISTORY_DIR, exist_ok=True)
 
 # Maximum number of sessions to keep
-MAX_SESSIONS = 10
+MAX_SESSIONS = settings.MAX_SESSIONS
+
+# Pending writes, consumed by a single background writer thread
+_write_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+# session_id -> turns queued and not yet written, so a read waits for its own session only
+_pending = {}
+_pending_changed = threading.Condition()
+
+# In-memory index: session_id -> last write time, least recently written first
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+# SQLite or Redis backend when HISTORY_BACKEND is not "file"
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_backend():
+    """
+    The history backend shared by every worker (settings.HISTORY_BACKEND "sqlite" or "redis"),
+    or None when histories are per-process JSON Lines files.
+    """
+    global _shared
+    if settings.HISTORY_BACKEND == "file":
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = create_backend(settings.HISTORY_BACKEND)
+            logger.info(f"Using the {settings.HISTORY_BACKEND} history backend.")
+        return _shared
 
 
 def _get_history_file(session_id: str) -> str:
-    """Return path to session history file."""
+    """Return path to session history file (one JSON record per line)."""
+    return os.path.join(HISTORY_DIR, f"{session_id}.jsonl")
+
+
+def _get_legacy_history_file(session_id: str) -> str:
+    """Return path to a session history file in the old single-JSON-array format."""
     return os.path.join(HISTORY_DIR, f"{session_id}.json")
 
 
-def save_history(session_id: str, question: str, answer: str):
+def _build_index():
+    """Scan the history directory once at startup to seed the session index."""
+    entries = []
+    for name in os.listdir(HISTORY_DIR):
+        session_id, ext = os.path.splitext(name)
+        if ext in (".jsonl", ".json"):
+            entries.append((os.path.getmtime(os.path.join(HISTORY_DIR, name)), session_id))
+    for mtime, session_id in sorted(entries):
+        _sessions[session_id] = mtime
+
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_loop, name="history-writer", daemon=True)
+            _writer.start()
+
+
+def _write_loop():
     """
-    Append a new Q/A turn to the session history file.
-    If sessions exceed MAX_SESSIONS, delete oldest.
+    Append queued records to their session files. Everything queued at the time is
+    written as one batch, with a single fsync per session file touched.
     """
-    history_file = _get_history_file(session_id)
-    record = []
+    while True:
+        batch = [_write_queue.get()]
+        while len(batch) < settings.HISTORY_WRITE_BATCH:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
 
-    if os.path.exists(history_file):
+        by_session, turns = OrderedDict(), {}
+        for session_id, records in batch:
+            by_session.setdefault(session_id, []).extend(records)
+            turns[session_id] = turns.get(session_id, 0) + 1
         try:
-            with open(history_file, "r", encoding="utf-8") as f:
-                record = json.load(f)
-                logger.info(f"Loaded existing history for session {session_id}, {len(record)//2} turns.")
-        except Exception:
-            record = []
-            logger.info("starting new session history due to error loading existing file.")
+            with span("history_write"):
+                for session_id, records in by_session.items():
+                    try:
+                        _append(session_id, records)
+                    finally:
+                        _written(session_id, turns.pop(session_id))
+                _enforce_session_limit()
+        except Exception as e:
+            logger.error(f"Error writing history batch: {e}", exc_info=True)
+        finally:
+            # sessions a failed batch did not reach
+            for session_id, count in turns.items():
+                _written(session_id, count)
+            for _ in batch:
+                _write_queue.task_done()
+
+
+def _written(session_id: str, turns: int):
+    """Count `turns` of a session as written (or given up on) and wake the readers waiting for it."""
+    with _pending_changed:
+        left = _pending.get(session_id, 0) - turns
+        if left > 0:
+            _pending[session_id] = left
+        else:
+            _pending.pop(session_id, None)
+        _pending_changed.notify_all()
+
+
+def _append(session_id: str, records: list):
+    history_file = _get_history_file(session_id)
+    legacy_file = _get_legacy_history_file(session_id)
+    if os.path.exists(legacy_file) and not os.path.exists(history_file):
+        # migrate the old JSON array once, then only append
+        records = _read_legacy(legacy_file) + records
+
+    with open(history_file, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    if os.path.exists(legacy_file):
+        os.remove(legacy_file)
+
+
+def _read_legacy(legacy_file: str) -> list:
+    try:
+        with open(legacy_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        logger.info("starting new session history due to error loading existing file.")
+        return []
+
 
-    # Append new Q/A
-    record.append({"role": "human", "content": question})
-    record.append({"role": "ai", "content": answer})
+def save_history(session_id: str, question: str, answer: str, expected_version: int = None):
+    """
+    Append a new Q/A turn to the session history.
+    With the file backend the write happens on a background thread; the call only queues it
+    and returns None. With a shared backend the turn is written before returning the session's
+    new version; if `expected_version` is given and another worker has appended to the
+    session since, nothing is written and HistoryConflict is raised.
+    If sessions exceed MAX_SESSIONS (HISTORY_SHARED_MAX_SESSIONS with a shared backend),
+    the least recently written are deleted.
+    """
+    records = [
+        {"role": "human", "content": question},
+        {"role": "ai", "content": answer},
+    ]
+    backend = shared_backend()
+    if backend is not None:
+        with span("history_write"):
+            version = backend.append(session_id, records, expected_version)
+        logger.info(f"Saved history turn for session {session_id} (version {version}).")
+        return version
+
+    _ensure_writer()
+    with _sessions_lock:
+        _sessions.pop(session_id, None)
+        _sessions[session_id] = time.time()
+    with _pending_changed:
+        _pending[session_id] = _pending.get(session_id, 0) + 1
+    _write_queue.put((session_id, records))
+    logger.info(f"Queued history turn for session {session_id}.")
+
+
+def pending_writes() -> int:
+    """Number of history turns queued and not yet written."""
+    return _write_queue.unfinished_tasks
+
+
+def flush():
+    """
+    Block until every queued history write has reached disk.
+    """
+    if _writer is not None:
+        _write_queue.join()
+
+
+def flush_session(session_id: str):
+    """
+    Block until the queued history writes of one session have reached disk, without
+    waiting for the other sessions' writes.
+    """
+    with _pending_changed:
+        _pending_changed.wait_for(lambda: session_id not in _pending)
+
+
+def session_version(session_id: str):
+    """
+    Version (record count) of a session in the shared backend, to detect turns written by
+    other workers; None with the file backend, which only this process writes.
+    Concurrent calls are batched into one backend read.
+    """
+    backend = shared_backend()
+    return None if backend is None else backend.version(session_id)
 
-    with open(history_file, "w", encoding="utf-8") as f:
-        json.dump(record, f, indent=2, ensure_ascii=False)
-        logger.info(f"Saved history for session {session_id}, total {len(record)//2} turns.")   
 
-    # Enforce session limit
-    _enforce_session_limit()
+def load_session(session_id: str):
+    """
+    Load a session's history and its version, as (list of dicts, version).
+    The version is None with the file backend.
+    """
+    backend = shared_backend()
+    if backend is None:
+        return load_history(session_id), None
+    records, version = backend.load(session_id)
+    if records:
+        logger.info(f"Loaded history for session {session_id}")
+    return records, version
 
 
 def load_history(session_id: str):
@@ -50,41 +233,68 @@ def load_history(session_id: str):
     Load a session's history as a list of dicts.
     Returns [] if no history exists.
     """
+    backend = shared_backend()
+    if backend is not None:
+        return load_session(session_id)[0]
+
+    flush_session(session_id)
     history_file = _get_history_file(session_id)
     if not os.path.exists(history_file):
+        legacy_file = _get_legacy_history_file(session_id)
+        if os.path.exists(legacy_file):
+            logger.info(f"Loaded history for session {session_id}")
+            return _read_legacy(legacy_file)
         return []
 
+    record = []
     try:
         with open(history_file, "r", encoding="utf-8") as f:
-            logger.info(f"Loaded history for session {session_id}")
-            return json.load(f)
+            for line in f:
+                line = line.strip()
+                if line:
+                    record.append(json.loads(line))
+        logger.info(f"Loaded history for session {session_id}")
     except Exception:
-        return []
+        # a torn last line (crash mid-write) only loses that line
+        logger.warning(f"Stopped reading history for session {session_id} at a corrupt line.")
+    return record
 
 
 def delete_history(session_id: str):
     """
     Delete a session's history file.
     """
-    history_file = _get_history_file(session_id)
-    if os.path.exists(history_file):
-        os.remove(history_file)
-        logger.info(f"Deleted history for session {session_id}.")
+    backend = shared_backend()
+    if backend is not None:
+        backend.delete(session_id)
+        return
+    flush_session(session_id)
+    with _sessions_lock:
+        _sessions.pop(session_id, None)
+    _delete_files(session_id)
+
+
+def _delete_files(session_id: str):
+    for history_file in (_get_history_file(session_id), _get_legacy_history_file(session_id)):
+        if os.path.exists(history_file):
+            os.remove(history_file)
+            logger.info(f"Deleted history for session {session_id}.")
 
 
 def _enforce_session_limit():
     """
-    Keep only the last MAX_SESSIONS history files.
-    Deletes oldest by file modified time.
+    Keep only the last MAX_SESSIONS sessions, using the in-memory index
+    instead of listing the history directory.
     """
-    files = [os.path.join(HISTORY_DIR, f) for f in os.listdir(HISTORY_DIR) if f.endswith(".json")]
-    if len(files) <= MAX_SESSIONS:
-        return
+    evicted = []
+    with _sessions_lock:
+        while len(_sessions) > MAX_SESSIONS:
+            session_id, _ = _sessions.popitem(last=False)
+            evicted.append(session_id)
+    for session_id in evicted:
+        _delete_files(session_id)
+        logger.info(f"Deleted old history for session {session_id}")
 
-    # Sort by modification time (oldest first)
-    files.sort(key=os.path.getmtime)
 
-    # Delete oldest until limit is satisfied
-    for f in files[:-MAX_SESSIONS]:
-        os.remove(f)
-        logger.info(f"Deleted old history file: {f}")
+_build_index()
+atexit.register(flush)
@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from config.settings import settings
+from utils.logger import logger
+
+# Manifest directory: one file per ingested document listing its chunk ids.
+# The default namespace uses the directory itself, other namespaces a subdirectory each.
+MANIFEST_DIR = settings.MANIFEST_DIR
+os.makedirs(MANIFEST_DIR, exist_ok=True)
+
+
+def _get_manifest_dir(namespace: str = "") -> str:
+    return os.path.join(MANIFEST_DIR, namespace) if namespace else MANIFEST_DIR
+
+
+def _get_manifest_file(source: str, namespace: str = "") -> str:
+    """Return path to the manifest file of a document source."""
+    name = hashlib.sha1(source.encode("utf-8")).hexdigest()
+    return os.path.join(_get_manifest_dir(namespace), f"{name}.json")
+
+
+def chunk_ids(source: str, chunks, seen: dict = None, namespace: str = "") -> list:
+    """
+    Deterministic ids for a document's chunks, derived from the namespace, the source and the
+    chunk text, so the same document indexed in two namespaces never shares ids.
+    Repeated identical chunks get an occurrence counter so their ids stay distinct; pass the
+    same `seen` dict when a document's chunks are processed in several batches.
+    """
+    ids = []
+    seen = {} if seen is None else seen
+    # ids in the default namespace are unchanged from before namespaces existed
+    prefix = f"{namespace}\x00" if namespace else ""
+    for chunk in chunks:
+        digest = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        key = f"{prefix}{source}\x00{digest}\x00{occurrence}"
+        ids.append(hashlib.sha256(key.encode("utf-8")).hexdigest()[:32])
+    return ids
+
+
+def load_manifest(source: str, namespace: str = "") -> list:
+    """
+    Load the chunk ids indexed for a document in a namespace.
+    Returns [] if the document was never indexed there.
+    """
+    manifest_file = _get_manifest_file(source, namespace)
+    if not os.path.exists(manifest_file):
+        return []
+
+    try:
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            return json.load(f)["chunk_ids"]
+    except Exception:
+        logger.warning(f"Could not read manifest for {source}, treating it as not indexed.")
+        return []
+
+
+def save_manifest(source: str, ids: list, namespace: str = ""):
+    """
+    Record the chunk ids currently indexed for a document in a namespace.
+    """
+    manifest_file = _get_manifest_file(source, namespace)
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    tmp = manifest_file + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"source": source, "updated_at": time.time(), "chunk_ids": ids}, f, ensure_ascii=False)
+    os.replace(tmp, manifest_file)
+    logger.info(f"Saved manifest for {source}, {len(ids)} chunks.")
+
+
+def delete_manifest(source: str, namespace: str = ""):
+    """
+    Delete a document's manifest.
+    """
+    manifest_file = _get_manifest_file(source, namespace)
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+        logger.info(f"Deleted manifest for {source}.")
+
+
+def delete_namespace(namespace: str):
+    """
+    Delete the manifests of every document in a namespace.
+    """
+    manifest_dir = _get_manifest_dir(namespace)
+    if not namespace:
+        for name in os.listdir(manifest_dir):
+            if name.endswith(".json"):
+                os.remove(os.path.join(manifest_dir, name))
+    elif os.path.isdir(manifest_dir):
+        shutil.rmtree(manifest_dir)
+    logger.info(f"Deleted manifests of namespace {namespace!r}.")
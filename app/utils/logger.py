@@ -1,35 +1,72 @@
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import atexit
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from config.settings import settings
+from utils.metrics import metrics
+
+_dropped = metrics.counter("log_records_dropped_total", "Log records dropped because the log queue was full.")
 
 def logger_setup():
-    
+
     # create logger
     logger = logging.getLogger(settings.APP_NAME)
     logger.setLevel(settings.LOG_LEVEL)
 
     # log file path
     log_path = os.path.join(settings.LOGS_DIR, settings.LOG_FILE)
-    
+
     # Create formatter
     formatter = logging.Formatter(settings.LOG_FORMAT)
-    
+
     # file handler
     file_handler = RotatingFileHandler(
         log_path, maxBytes=10*1024*1024, backupCount=5
     )
-    
+
     file_handler.setFormatter(formatter)
-    
+
     #console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    
+
+    # the calling thread only merges the message with its arguments (QueueHandler.prepare) and
+    # queues the record; the line format, file and console I/O happen on the listener's thread,
+    # so logging never waits on I/O in a request or the event loop
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
     # add handlers to logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+    logger.addHandler(_DroppingQueueHandler(log_queue))
+
     return logger
 
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped.inc()
+
+
+def payload(text) -> str:
+    """
+    Render user content (questions, answers, document snippets) for a log line,
+    according to settings.LOG_PAYLOADS: "full", "truncated" (first LOG_PAYLOAD_CHARS
+    characters) or "off" (only the length).
+    """
+    text = str(text)
+    if settings.LOG_PAYLOADS == "full":
+        return text
+    if settings.LOG_PAYLOADS == "truncated" and len(text) <= settings.LOG_PAYLOAD_CHARS:
+        return text
+    if settings.LOG_PAYLOADS == "truncated":
+        return f"{text[:settings.LOG_PAYLOAD_CHARS]}... [{len(text)} chars]"
+    return f"[{len(text)} chars]"
+
 logger = logger_setup()
\ No newline at end of file
@@ -0,0 +1,46 @@
+import re
+from config.settings import settings
+
+_NAMESPACE_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def resolve_namespace(namespace: str = None) -> str:
+    """
+    Validate a namespace name, falling back to settings.DEFAULT_NAMESPACE when none is given.
+    "" is the default namespace (Pinecone's default namespace, and where documents indexed
+    before namespaces existed live).
+    Raises:
+        ValueError: If the name is not 1-64 letters, digits, '-' or '_'.
+    """
+    if namespace is None:
+        namespace = settings.DEFAULT_NAMESPACE
+    if namespace and not _NAMESPACE_PATTERN.fullmatch(namespace):
+        raise ValueError("Namespace names are 1-64 letters, digits, '-' or '_'.")
+    return namespace
+
+
+def filter_values(condition) -> list:
+    """
+    Values a filter condition accepts: [value] for value and {"$eq": value}, the list of {"$in": [values]}.
+    Raises:
+        ValueError: For any other operator.
+    """
+    if isinstance(condition, dict):
+        if "$eq" in condition:
+            return [condition["$eq"]]
+        if "$in" in condition:
+            return list(condition["$in"])
+        raise ValueError(f"Unsupported filter operator in {condition}, use $eq or $in.")
+    return [condition]
+
+
+def _condition_matches(value, condition) -> bool:
+    return value in filter_values(condition)
+
+
+def matches_filter(metadata: dict, metadata_filter: dict) -> bool:
+    """
+    Whether chunk metadata satisfies a filter: every key must equal the given value,
+    or match {"$eq": value} / {"$in": [values]} (the subset of Pinecone filters both backends support).
+    """
+    return all(_condition_matches(metadata.get(key), condition) for key, condition in (metadata_filter or {}).items())
@@ -0,0 +1,149 @@
+import ssl
+import queue
+import select
+import socket
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+class RespError(Exception):
+    """Error reply from the server (e.g. a wrong command or type)."""
+
+
+def _encode(*args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+class RespConnection:
+    """One connection speaking RESP2, the Redis protocol. Replies are returned as bytes, ints, lists or None."""
+    def __init__(self, host: str, port: int, timeout: float = 5.0, tls: bool = False):
+        sock = socket.create_connection((host, port), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host) if tls else sock
+        self.reader = self.sock.makefile("rb")
+
+    def is_stale(self) -> bool:
+        """
+        Whether an idle connection can no longer be used: the server closed it (e.g. its idle
+        timeout or a restart), or it holds unread data, which an idle connection never should.
+        """
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the server.")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            return RespError(rest.decode("utf-8", errors="replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply: {line!r}")
+
+    def pipeline(self, commands: list) -> list:
+        """Send several commands in one write and read their replies; error replies are returned, not raised."""
+        self.sock.sendall(b"".join(_encode(*command) for command in commands))
+        return [self._read() for _ in commands]
+
+    def execute(self, *args):
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RespClient:
+    """
+    Minimal thread-safe Redis client: a pool of RESP2 connections to the server of a
+    redis://[:password@]host[:port][/db] URL (rediss:// for TLS). Enough for the commands the
+    history store uses, without a client library dependency.
+    Pooled connections that the server closed while idle are replaced before use; a connection
+    that fails during a command is closed and the error raised, since the command may have run.
+    """
+    def __init__(self, url: str, max_connections: int = 16, timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.tls = parsed.scheme == "rediss"
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def _connect(self) -> RespConnection:
+        connection = RespConnection(self.host, self.port, self.timeout, tls=self.tls)
+        if self.password:
+            connection.execute("AUTH", self.password)
+        if self.db:
+            connection.execute("SELECT", self.db)
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection (e.g. for WATCH/MULTI/EXEC, which must use a single connection)."""
+        with self._slots:
+            connection = None
+            while connection is None:
+                try:
+                    connection = self._idle.get_nowait()
+                except queue.Empty:
+                    connection = self._connect()
+                    break
+                if connection.is_stale():
+                    connection.close()
+                    connection = None
+            try:
+                yield connection
+            except RespError:
+                # the error reply was read in full, the connection is still usable
+                self._idle.put(connection)
+                raise
+            except BaseException:
+                # the connection may hold a half-finished transaction or unread replies
+                connection.close()
+                raise
+            else:
+                self._idle.put(connection)
+
+    def execute(self, *args):
+        with self.connection() as connection:
+            return connection.execute(*args)
+
+    def pipeline(self, commands: list) -> list:
+        with self.connection() as connection:
+            return connection.pipeline(commands)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,17 @@
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local estimate of the number of LLM tokens in `text` (about 4 characters per token).
+    Used for budgeting prompts without a round trip to the model's token counting API.
+    """
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` so that its estimate_tokens stays within `max_tokens`, on a word boundary when possible."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max(0, max_tokens) * 4]
+    space = cut.rfind(" ")
+    return cut[:space] if space > 0 else cut